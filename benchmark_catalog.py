@@ -0,0 +1,174 @@
+import argparse
+import gc
+import heapq
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+
+from catalog_snapshot import read_snapshot, write_snapshot
+from catalog_sync import CatalogState
+from columnar_catalog import ColumnarCatalog
+from query_engine import QueryEngine
+from units import parse_unit
+
+CATEGORIES = ["Dairy", "Vegetables", "Fruits", "Grains", "Bakery", "Pulses", "Beverages", "Snacks",
+              "Spices", "Oils", "Personal Care", "Household"]
+UNITS = ["1 kg bag", "500 g", "200 gm", "1 liter", "500 ml", "12 count", "1 dozen", "1 packet", "250 g",
+         "2 kg bag", "1 count", "100 ml"]
+
+
+def synthetic_rows(count, seed=42):
+    """Rows shaped like fetch_grocery_items() output, with Decimal prices as in the original loader."""
+    rng = random.Random(seed)
+    for item_id in range(1, count + 1):
+        yield {
+            "id": item_id,
+            "name": f"Item {item_id:07d}",
+            "price": Decimal(rng.randrange(500, 100000)) / 100,
+            "category": rng.choice(CATEGORIES),
+            "unit": rng.choice(UNITS),
+            "currency": "INR",
+        }
+
+
+def measure(build):
+    """Build a structure and return (structure, seconds, bytes allocated and still held)."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    structure = build()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return structure, elapsed, current
+
+
+def time_per_call(func, args_list):
+    """Mean seconds per call over args_list."""
+    start = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - start) / len(args_list)
+
+
+def run_benchmark(count=1_000_000, lookups=100_000):
+    """
+    Compare the list-of-dicts catalog with ColumnarCatalog on a synthetic catalog:
+    build time, memory, name lookups, price-per-base-unit access, category scans
+    and the QueryEngine's top-k and range lookups.
+    Build times are measured with tracemalloc running, so they are inflated for both.
+    """
+    print(f"Synthetic catalog: {count:,} items, {len(CATEGORIES)} categories, {len(UNITS)} unit strings\n")
+
+    rows, dict_build, dict_bytes = measure(lambda: list(synthetic_rows(count)))
+    lookup, _, lookup_bytes = measure(lambda: {row["name"].lower(): row for row in rows})
+    # Built from the generator so the columnar side owns its strings as well
+    columns, columnar_build, columnar_bytes = measure(lambda: ColumnarCatalog(synthetic_rows(count)))
+
+    rng = random.Random(7)
+    names = [(f"item {rng.randrange(1, count + 1):07d}",) for _ in range(lookups)]
+    row_numbers = [(rng.randrange(count),) for _ in range(lookups)]
+
+    def dict_unit_price(row):
+        # What every comparison had to do before: re-parse the unit string
+        item = rows[row]
+        parsed = parse_unit(item["unit"])
+        return (item["price"] / parsed[0], parsed[1]) if parsed else None
+
+    def columnar_unit_price(row):
+        return columns.unit_prices[row], columns.base_unit(row)
+
+    time_per_call(lookup.get, names)  # warm-up
+    dict_lookup = time_per_call(lookup.get, names) * 1e6
+    results = [
+        ("build (s)", dict_build, columnar_build),
+        ("memory (MB)", (dict_bytes + lookup_bytes) / 1e6, columnar_bytes / 1e6),
+        ("bytes/item", (dict_bytes + lookup_bytes) / count, columnar_bytes / count),
+        ("name lookup (µs)", dict_lookup, time_per_call(columns.row_of, names) * 1e6),
+        ("lookup + record (µs)", dict_lookup, time_per_call(columns.find, names) * 1e6),
+        ("price per base unit (µs)", time_per_call(dict_unit_price, row_numbers) * 1e6,
+         time_per_call(columnar_unit_price, row_numbers) * 1e6),
+    ]
+
+    scan_timings = ([], [])
+    for category in CATEGORIES[:3]:
+        start = time.perf_counter()
+        [row for row in rows if row["category"] == category]
+        scan_timings[0].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        columns.rows_in_category(category)
+        scan_timings[1].append(time.perf_counter() - start)
+    results.append(("category scan (ms)", statistics.mean(scan_timings[0]) * 1000,
+                    statistics.mean(scan_timings[1]) * 1000))
+
+    # Index-backed queries against a linear scan of the dicts
+    engine, engine_build, _ = measure(lambda: QueryEngine(columns, {}))
+    results.append(("engine index build (s)", 0.0, engine_build))
+    start = time.perf_counter()
+    by_weight = ((row, parse_unit(row["unit"])) for row in rows)
+    heapq.nsmallest(10, (pair for pair in by_weight if pair[1] and pair[1][1] == "g"),
+                    key=lambda pair: pair[0]["price"] / pair[1][0])
+    scan_top_k = time.perf_counter() - start
+    results.append(("top-10 per kg (ms)", scan_top_k * 1000,
+                    time_per_call(engine.ranked, [(10, True, None, "g")] * 1000) * 1000))
+    start = time.perf_counter()
+    [row for row in rows if 100 <= row["price"] <= 101]
+    scan_range = time.perf_counter() - start
+    results.append(("price range ₹100-101 (ms)", scan_range * 1000,
+                    time_per_call(engine.in_price_range, [(100, 101)] * 100) * 1000))
+
+    print(f"{'Metric':<26} {'list of dicts':>14} {'columnar':>12}")
+    print("-" * 54)
+    for metric, dict_value, columnar_value in results:
+        print(f"{metric:<26} {dict_value:>14,.2f} {columnar_value:>12,.2f}")
+    print(f"\nColumnar memory is {(dict_bytes + lookup_bytes) / columnar_bytes:.1f}x smaller")
+    return results
+
+
+def run_snapshot_benchmark(count=100_000, lookups=100_000):
+    """
+    Startup from rows (what create_app does after load_all_grocery_items) against
+    startup from a mapped snapshot of the same catalog, and name index lookups in
+    the built dictionary against the bisected mapped keys.
+    """
+    rows = list(synthetic_rows(count))
+    start = time.perf_counter()
+    state = CatalogState(rows)
+    built = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.snapshot")
+        start = time.perf_counter()
+        size = write_snapshot(path, state, watermark=0.0)
+        written = time.perf_counter() - start
+        start = time.perf_counter()
+        snapshot = read_snapshot(path)
+        mapped = time.perf_counter() - start
+        mapped_state = CatalogState.from_snapshot(snapshot)
+        loaded = time.perf_counter() - start
+
+        rng = random.Random(7)
+        keys = [(f"item {rng.randrange(1, count + 1):07d}",) for _ in range(lookups)]
+        dict_lookup = time_per_call(state.name_index.get, keys) * 1e6
+        mapped_lookup = time_per_call(mapped_state.name_index.get, keys) * 1e6
+
+    print(f"\nSnapshot of {count:,} items: {size / 1e6:.1f} MB, written in {written:.2f} s")
+    print(f"{'CatalogState from rows (s)':<34} {built:>8.2f}")
+    print(f"{'map snapshot (s)':<34} {mapped:>8.2f}")
+    print(f"{'CatalogState from snapshot (s)':<34} {loaded:>8.2f}")
+    print(f"{'name index lookup (µs)':<34} {dict_lookup:>8.2f} dict, {mapped_lookup:.2f} mapped")
+    return built, loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the columnar catalog against a list of dicts")
+    parser.add_argument("--items", type=int, default=1_000_000, help="Synthetic catalog size")
+    parser.add_argument("--lookups", type=int, default=100_000, help="Lookups timed per access pattern")
+    parser.add_argument("--snapshot", action="store_true", help="Also time startup from a mapped catalog snapshot")
+    args = parser.parse_args()
+    run_benchmark(count=args.items, lookups=args.lookups)
+    if args.snapshot:
+        run_snapshot_benchmark(count=args.items, lookups=args.lookups)
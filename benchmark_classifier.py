@@ -0,0 +1,90 @@
+import argparse
+import statistics
+import time
+
+from langchain_ollama import ChatOllama
+
+from chains import build_query_classifier_chain
+from config import OLLAMA_BASE_URL, MODEL_NAME, OLLAMA_KEEP_ALIVE, CLASSIFIER_CONFIDENCE_THRESHOLD
+from main import load_all_grocery_items
+from query_classifier import LocalQueryClassifier
+from retrieval import CatalogRetriever
+from testSystem import TEST_PROMPTS
+
+
+def time_call(func, *args):
+    """Run func and return (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(repeat=1000, use_llm=True):
+    """
+    Compare the local query classifier with the LLM classifier chain on the
+    testSystem.py prompts: latency per classification and label agreement.
+    """
+    grocery_items = load_all_grocery_items()
+    item_lookup = {item['name'].lower(): item for item in grocery_items}
+    local_classifier = LocalQueryClassifier(item_lookup)
+    llm_classifier_chain = None
+    if use_llm:
+        llm = ChatOllama(base_url=OLLAMA_BASE_URL, model=MODEL_NAME, temperature=0, keep_alive=OLLAMA_KEEP_ALIVE)
+        llm_classifier_chain = build_query_classifier_chain(llm)
+        prefix_catalog = CatalogRetriever(grocery_items).prefix_catalog
+
+    local_timings = []
+    llm_timings = []
+    rows = []
+    for prompt in TEST_PROMPTS:
+        # Warm-up once, then time repeated local classifications
+        classification = local_classifier.classify(prompt)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            local_classifier.classify(prompt)
+        local_timings.append((time.perf_counter() - start) / repeat)
+
+        llm_type = None
+        if llm_classifier_chain is not None:
+            try:
+                result, elapsed = time_call(llm_classifier_chain.invoke,
+                                           {"catalog": prefix_catalog, "question": prompt})
+                llm_type = result.get("type", "unknown")
+                llm_timings.append(elapsed)
+            except Exception as e:
+                print(f"LLM classification failed for '{prompt}': {str(e)}")
+        rows.append((prompt, classification, llm_type))
+
+    print(f"\n{'Local type':<18} {'Conf':>5} {'LLM type':<18} {'Agree':<5} Prompt")
+    print("-" * 100)
+    for prompt, classification, llm_type in rows:
+        agree = "" if llm_type is None else ("yes" if llm_type == classification.type else "NO")
+        print(f"{classification.type:<18} {classification.confidence:>5.2f} {str(llm_type or '-'):<18} {agree:<5} {prompt}")
+
+    confident = [row for row in rows if row[1].confidence >= CLASSIFIER_CONFIDENCE_THRESHOLD]
+    print("\nLocal classifier")
+    print(f"  mean latency: {statistics.mean(local_timings) * 1e6:.1f} µs")
+    print(f"  max latency:  {max(local_timings) * 1e6:.1f} µs")
+    print(f"  confident (>= {CLASSIFIER_CONFIDENCE_THRESHOLD}): {len(confident)}/{len(rows)} prompts skip the LLM")
+
+    compared = [row for row in rows if row[2] is not None]
+    if compared:
+        agreed = sum(1 for row in compared if row[1].type == row[2])
+        confident_compared = [row for row in compared if row in confident]
+        confident_agreed = sum(1 for row in confident_compared if row[1].type == row[2])
+        print("\nLLM classifier")
+        print(f"  mean latency: {statistics.mean(llm_timings) * 1000:.0f} ms")
+        print(f"  agreement (all prompts): {agreed}/{len(compared)} ({agreed / len(compared):.0%})")
+        if confident_compared:
+            print(f"  agreement (confident prompts): {confident_agreed}/{len(confident_compared)}"
+                  f" ({confident_agreed / len(confident_compared):.0%})")
+        print(f"  speedup: {statistics.mean(llm_timings) / statistics.mean(local_timings):,.0f}x")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local query classifier against the LLM classifier")
+    parser.add_argument("--repeat", type=int, default=1000, help="Local classifications timed per prompt")
+    parser.add_argument("--no-llm", action="store_true", help="Only time the local classifier")
+    args = parser.parse_args()
+    run_benchmark(repeat=args.repeat, use_llm=not args.no_llm)
@@ -0,0 +1,84 @@
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+
+from config import OLLAMA_BASE_URL, MODEL_NAME
+
+# Questions that reach an LLM chain (price lookups and unclassified queries)
+LLM_PROMPTS = [
+    "What is the price of milk?",
+    "How much does basmati rice cost?",
+    "What can I cook for dinner with ₹200?",
+    "What is the price of paneer?",
+    "Suggest a healthy breakfast from your store",
+    "How much is a dozen eggs?",
+]
+
+# (label, shared_prefix, warm_up): the per-question context layout without warm-up
+# reproduces the behaviour before prompts shared a prefix
+SCENARIOS = [
+    ("per-question context, cold", False, False),
+    ("shared prefix, cold", True, False),
+    ("shared prefix, warm-up", True, True),
+]
+
+
+def unload_model():
+    """Ask Ollama to unload the model so every scenario starts cold."""
+    request = urllib.request.Request(
+        f"{OLLAMA_BASE_URL}/api/generate",
+        data=json.dumps({"model": MODEL_NAME, "keep_alive": 0}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        urllib.request.urlopen(request, timeout=60).read()
+    except Exception as e:
+        print(f"Could not unload {MODEL_NAME}: {str(e)}")
+
+
+def first_token_latency(get_answer, question):
+    """Seconds until the first raw chunk (reasoning included) and until the answer is complete."""
+    start = time.perf_counter()
+    first = None
+    for _ in get_answer.stream(question, strip_think=False):
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def run_benchmark(prompts=LLM_PROMPTS):
+    """
+    Measure time to first token per query after a cold start, for the old
+    per-question prompt layout and for the shared prefix with and without warm-up.
+    """
+    from main import create_app
+
+    results = []
+    for label, shared_prefix, warm_up in SCENARIOS:
+        unload_model()
+        start = time.perf_counter()
+        get_answer = create_app(use_cache=False, warm_up=warm_up, shared_prefix=shared_prefix)
+        startup = time.perf_counter() - start
+        timings = [first_token_latency(get_answer, question) for question in prompts]
+        results.append((label, startup, timings))
+
+    print(f"\nModel: {MODEL_NAME}, {len(prompts)} queries per scenario\n")
+    print(f"{'Scenario':<28} {'Startup (s)':>12} {'First query TTFT (s)':>21} "
+          f"{'Later TTFT mean (s)':>20} {'Later TTFT max (s)':>19} {'Total (s)':>10}")
+    print("-" * 115)
+    for label, startup, timings in results:
+        first_tokens = [first for first, _ in timings]
+        later = first_tokens[1:] or first_tokens
+        total = sum(elapsed for _, elapsed in timings)
+        print(f"{label:<28} {startup:>12.2f} {first_tokens[0]:>21.2f} "
+              f"{statistics.mean(later):>20.2f} {max(later):>19.2f} {total:>10.2f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure first-token latency with and without the shared prompt prefix")
+    parser.add_argument("prompts", nargs="*", help="Questions to ask (defaults to a fixed LLM-bound set)")
+    args = parser.parse_args()
+    run_benchmark(args.prompts or LLM_PROMPTS)
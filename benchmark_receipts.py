@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+SAMPLE_RECEIPT = "receipt_20250320104412.md"
+
+
+def peak_rss_mb(who):
+    """Peak resident set size in MB of this process ("self") or its waited-for children."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_worker(renderer, repeat, output_format):
+    """Render the sample receipt repeat times in this process and print the measurements as JSON."""
+    from grocery_receipt import save_receipt
+
+    with open(SAMPLE_RECEIPT, encoding="utf-8") as f:
+        markdown_text = f.read()
+    baseline_rss = peak_rss_mb("self")
+
+    timings = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for n in range(repeat):
+            # A different receipt number each time so no layout cache is reused across receipts
+            text = markdown_text.replace("20250320104412", f"2025032010{n:04d}")
+            start = time.perf_counter()
+            path = save_receipt(text, os.path.join(temp_dir, f"receipt_{n}"), output_format, renderer)
+            timings.append(time.perf_counter() - start)
+            if not path:
+                break
+
+    print(json.dumps({
+        "renderer": renderer,
+        "timings": timings,
+        "ok": len(timings) == repeat and bool(path),
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": peak_rss_mb("self"),
+        "children_peak_rss_mb": peak_rss_mb("children"),
+    }))
+
+
+def measure(renderer, repeat, output_format):
+    """Run one renderer in a fresh interpreter so peak RSS is not shared between renderers."""
+    result = subprocess.run(
+        [sys.executable, __file__, "--worker", renderer, "--repeat", str(repeat), "--format", output_format],
+        capture_output=True, text=True,
+    )
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        print(f"{renderer} worker failed:\n{result.stderr[-2000:]}")
+        return None
+    return json.loads(lines[-1])
+
+
+def run_benchmark(repeat=10, output_format="png"):
+    """
+    Compare per-receipt latency and peak RSS of the native Pillow renderer with
+    the pandoc + xelatex + pdf2image pipeline on the sample receipt.
+    """
+    renderers = ["pillow"]
+    if output_format == "png" and shutil.which("pandoc"):
+        renderers.append("pandoc")
+    else:
+        print("pandoc not found (or format is not png): only the native renderer is measured")
+
+    results = [r for r in (measure(renderer, repeat, output_format) for renderer in renderers) if r]
+
+    print(f"\nSample: {SAMPLE_RECEIPT}, {repeat} receipts per renderer, format {output_format}\n")
+    print(f"{'Renderer':<10} {'First (ms)':>11} {'Mean (ms)':>10} {'p95 (ms)':>9} {'Peak RSS (MB)':>14} "
+          f"{'Render RSS (MB)':>16} {'Child RSS (MB)':>15}")
+    print("-" * 91)
+    for result in results:
+        timings = result["timings"]
+        warm = timings[1:] or timings
+        p95 = sorted(warm)[max(int(len(warm) * 0.95) - 1, 0)]
+        peak = result["peak_rss_mb"]
+        render = None if peak is None else peak - result["baseline_rss_mb"]
+        print(f"{result['renderer']:<10} {timings[0] * 1000:>11.1f} {statistics.mean(warm) * 1000:>10.1f} "
+              f"{p95 * 1000:>9.1f} {peak or 0:>14.1f} {render or 0:>16.1f} {result['children_peak_rss_mb'] or 0:>15.1f}"
+              f"{'' if result['ok'] else '  (failed)'}")
+    print("\nRender RSS is the growth of the Python process while rendering; child RSS is the largest"
+          " pandoc/xelatex/pdftoppm subprocess.")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the native receipt renderer against the pandoc pipeline")
+    parser.add_argument("--repeat", type=int, default=10, help="Receipts rendered per renderer")
+    parser.add_argument("--format", default="png", choices=("png", "pdf", "txt"), help="Output format")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args.worker, args.repeat, args.format)
+    else:
+        run_benchmark(args.repeat, args.format)
@@ -0,0 +1,124 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# Entry points a CLI invocation or the service starts from
+MODULES = ["config", "main", "grocery_receipt", "server"]
+
+# Dependencies that only LLM chains (and the database) need; importing an entry point must not pull them in
+HEAVY_MODULES = ["langchain", "langchain_core", "langchain_ollama", "pydantic", "psycopg2"]
+
+# Questions answered from the catalog alone (local parser and query engine), without any LLM call
+DETERMINISTIC_PROMPTS = [
+    "Calculate 2kg rice and 3 packets of bread",
+    "I want to buy 500ml cooking oil and 3.5L milk",
+    "Which is the cheapest produce item per kg?",
+    "Compare the prices of rice and atta per kg",
+]
+
+
+def import_time(module):
+    """
+    Import module in a fresh interpreter with -X importtime and return its
+    cumulative import time in ms and the heavy modules it pulled in.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    cumulative = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.startswith("import time: self"):
+            continue
+        _, micros, name = line.split("|")
+        imported.add(name.strip())
+        if name.rstrip() == f" {module}":
+            cumulative = int(micros) / 1000
+    return cumulative, sorted(name for name in HEAVY_MODULES if name in imported)
+
+
+def run_worker(prompts):
+    """Start the app on the sample catalog, answer prompts and print the timings as JSON."""
+    start = time.perf_counter()
+    from main import create_app
+    imported = time.perf_counter()
+    # db_setup imports psycopg2 for the loader itself; only the app's own imports are checked below
+    from db_setup import sample_catalog
+    grocery_items = sample_catalog()
+    created_start = time.perf_counter()
+    get_answer = create_app(use_cache=False, refresh_mode="off", warm_up=False, grocery_items=grocery_items)
+    created = time.perf_counter()
+    answers = []
+    for question in prompts:
+        question_start = time.perf_counter()
+        answer = get_answer(question)
+        answers.append({"question": question, "seconds": time.perf_counter() - question_start,
+                        "answer": answer[:60]})
+    print(json.dumps({
+        "import_seconds": imported - start,
+        "create_app_seconds": created - created_start,
+        "answers": answers,
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules and name != "psycopg2"],
+    }))
+
+
+def measure_startup(prompts):
+    """Run the startup scenario in a fresh interpreter."""
+    result = subprocess.run([sys.executable, __file__, "--worker", "--prompts", json.dumps(prompts)],
+                            capture_output=True, text=True)
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        print(f"Startup worker failed:\n{result.stderr[-2000:]}")
+        return None
+    return json.loads(lines[-1])
+
+
+def run_benchmark(modules=MODULES, repeat=5, budget_ms=250.0, prompts=DETERMINISTIC_PROMPTS):
+    """
+    Measure the import time of each entry point (median of repeat fresh
+    interpreters) and the startup of the app up to its first local answers.
+    Returns False when an import exceeds budget_ms, pulls in a heavy dependency,
+    or the deterministic answers import LangChain.
+    """
+    ok = True
+    print(f"{'Module':<18} {'Median (ms)':>12} {'Max (ms)':>10}  Heavy imports")
+    print("-" * 70)
+    for module in modules:
+        runs = [import_time(module) for _ in range(repeat)]
+        timings = [cumulative for cumulative, _ in runs]
+        heavy = runs[-1][1]
+        over = statistics.median(timings) > budget_ms
+        ok = ok and not over and not heavy
+        print(f"{module:<18} {statistics.median(timings):>12.1f} {max(timings):>10.1f}  {', '.join(heavy) or '-'}"
+              f"{'  (over budget)' if over else ''}")
+
+    startup = measure_startup(prompts)
+    if startup is None:
+        return False
+    print(f"\nimport main: {startup['import_seconds'] * 1000:.1f} ms, "
+          f"create_app: {startup['create_app_seconds'] * 1000:.1f} ms")
+    for answer in startup["answers"]:
+        print(f"  {answer['seconds'] * 1000:>8.1f} ms  {answer['question']}")
+    if startup["heavy_modules"]:
+        print(f"Answering from the catalog imported {', '.join(startup['heavy_modules'])}")
+        ok = False
+    print(f"\nImport budget {budget_ms:g} ms: {'ok' if ok else 'exceeded'}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import and startup time of the assistant's entry points")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--budget-ms", type=float, default=250, help="Largest median import time allowed per module")
+    parser.add_argument("--modules", default=",".join(MODULES), help="Comma-separated modules to import")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--prompts", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(json.loads(args.prompts) if args.prompts else DETERMINISTIC_PROMPTS)
+    else:
+        sys.exit(0 if run_benchmark(args.modules.split(","), args.repeat, args.budget_ms) else 1)
@@ -0,0 +1,345 @@
+import argparse
+import datetime
+import json
+import math
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import MODEL_NAME, MODEL_ROUTING, PIPELINE_MODE, MAX_CONCURRENCY
+from testSystem import TEST_CASES, check_answer
+
+REPORT_SCHEMA = 1
+BACKENDS = ("stub", "replay", "record", "ollama")
+STAGES = ("route", "first_token", "generate", "total")
+PERCENTILES = (50, 95, 99)
+
+# Latency differences smaller than this are noise, whatever the relative change
+LATENCY_FLOOR_SECONDS = 0.01
+
+
+class TokenCounter(BaseCallbackHandler):
+    """Counts LLM calls and the prompt/completion tokens Ollama reports for them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        with self._lock:
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    self.calls += 1
+                    self.prompt_tokens += usage.get("input_tokens", 0)
+                    self.completion_tokens += usage.get("output_tokens", 0)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(values):
+    """Mean and p50/p95/p99 of latencies in seconds."""
+    summary = {"mean": statistics.mean(values)}
+    for pct in PERCENTILES:
+        summary[f"p{pct}"] = percentile(values, pct)
+    return summary
+
+
+def git_commit():
+    """Short hash of HEAD, suffixed with +dirty when the tree has uncommitted changes."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True).stdout.strip()
+        return commit + ("+dirty" if dirty else "")
+    except Exception:
+        return None
+
+
+def run_case(get_answer, counter, question):
+    """
+    Answer one question the way get_answer.stream does, timing each stage:
+    route (parsing, classification, retrieval), first_token (start to first chunk),
+    generate (running the answer parts) and total.
+    """
+    counter.reset()
+    state = get_answer.catalog_sync.state
+    error = None
+    chunks = []
+    start = time.perf_counter()
+    first = routed = None
+    try:
+        parts = get_answer.plan_answer(question, state)
+        routed = time.perf_counter()
+        for part in parts:
+            for chunk in [part] if isinstance(part, str) else get_answer.chain(part[0]).stream(part[1]):
+                if first is None and chunk:
+                    first = time.perf_counter()
+                chunks.append(chunk)
+    except Exception as e:
+        error = str(e)
+    end = time.perf_counter()
+    routed = routed or end
+    return {
+        "answer": "".join(chunks),
+        "error": error,
+        "seconds": {
+            "route": routed - start,
+            "first_token": (first or end) - start,
+            "generate": end - routed,
+            "total": end - start,
+        },
+        "llm_calls": counter.calls,
+        "prompt_tokens": counter.prompt_tokens,
+        "completion_tokens": counter.completion_tokens,
+    }
+
+
+def run_suite(get_answer, counter, repeat=3, concurrency=MAX_CONCURRENCY):
+    """Run every test case repeat times, then once as a concurrent batch; return per-case runs and throughput."""
+    runs = {prompt: [] for prompt, _, _ in TEST_CASES}
+    for n in range(repeat):
+        for i, (prompt, query_type, expected) in enumerate(TEST_CASES, 1):
+            print(f"Run {n + 1}/{repeat}, prompt {i}/{len(TEST_CASES)}: {prompt}")
+            result = run_case(get_answer, counter, prompt)
+            result["missing"] = expected if result["error"] else check_answer(result["answer"], expected)
+            runs[prompt].append(result)
+
+    sequential_seconds = sum(run["seconds"]["total"] for results in runs.values() for run in results)
+    throughput = {"sequential_qps": repeat * len(TEST_CASES) / sequential_seconds}
+    if concurrency:
+        prompts = [prompt for prompt, _, _ in TEST_CASES]
+        start = time.perf_counter()
+        answers = get_answer.get_answers(prompts, max_concurrency=concurrency)
+        elapsed = time.perf_counter() - start
+        throughput.update({
+            "concurrency": concurrency,
+            "concurrent_qps": len(prompts) / elapsed,
+            "concurrent_errors": sum(1 for answer in answers if isinstance(answer, Exception)),
+        })
+    return runs, throughput
+
+
+def build_report(runs, throughput, backend, pipeline, repeat, server_stats=None, cascade_stats=None):
+    """Machine-readable report; its layout is stable so reports from different commits can be diffed."""
+    query_types = {prompt: query_type for prompt, query_type, _ in TEST_CASES}
+    cases = []
+    for prompt, results in runs.items():
+        failures = [result for result in results if result["missing"]]
+        cases.append({
+            "prompt": prompt,
+            "query_type": query_types[prompt],
+            "passed": not failures,
+            "missing": failures[0]["missing"] if failures else [],
+            "errors": sorted({result["error"] for result in results if result["error"]}),
+            "llm_calls": max(result["llm_calls"] for result in results),
+            "prompt_tokens": max(result["prompt_tokens"] for result in results),
+            "completion_tokens": max(result["completion_tokens"] for result in results),
+            "seconds": {stage: summarize([result["seconds"][stage] for result in results]) for stage in STAGES},
+            "answer": results[-1]["answer"],
+        })
+
+    all_runs = [result for results in runs.values() for result in results]
+    by_type = {}
+    for prompt, results in runs.items():
+        by_type.setdefault(query_types[prompt], []).extend(results)
+
+    return {
+        "schema": REPORT_SCHEMA,
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "backend": backend,
+        "model": MODEL_NAME,
+        "pipeline": pipeline,
+        "repeat": repeat,
+        "accuracy": {
+            "checked": len(cases),
+            "passed": sum(1 for case in cases if case["passed"]),
+            "failed": [case["prompt"] for case in cases if not case["passed"]],
+        },
+        "latency": {
+            "stages": {stage: summarize([run["seconds"][stage] for run in all_runs]) for stage in STAGES},
+            "query_types": {
+                query_type: {stage: summarize([run["seconds"][stage] for run in results]) for stage in STAGES}
+                for query_type, results in sorted(by_type.items())
+            },
+        },
+        "tokens": {
+            "llm_calls": sum(case["llm_calls"] for case in cases),
+            "prompt": sum(case["prompt_tokens"] for case in cases),
+            "completion": sum(case["completion_tokens"] for case in cases),
+            "query_types": {
+                query_type: {
+                    "llm_calls": sum(case["llm_calls"] for case in cases if case["query_type"] == query_type),
+                    "completion": sum(case["completion_tokens"] for case in cases if case["query_type"] == query_type),
+                }
+                for query_type in sorted(by_type)
+            },
+        },
+        "throughput": throughput,
+        "server": server_stats,
+        "cascade": cascade_stats,
+        "cases": cases,
+    }
+
+
+def compare_reports(report, baseline, tolerance=0.25):
+    """
+    Regressions of report against baseline: cases that passed and now fail,
+    p95 latency or prompt tokens per query type/case more than tolerance above
+    the baseline, and sequential throughput more than tolerance below it.
+    """
+    regressions = []
+    base_cases = {case["prompt"]: case for case in baseline.get("cases", [])}
+    for case in report["cases"]:
+        base = base_cases.get(case["prompt"])
+        if base is None:
+            continue
+        if base["passed"] and not case["passed"]:
+            regressions.append(f"accuracy: '{case['prompt']}' now fails (missing {', '.join(case['missing'])})")
+        for key in ("prompt_tokens", "completion_tokens", "llm_calls"):
+            if case[key] > base[key] * (1 + tolerance) and case[key] > base[key]:
+                regressions.append(f"{key}: '{case['prompt']}' {base[key]} -> {case[key]}")
+
+    base_types = baseline.get("latency", {}).get("query_types", {})
+    for query_type, stages in report["latency"]["query_types"].items():
+        for stage in ("first_token", "total"):
+            if query_type not in base_types:
+                continue
+            old, new = base_types[query_type][stage]["p95"], stages[stage]["p95"]
+            if new > old * (1 + tolerance) and new - old > LATENCY_FLOOR_SECONDS:
+                regressions.append(f"latency: {query_type} {stage} p95 {old * 1000:.1f}ms -> {new * 1000:.1f}ms")
+
+    old_qps = baseline.get("throughput", {}).get("sequential_qps")
+    new_qps = report["throughput"]["sequential_qps"]
+    if old_qps and new_qps < old_qps * (1 - tolerance):
+        regressions.append(f"throughput: {old_qps:.2f} -> {new_qps:.2f} queries/s")
+    return regressions
+
+
+def print_report(report):
+    accuracy = report["accuracy"]
+    print(f"\nCommit {report['commit']}, backend {report['backend']}, model {report['model']}, "
+          f"pipeline {report['pipeline']}, {report['repeat']} runs per prompt")
+    print(f"Expected answers: {accuracy['passed']}/{accuracy['checked']}")
+    for prompt in accuracy["failed"]:
+        print(f"  FAIL: {prompt}")
+
+    print(f"\n{'Query type':<15} {'Stage':<12} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    print("-" * 61)
+    rows = [("all", report["latency"]["stages"])] + list(report["latency"]["query_types"].items())
+    for query_type, stages in rows:
+        for stage in STAGES:
+            s = stages[stage]
+            print(f"{query_type:<15} {stage:<12} {s['p50'] * 1000:>10.1f} {s['p95'] * 1000:>10.1f} "
+                  f"{s['p99'] * 1000:>10.1f}")
+
+    tokens = report["tokens"]
+    throughput = report["throughput"]
+    print(f"\nLLM calls per pass: {tokens['llm_calls']}, prompt tokens: {tokens['prompt']}, "
+          f"completion tokens: {tokens['completion']}")
+    for query_type, counts in tokens.get("query_types", {}).items():
+        if counts["llm_calls"]:
+            print(f"  {query_type:<15} {counts['llm_calls']:>3} LLM calls, {counts['completion']:>6} completion tokens")
+    print(f"Throughput: {throughput['sequential_qps']:.2f} queries/s sequential", end="")
+    if "concurrent_qps" in throughput:
+        print(f", {throughput['concurrent_qps']:.2f} queries/s with {throughput['concurrency']} concurrent", end="")
+    print()
+
+    cascade = report.get("cascade")
+    if cascade:
+        total = cascade["total"]
+        print(f"\nCascade {cascade['small_model']} -> {cascade['large_model']}: {total['small_answers']} small, "
+              f"{total['large_answers']} escalated ({total['escalation_rate']:.0%})", end="")
+        if total["mean_seconds_saved"] is not None:
+            print(f", {total['mean_seconds_saved'] * 1000:.1f}ms saved per call", end="")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Latency, token and accuracy benchmark of the test prompts against Ollama or a local fake")
+    parser.add_argument("--backend", default="stub", choices=BACKENDS,
+                        help="stub/replay/record use fake_ollama.py; ollama talks to OLLAMA_BACKENDS (or OLLAMA_BASE_URL) directly")
+    parser.add_argument("--recording", help="JSONL recording written by --backend record and read by replay")
+    parser.add_argument("--pipeline", default=PIPELINE_MODE, help="two_stage or single_pass")
+    parser.add_argument("--model-routing", default=MODEL_ROUTING, help="single or cascade")
+    parser.add_argument("--catalog", default="sample", choices=("sample", "db"),
+                        help="db_setup's sample items (no database needed) or the live database")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per prompt")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="Questions at once in the throughput batch (0 skips it)")
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="Fake model load time")
+    parser.add_argument("--prefill-ms", type=float, default=0.0, help="Fake prefill time per prompt token")
+    parser.add_argument("--decode-ms", type=float, default=0.0, help="Fake time per generated token")
+    parser.add_argument("--output", default="benchmark_report.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", help="Earlier report to compare against; regressions exit with status 1")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative latency/token regression")
+    parser.add_argument("--min-accuracy", type=float, default=0.0, help="Fail below this fraction of passed checks")
+    args = parser.parse_args()
+
+    server = None
+    base_url = None  # OLLAMA_BACKENDS, else OLLAMA_BASE_URL
+    if args.backend != "ollama":
+        from fake_ollama import FakeOllamaServer
+        server = FakeOllamaServer(args.backend, args.recording, load_seconds=args.load_seconds,
+                                  prefill_seconds_per_token=args.prefill_ms / 1000,
+                                  decode_seconds_per_token=args.decode_ms / 1000).start()
+        base_url = server.base_url
+
+    grocery_items = None
+    if args.catalog == "sample":
+        from db_setup import sample_catalog
+        grocery_items = sample_catalog()
+
+    from main import create_app
+    counter = TokenCounter()
+    get_answer = create_app(pipeline=args.pipeline, use_cache=False, base_url=base_url, callbacks=[counter],
+                            grocery_items=grocery_items, model_routing=args.model_routing)
+    try:
+        runs, throughput = run_suite(get_answer, counter, args.repeat, args.concurrency)
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = build_report(runs, throughput, args.backend, args.pipeline, args.repeat,
+                          server.stats() if server is not None else None,
+                          get_answer.cascade_stats.snapshot() if get_answer.cascade_stats is not None else None)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print_report(report)
+    print(f"\nReport saved to {args.output}")
+
+    failed = False
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_reports(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        failed = bool(regressions)
+        if not regressions:
+            print(f"No regressions against {args.baseline}")
+    accuracy = report["accuracy"]
+    if accuracy["passed"] < args.min_accuracy * accuracy["checked"]:
+        print(f"FAIL: accuracy {accuracy['passed']}/{accuracy['checked']} is below {args.min_accuracy:.0%}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
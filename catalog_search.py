@@ -0,0 +1,252 @@
+"""
+Server-side item search for the Grocery Price Assistant
+
+With CATALOG_BACKEND="search" the catalog is never loaded as a whole, so it
+can be far larger than a process (or a prompt) could hold. For each question
+CatalogSearch instead:
+
+- splits it into candidate phrases: runs of up to _MAX_PHRASE_WORDS words
+  within one list entry that do not start or end with a stopword, number or
+  unit ("2kg basmati rice and dahi" -> "basmati", "basmati rice", "rice", "dahi");
+- answers the phrases it has seen recently from an LRU cache of hot items;
+- looks up the rest, together with the cheapest and most expensive items of
+  each category the question names, in one SQL round trip
+  (db.search_grocery_items): alias table entries and exact item names for
+  the phrase as typed and its synonym table entries, and pg_trgm similarity
+  on item names for phrases without an exact match;
+- for superlative and price range questions, reads in the same round trip
+  the cheapest and most expensive items (within the range) of every category
+  and unit in scope from the category/unit/price index: within one catalog
+  unit price order is price per base unit order, so these include every row
+  the QueryEngine would rank or list over the whole catalog;
+- builds a CatalogState over just the matched rows, with alias and synonym
+  phrases added to its name index so "dahi" resolves to Curd.
+
+The rest of the pipeline (shopping list parser, local classifier, query
+engine, retrieval, LLM chains) runs unchanged on that per-question state.
+Category listings only see the CATALOG_SEARCH_CATEGORY_ROWS cheapest and
+most expensive items of each category, and price range answers the
+CATALOG_SEARCH_RANGE_ROWS cheapest and most expensive items of each category
+and unit within the range.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from catalog_sync import CatalogState
+from config import (CATALOG_SEARCH_CACHE_SIZE, CATALOG_SEARCH_CACHE_TTL, CATALOG_SEARCH_MATCHES,
+                    CATALOG_SEARCH_MIN_SIMILARITY, CATALOG_SEARCH_CATEGORY_ROWS, CATALOG_SEARCH_RANGE_ROWS)
+from db import fetch_category_units, search_grocery_items
+from query_engine import asks_superlative, category_matcher, parse_per_unit, parse_price_bounds, parse_top_k
+from retrieval import STOPWORDS
+from telemetry import span, telemetry
+from units import NUMBER_WORDS, UNIT_ALIASES, parse_unit
+
+# Longest phrase (in words) looked up; longer catalog names are still found by pg_trgm similarity
+_MAX_PHRASE_WORDS = 3
+
+# Words that never start or end an item name in a question
+_EDGE_WORDS = STOPWORDS | set(NUMBER_WORDS) | set(UNIT_ALIASES) | {
+    "cheap", "cheaper", "cheapest", "expensive", "costliest", "priciest", "most", "least", "under", "over",
+    "between", "than",
+}
+
+# Phrases never span list separators ("rice and bread", "rice vs atta")
+_SEPARATOR_RE = re.compile(r",|;|\+|&|\n|\b(?:and|or|plus|vs|versus)\b", re.IGNORECASE)
+# Words of two letters or more ("what's" does not give "s")
+_WORD_RE = re.compile(r"\w\w+")
+
+
+def candidate_phrases(question):
+    """The phrases of a question that could name a catalog item, shortest first at each position."""
+    phrases = []
+    for fragment in _SEPARATOR_RE.split(question.lower()):
+        words = _WORD_RE.findall(fragment)
+        for start, word in enumerate(words):
+            if word in _EDGE_WORDS or any(char.isdigit() for char in word):
+                continue
+            for end in range(start + 1, min(start + _MAX_PHRASE_WORDS, len(words)) + 1):
+                last = words[end - 1]
+                if any(char.isdigit() for char in last):
+                    break
+                if last not in _EDGE_WORDS:
+                    phrase = " ".join(words[start:end])
+                    if phrase not in phrases:
+                        phrases.append(phrase)
+    return phrases
+
+
+class CatalogSearch:
+    """Per-question catalog lookups in Postgres behind an LRU cache of hot items."""
+
+    def __init__(self, cache_size=CATALOG_SEARCH_CACHE_SIZE, ttl=CATALOG_SEARCH_CACHE_TTL,
+                 matches=CATALOG_SEARCH_MATCHES, min_similarity=CATALOG_SEARCH_MIN_SIMILARITY,
+                 category_rows=CATALOG_SEARCH_CATEGORY_ROWS, range_rows=CATALOG_SEARCH_RANGE_ROWS):
+        self.cache_size = cache_size
+        self.ttl = ttl or None
+        self.matches = matches
+        self.min_similarity = min_similarity
+        self.category_rows = category_rows
+        self.range_rows = range_rows
+        self.hits = 0
+        self.misses = 0
+        self.round_trips = 0
+        self.rows_fetched = 0
+        # ("phrase", phrase), ("category", name) or ("ranked", ...) -> (rows, {alias phrase: item_lookup key}, fetched_at)
+        self._entries = OrderedDict()
+        self._outline = None  # ([(category, unit, parsed unit)], category spellings, regex, fetched_at)
+        self._lock = threading.Lock()
+
+    def _expired(self, fetched_at):
+        return self.ttl is not None and time.time() - fetched_at > self.ttl
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[2]):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _put(self, key, rows, aliases, fetched_at):
+        with self._lock:
+            self._entries[key] = (rows, aliases, fetched_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.cache_size:
+                self._entries.popitem(last=False)
+
+    def outline(self):
+        """The (category, unit, parsed unit) pairs in use, category spellings and their regex, cached like the items."""
+        with self._lock:
+            outline = self._outline
+        if outline is None or self._expired(outline[3]):
+            pairs = [(category, unit, parse_unit(unit)) for category, unit in fetch_category_units()]
+            spellings, category_re = category_matcher({category for category, _, _ in pairs if category})
+            outline = (pairs, spellings, category_re, time.time())
+            with self._lock:
+                self._outline = outline
+        return outline
+
+    def categories_in(self, question):
+        """The catalog categories a question names."""
+        _, spellings, category_re, _ = self.outline()
+        if category_re is None:
+            return []
+        found = []
+        for match in category_re.finditer(question):
+            category = spellings[match.group(1).lower()]
+            if category not in found:
+                found.append(category)
+        return found
+
+    def probes_for(self, question, categories):
+        """
+        The cache key, (category, unit, low, high) price probes and rows per probe end a
+        superlative or range question needs, or None for other questions.
+        """
+        bounds = parse_price_bounds(question)
+        if bounds is None and not asks_superlative(question):
+            return None
+        per_unit = parse_per_unit(question)
+        probes = []
+        for category, unit, parsed in self.outline()[0]:
+            if categories and category not in categories:
+                continue
+            low, high = bounds or (None, None)
+            if per_unit is not None:
+                if parsed is None or parsed[1] != per_unit[0]:
+                    continue
+                # Bounds per display unit -> bounds on the listed price of this unit
+                factor = float(parsed[0]) / per_unit[1]
+                low = None if low is None else low * factor
+                high = None if high is None else high * factor
+            probes.append((category, unit, low, high))
+        rows = self.range_rows if bounds is not None else parse_top_k(question)
+        key = ("ranked", tuple(categories), per_unit and per_unit[0], bounds, rows)
+        return key, probes, rows
+
+    def search(self, question):
+        """
+        The catalog rows relevant to a question and the alias spellings it used
+        ({phrase: item_lookup key}). Cache misses cost one database round trip.
+        """
+        categories = self.categories_in(question)
+        keys = [("phrase", phrase) for phrase in candidate_phrases(question)]
+        keys += [("category", category) for category in categories]
+        ranked = self.probes_for(question, categories)
+        if ranked is not None:
+            keys.append(ranked[0])
+        rows = {}
+        aliases = {}
+        missing = []
+        for key in keys:
+            entry = self._get(key)
+            if entry is None:
+                missing.append(key)
+                continue
+            cached_rows, cached_aliases, _ = entry
+            rows.update((row["id"], row) for row in cached_rows)
+            aliases.update(cached_aliases)
+
+        if missing:
+            fetched_at = time.time()
+            probes, probe_rows = [], 1
+            if ranked is not None and ranked[0] in missing:
+                _, probes, probe_rows = ranked
+            with span("db.search", phrases=len(missing), probes=len(probes)) as search:
+                found = search_grocery_items(
+                    [key[1] for key in missing if key[0] == "phrase"],
+                    [key[1] for key in missing if key[0] == "category"],
+                    probes, matches=self.matches, min_similarity=self.min_similarity,
+                    category_rows=self.category_rows, probe_rows=probe_rows,
+                )
+                search.set(rows=len(found))
+            with self._lock:
+                self.round_trips += 1
+                self.rows_fetched += len(found)
+            telemetry.metrics.inc("grocery_catalog_search_round_trips_total")
+            # Every missing key is cached, also those that matched nothing
+            by_key = {key: ([], {}) for key in missing}
+            for row in found:
+                phrase, source, via_alias = row.pop("phrase"), row.pop("source"), row.pop("via_alias")
+                if source == "ranked":
+                    key = ranked[0]
+                else:
+                    key = (source, phrase if source == "phrase" else row["category"])
+                key_rows, key_aliases = by_key[key]
+                key_rows.append(row)
+                if via_alias:
+                    key_aliases[phrase] = row["name"].lower()
+            for key, (key_rows, key_aliases) in by_key.items():
+                self._put(key, key_rows, key_aliases, fetched_at)
+                rows.update((row["id"], row) for row in key_rows)
+                aliases.update(key_aliases)
+        return sorted(rows.values(), key=lambda row: row["id"]), aliases
+
+    def state_for(self, question):
+        """A CatalogState over the rows a question matched."""
+        rows, aliases = self.search(question)
+        return CatalogState(rows, aliases=aliases)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._outline = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cached": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "round_trips": self.round_trips,
+                "rows_fetched": self.rows_fetched,
+            }
@@ -0,0 +1,270 @@
+"""
+On-disk catalog snapshot for the Grocery Price Assistant
+
+A snapshot file holds the catalog and the structures derived from it in a
+compact binary layout that is memory-mapped rather than parsed:
+
+- a fixed header (magic, format version, directory length) followed by a
+  JSON directory with the catalog version, the database time the catalog was
+  read at (the CatalogSync watermark), the small interned string pools
+  (categories, units, currencies) and the offset of every section;
+- 8-byte aligned sections of native-endian typed arrays: the ColumnarCatalog
+  columns, the QueryEngine category and price indexes, and the name index
+  stored as sorted UTF-8 keys searched by bisection;
+- item names as an offsets array plus one UTF-8 blob.
+
+Loading maps the file read-only and casts the sections to memoryviews, so
+the numeric columns and indexes are never copied: every worker process
+started from the same snapshot shares the page cache pages of the file.
+Files are written to a temporary name and renamed into place, so readers
+(and processes that still map an older snapshot) never see a partial file.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from columnar_catalog import ColumnarCatalog, StringPool
+from query_engine import PriceIndex
+
+MAGIC = b"GROCSNAP"
+FORMAT_VERSION = 1
+
+# Magic, format version, length of the JSON directory that follows
+_HEADER = struct.Struct("<8sII")
+_ALIGNMENT = 8
+
+
+class SnapshotError(Exception):
+    """The snapshot file is missing, truncated or was written by another format version."""
+
+
+class MappedNameIndex:
+    """
+    Read-only name index (normalized name variant -> item_lookup key) backed by
+    sorted keys in the snapshot. Supports the get() lookups the shopping
+    parser and classifier make, in O(log n) without building a dictionary.
+    """
+
+    __slots__ = ("_keys", "_rows", "_names")
+
+    def __init__(self, keys, rows, names):
+        self._keys = keys
+        self._rows = rows
+        self._names = names
+
+    def get(self, key, default=None):
+        encoded = key.encode("utf-8")
+        # Binary search over the mapping itself: slicing an mmap returns bytes without an intermediate view
+        mapping, offsets, start = self._keys.mapping, self._keys.offsets, self._keys.start
+        low, high = 0, len(self._rows)
+        while low < high:
+            middle = (low + high) // 2
+            if mapping[start + offsets[middle]:start + offsets[middle + 1]] < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._rows) and self._keys[low] == encoded:
+            return self._names[self._rows[low]].lower()
+        return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def items(self):
+        for position in range(len(self._keys)):
+            yield self._keys[position].decode("utf-8"), self._names[self._rows[position]].lower()
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class _MappedStrings:
+    """Sequence of UTF-8 byte strings stored as an offsets array and a blob starting at start in mapping."""
+
+    __slots__ = ("mapping", "offsets", "start")
+
+    def __init__(self, mapping, offsets, start):
+        self.mapping = mapping
+        self.offsets = offsets
+        self.start = start
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.mapping[self.start + self.offsets[index]:self.start + self.offsets[index + 1]]
+
+    def decode(self):
+        blob = self.mapping[self.start:self.start + self.offsets[-1]]
+        offsets = self.offsets
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+
+
+class CatalogSnapshot:
+    """A mapped snapshot: the catalog version, its watermark and the structures to start from."""
+
+    def __init__(self, path, version, watermark, columns, name_index, engine_indexes):
+        self.path = path
+        self.version = version
+        self.watermark = watermark  # database time the catalog was read at, None if unknown
+        self.columns = columns
+        self.name_index = name_index
+        self.engine_indexes = engine_indexes  # (category_rows, price_index, unit_price_index) for QueryEngine
+
+
+class _Writer:
+    def __init__(self):
+        self.sections = {}
+        self.chunks = []
+        self.size = 0
+
+    def add(self, name, typecode, values):
+        data = values if typecode == "B" else array(typecode, values).tobytes()
+        self.sections[name] = [typecode, self.size, len(data)]
+        padding = -len(data) % _ALIGNMENT
+        self.chunks.append(bytes(data) + b"\0" * padding)
+        self.size += len(data) + padding
+        return name
+
+    def add_strings(self, name, values):
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = array("Q", [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        self.add(f"{name}.offsets", "Q", offsets)
+        self.add(f"{name}.blob", "B", b"".join(encoded))
+        return name
+
+
+def write_snapshot(path, state, watermark=None):
+    """Write a CatalogState (see catalog_sync.py) to path, atomically replacing any previous snapshot."""
+    columns = state.columns
+    engine = state.engine
+    writer = _Writer()
+    for name, typecode in (("ids", "q"), ("prices", "d"), ("unit_prices", "d"), ("category_codes", "I"),
+                           ("unit_codes", "I"), ("currency_codes", "I"), ("unit_base_quantities", "d")):
+        writer.add(name, typecode, getattr(columns, name))
+    writer.add_strings("names", columns.names)
+
+    # Sorted by UTF-8 bytes, the order MappedNameIndex.get compares the mapped keys in
+    entries = sorted((key.encode("utf-8"), columns.row_of(value)) for key, value in state.name_index.items())
+    entries = [(key, row) for key, row in entries if row is not None]
+    writer.add_strings("name_index.keys", [key.decode("utf-8") for key, _ in entries])
+    writer.add("name_index.rows", "q", [row for _, row in entries])
+
+    category_rows = []
+    for position, (category, rows) in enumerate(engine.category_rows.items()):
+        category_rows.append([category, writer.add(f"category.{position}", "q", rows)])
+    price_index = []
+    for position, (category, index) in enumerate(engine.price_index.items()):
+        price_index.append([category, writer.add(f"price.{position}.rows", "q", index.rows),
+                            writer.add(f"price.{position}.prices", "d", index.prices)])
+    unit_price_index = []
+    for position, ((category, base_unit), index) in enumerate(engine.unit_price_index.items()):
+        unit_price_index.append([category, base_unit, writer.add(f"unit_price.{position}.rows", "q", index.rows),
+                                 writer.add(f"unit_price.{position}.prices", "d", index.prices)])
+
+    directory = json.dumps({
+        "version": state.version,
+        "watermark": watermark,
+        "byteorder": sys.byteorder,
+        "items": len(columns),
+        "categories": columns.categories.values,
+        "units": columns.units.values,
+        "currencies": columns.currencies.values,
+        "unit_base_units": columns.unit_base_units,
+        "category_rows": category_rows,
+        "price_index": price_index,
+        "unit_price_index": unit_price_index,
+        "sections": writer.sections,
+    }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(directory)) + directory
+    header += b"\0" * (-len(header) % _ALIGNMENT)
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "wb") as f:
+            f.write(header)
+            for chunk in writer.chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return len(header) + writer.size
+
+
+def read_snapshot(path):
+    """Map the snapshot at path and return a CatalogSnapshot. Raises SnapshotError if it is unusable."""
+    try:
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"cannot map {path}: {e}") from e
+    if len(mapping) < _HEADER.size:
+        raise SnapshotError(f"{path} is truncated")
+    magic, format_version, directory_length = _HEADER.unpack_from(mapping)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        raise SnapshotError(f"{path} is not a format {FORMAT_VERSION} catalog snapshot")
+    try:
+        directory = json.loads(mapping[_HEADER.size:_HEADER.size + directory_length])
+    except ValueError as e:
+        raise SnapshotError(f"{path} has a corrupt directory: {e}") from e
+    if directory["byteorder"] != sys.byteorder:
+        raise SnapshotError(f"{path} was written on a {directory['byteorder']}-endian machine")
+
+    data_start = _HEADER.size + directory_length
+    data_start += -data_start % _ALIGNMENT
+    data = memoryview(mapping)[data_start:]
+    sections = directory["sections"]
+    if any(offset + length > len(data) for _, offset, length in sections.values()):
+        raise SnapshotError(f"{path} is truncated")
+
+    def section(name):
+        typecode, offset, length = sections[name]
+        view = data[offset:offset + length]
+        return view if typecode == "B" else view.cast(typecode)
+
+    def strings(name):
+        _, offset, _ = sections[f"{name}.blob"]
+        return _MappedStrings(mapping, section(f"{name}.offsets"), data_start + offset)
+
+    names = strings("names").decode()
+    categories, units, currencies = StringPool(), StringPool(), StringPool()
+    for pool, values in ((categories, directory["categories"]), (units, directory["units"]),
+                         (currencies, directory["currencies"])):
+        for value in values:
+            pool.code(value)
+    columns = ColumnarCatalog.from_columns(
+        ids=section("ids"), names=names, prices=section("prices"), unit_prices=section("unit_prices"),
+        category_codes=section("category_codes"), unit_codes=section("unit_codes"),
+        currency_codes=section("currency_codes"), categories=categories, units=units, currencies=currencies,
+        unit_base_quantities=section("unit_base_quantities"),
+        unit_base_units=[None if unit is None else sys.intern(unit) for unit in directory["unit_base_units"]],
+    )
+    name_index = MappedNameIndex(strings("name_index.keys"), section("name_index.rows"), names)
+
+    category_rows = {category: section(rows) for category, rows in directory["category_rows"]}
+    price_index = {category: PriceIndex.from_arrays(section(rows), section(prices))
+                   for category, rows, prices in directory["price_index"]}
+    unit_price_index = {(category, base_unit): PriceIndex.from_arrays(section(rows), section(prices))
+                        for category, base_unit, rows, prices in directory["unit_price_index"]}
+    return CatalogSnapshot(path, directory["version"], directory["watermark"], columns, name_index,
+                           (category_rows, price_index, unit_price_index))
+
+
+def load_snapshot(path):
+    """The CatalogSnapshot at path, or None (with a message) when there is no usable snapshot."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return read_snapshot(path)
+    except (SnapshotError, KeyError, TypeError, ValueError) as e:
+        print(f"Ignoring catalog snapshot: {str(e)}")
+        return None
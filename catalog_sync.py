@@ -0,0 +1,290 @@
+"""
+Live catalog refresh for the Grocery Price Assistant
+
+CatalogState bundles the loaded catalog with every structure derived from it
+(item lookup, name index, columnar catalog, retriever, local classifier,
+query engine, version hash). It is
+never modified in place: CatalogSync fetches only the rows changed since its
+last sync, builds a new CatalogState off the query path and swaps it in with a
+single reference assignment, so in-flight queries keep a consistent snapshot.
+
+Changes are detected through the updated_at column and grocery_item_deletions
+tombstones maintained by the triggers db_setup installs, either by polling or
+by waiting for Postgres NOTIFY events on the grocery_items_changed channel.
+
+With a snapshot path (CATALOG_SNAPSHOT_PATH) every catalog swapped in is also
+written to an on-disk snapshot (catalog_snapshot.py) together with its
+watermark, so the next process starts from the mapped file and only asks the
+database what changed since.
+"""
+import select
+import threading
+from functools import cached_property
+
+from catalog_snapshot import write_snapshot
+from columnar_catalog import ColumnarCatalog, ColumnarLookup
+from config import CATALOG_REFRESH_MODE, CATALOG_REFRESH_INTERVAL
+from db import fetch_database_time, fetch_grocery_item_changes, fetch_grocery_items, listen_connection
+from query_classifier import LocalQueryClassifier
+from query_engine import QueryEngine
+from response_cache import catalog_version
+from retrieval import CatalogRetriever
+from shopping_parser import build_name_index
+
+CATALOG_CHANNEL = "grocery_items_changed"
+REFRESH_MODES = ("off", "poll", "listen")
+
+# Re-read changes this many seconds before the last watermark, so rows committed
+# by transactions that started before the previous sync are not missed
+_OVERLAP_SECONDS = 5
+
+
+class CatalogState:
+    """Immutable snapshot of the catalog and the structures derived from it."""
+
+    def __init__(self, grocery_items, columns=None, name_index=None, engine_indexes=None, version=None,
+                 aliases=None, classifier=None, engine=None, retriever=None):
+        """
+        grocery_items may be None with columns given: the item dictionaries are then built
+        on first use. The other arguments are structures already built for these items.
+        """
+        if grocery_items is not None:
+            self.grocery_items = list(grocery_items)
+        # Compact columns with the unit strings parsed once into prices per g/ml/count
+        self.columns = ColumnarCatalog(self.grocery_items) if columns is None else columns
+        if grocery_items is None:
+            self.item_lookup = ColumnarLookup(self.columns)
+        else:
+            self.item_lookup = {item['name'].lower(): item for item in self.grocery_items}
+        self.name_index = build_name_index(self.item_lookup) if name_index is None else name_index
+        # Other spellings -> item_lookup key (e.g. "dahi" -> "curd"); catalog names take precedence
+        for spelling, key in (aliases or {}).items():
+            self.name_index.setdefault(spelling, key)
+        if classifier is None:
+            classifier = LocalQueryClassifier(self.item_lookup, self.name_index, self.columns.category_names())
+        self.classifier = classifier
+        # Sorted price and category indexes that answer lookup-style questions without the LLM
+        self.engine = QueryEngine(self.columns, self.name_index, engine_indexes) if engine is None else engine
+        self.version = catalog_version(self.grocery_items) if version is None else version
+        if retriever is not None:
+            self.retriever = retriever
+        elif grocery_items is not None:
+            # Built now, off the query path, like every other structure of a refreshed catalog
+            self.retriever
+
+    @cached_property
+    def grocery_items(self):
+        return self.columns.to_dicts()
+
+    @cached_property
+    def retriever(self):
+        """Index of the catalog so each prompt only carries the items relevant to the question."""
+        return CatalogRetriever(self.grocery_items)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        State over a mapped CatalogSnapshot: the columns, name index and query engine
+        indexes stay in the shared mapping, and the item lookup reads rows from it.
+        The item dictionaries and the retriever are only built in this process once
+        a query needs them (the LLM chains' context, an incremental refresh).
+        """
+        return cls(None, columns=snapshot.columns, name_index=snapshot.name_index,
+                   engine_indexes=snapshot.engine_indexes, version=snapshot.version)
+
+    def apply_changes(self, changed_rows, deleted_ids):
+        """
+        Return a new CatalogState with changed rows upserted and deleted ids removed.
+        When only prices changed, the structures built from names, units and categories
+        are shared with this state instead of being rebuilt.
+        """
+        if not deleted_ids:
+            prices = self._price_changes(changed_rows)
+            if prices is not None:
+                return self._with_prices(changed_rows, prices)
+        items = {item["id"]: item for item in self.grocery_items}
+        for item_id in deleted_ids:
+            items.pop(item_id, None)
+        for row in changed_rows:
+            items[row["id"]] = row
+        return CatalogState(sorted(items.values(), key=lambda item: item["id"]))
+
+    @cached_property
+    def _rows_by_id(self):
+        return {item_id: row for row, item_id in enumerate(self.columns.ids)}
+
+    def _price_changes(self, changed_rows):
+        """{row: new price} when changed_rows only reprice existing items, else None."""
+        prices = {}
+        for changed in changed_rows:
+            row = self._rows_by_id.get(changed["id"])
+            if row is None:
+                return None
+            item = self.columns[row]
+            if (changed["name"], changed.get("category") or "", changed.get("unit") or "",
+                    changed.get("currency") or "") != (item.name, item.category, item.unit, item.currency):
+                return None
+            prices[row] = float(changed["price"])
+        return prices
+
+    def _with_prices(self, changed_rows, prices):
+        columns = self.columns.with_prices(prices)
+        # The name index and classifier only depend on names and categories
+        shared = {"columns": columns, "name_index": self.name_index, "classifier": self.classifier,
+                  "engine": self.engine.with_prices(columns, prices)}
+        retriever = self.__dict__.get("retriever")
+        if retriever is None:
+            # Not built in this process yet (a state from a snapshot): the new state builds it lazily too
+            return CatalogState(None, **shared)
+        items = list(self.grocery_items)
+        for changed in changed_rows:
+            items[self._rows_by_id[changed["id"]]] = changed
+        return CatalogState(items, retriever=retriever.with_prices(items), **shared)
+
+
+class CatalogSync:
+    """Keeps a CatalogState in step with the grocery_items table while queries keep flowing."""
+
+    def __init__(self, state, mode=CATALOG_REFRESH_MODE, interval=CATALOG_REFRESH_INTERVAL, on_change=None,
+                 snapshot_path=None, watermark=None):
+        if mode not in REFRESH_MODES:
+            raise ValueError(f"Unknown refresh mode '{mode}', expected one of {REFRESH_MODES}")
+        self.state = state
+        self.mode = mode
+        self.interval = interval
+        self.on_change = on_change  # called with the new state before it is swapped in
+        self.snapshot_path = snapshot_path  # rewritten with every new state
+        self.syncs = 0
+        self.changes_applied = 0
+        self.snapshots_written = 0
+        self.last_error = None
+        self._watermark = watermark  # database time state was read at (e.g. from its snapshot)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, catch_up=False):
+        """
+        Start the background refresh thread (no-op when mode is "off"). catch_up
+        syncs once right away in the background, also when mode is "off": a state
+        started from a snapshot is brought up to date without delaying startup.
+        """
+        if self._thread is not None or (self.mode == "off" and not catch_up):
+            return self
+        if self._watermark is None and not catch_up:
+            try:
+                self._watermark = fetch_database_time()
+            except Exception as e:
+                self.last_error = e
+                print(f"Catalog refresh could not read the database clock: {str(e)}")
+        if self.mode == "off":
+            target = self._safe_sync
+        else:
+            target = self._listen_loop if self.mode == "listen" else self._poll_loop
+            if catch_up and self.mode == "poll":
+                target = self._catch_up_and_poll
+        self._thread = threading.Thread(target=target, name="catalog-sync", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def sync_now(self):
+        """Fetch rows changed since the last sync and swap in the updated catalog. Returns True on change."""
+        with self._lock:
+            since = None if self._watermark is None else self._watermark - _OVERLAP_SECONDS
+            if since is None:
+                changed_at, rows, deleted_ids, truncated = fetch_database_time(), fetch_grocery_items(), [], True
+            else:
+                changed_at, rows, deleted_ids, truncated = fetch_grocery_item_changes(since)
+            self.syncs += 1
+            self._watermark = changed_at
+
+            if truncated:
+                # The table was truncated (or this is the first sync): rebuild from a full read
+                new_state = CatalogState(rows if since is None else fetch_grocery_items())
+            elif rows or deleted_ids:
+                new_state = self.state.apply_changes(rows, deleted_ids)
+            else:
+                return False
+
+            if new_state.version == self.state.version:
+                if since is None:
+                    # Unchanged, but the snapshot now records the watermark the next process starts from
+                    self.save_snapshot()
+                return False
+            if self.on_change is not None:
+                self.on_change(new_state)
+            self.state = new_state
+            self.changes_applied += len(rows) + len(deleted_ids)
+            print(f"Catalog refreshed: {len(rows)} changed, {len(deleted_ids)} deleted, "
+                  f"{len(new_state.columns)} items")
+            self.save_snapshot()
+            return True
+
+    def save_snapshot(self):
+        """Write the current state and watermark to snapshot_path (no-op without one)."""
+        if not self.snapshot_path:
+            return False
+        try:
+            write_snapshot(self.snapshot_path, self.state, self._watermark)
+        except OSError as e:
+            print(f"Could not write catalog snapshot {self.snapshot_path}: {str(e)}")
+            return False
+        self.snapshots_written += 1
+        return True
+
+    def _safe_sync(self):
+        try:
+            self.sync_now()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = e
+            print(f"Catalog refresh failed: {str(e)}")
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.interval):
+            self._safe_sync()
+
+    def _catch_up_and_poll(self):
+        self._safe_sync()
+        self._poll_loop()
+
+    def _listen_loop(self):
+        """Sync on every NOTIFY, and at least every interval in case a notification was lost."""
+        conn = None
+        while not self._stop.is_set():
+            try:
+                if conn is None or conn.closed:
+                    conn = listen_connection(CATALOG_CHANNEL)
+                    # Catch up on anything that changed while we were not listening
+                    self._safe_sync()
+                if select.select([conn], [], [], self.interval) != ([], [], []):
+                    conn.poll()
+                    conn.notifies.clear()
+                self._safe_sync()
+            except Exception as e:
+                self.last_error = e
+                print(f"Catalog listener failed, reconnecting: {str(e)}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+                self._stop.wait(min(self.interval, 5))
+        if conn is not None:
+            conn.close()
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "version": self.state.version,
+            "items": len(self.state.columns),
+            "syncs": self.syncs,
+            "changes_applied": self.changes_applied,
+            "snapshot_path": self.snapshot_path,
+            "snapshots_written": self.snapshots_written,
+            "last_error": str(self.last_error) if self.last_error else None,
+        }
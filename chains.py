@@ -0,0 +1,120 @@
+"""
+LangChain side of the Grocery Price Assistant
+
+Everything that needs LangChain lives here. create_app imports this module
+when it builds its first chain, so questions answered from the catalog alone
+(shopping lists the parser resolves, query engine lookups, cached answers)
+never import LangChain:
+
+- build_chain(name, llm): prompt (prompts.py) | llm | output parser for one
+  chain, e.g. "price_query";
+- chain_llm(pool, chain): the pooled model for a chain, limited by its
+  generation budget;
+- PooledChatOllama, the chat model OllamaPool.chat_model returns;
+- llm_metrics, the callback recording Ollama's token counts and durations.
+"""
+from typing import Any, Dict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import ConfigurableField
+from pydantic import ConfigDict, Field
+
+from config import MODEL_NAME, OLLAMA_KEEP_ALIVE
+from generation_budget import GenerationBudget
+from prompts import SHARED_PREFIX, CHAIN_PROMPTS, JSON_CHAINS
+from telemetry import telemetry
+
+
+class OllamaMetricsHandler(BaseCallbackHandler):
+    """Records the token counts and durations Ollama reports for each reply."""
+
+    def __init__(self, telemetry):
+        self.telemetry = telemetry
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                info = generation.generation_info or getattr(message, "response_metadata", None) or {}
+                self.telemetry.record_llm_reply(info, generation.text or "")
+
+
+llm_metrics = OllamaMetricsHandler(telemetry)
+
+
+class PooledChatOllama(BaseChatModel):
+    """Chat model that routes each call to a backend of an OllamaPool, with failover."""
+
+    pool: Any = Field(exclude=True)
+    model: str = MODEL_NAME
+    options: Dict[str, Any] = Field(default_factory=dict)
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self):
+        return "ollama-pool"
+
+    @property
+    def _identifying_params(self):
+        return {"model": self.model, **self.options}
+
+    def _client(self, backend):
+        return backend.client(self.model, self.options)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.pool.call(self.model, lambda backend: self._client(backend)._generate(
+            messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await self.pool.acall(self.model, lambda backend: self._client(backend)._agenerate(
+            messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        yield from self.pool.stream(self.model, lambda backend: self._client(backend)._stream(
+            messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async for chunk in self.pool.astream(self.model, lambda backend: self._client(backend)._astream(
+                messages, stop=stop, run_manager=run_manager, **kwargs)):
+            yield chunk
+
+
+def build_prompt(instructions):
+    """Prompt with the shared prefix as its system message followed by chain-specific instructions."""
+    return ChatPromptTemplate.from_messages([("system", SHARED_PREFIX), ("human", instructions)])
+
+
+def chain_llm(pool, chain, callbacks=None):
+    """
+    The LLM for one chain, limited by that chain's generation budget. The model
+    can be switched per call with {"configurable": {"model": ...}} (cascade mode).
+    """
+    budget = GenerationBudget.for_chain(chain)
+    llm = pool.chat_model(
+        MODEL_NAME,
+        temperature=0,  # Zero temperature for deterministic outputs
+        keep_alive=OLLAMA_KEEP_ALIVE,  # Keep the model loaded between queries
+        callbacks=[llm_metrics, *(callbacks or [])],  # Token counts and durations from Ollama's replies
+        **budget.model_options(),  # num_predict, stop and reasoning for this chain
+    ).configurable_fields(model=ConfigurableField(id="model"))
+    return llm | budget.guard()
+
+
+def build_chain(name, llm):
+    """Build the chain called name in prompts.CHAIN_PROMPTS: its prompt, llm and output parser."""
+    parser = JsonOutputParser() if name in JSON_CHAINS else StrOutputParser()
+    return build_prompt(CHAIN_PROMPTS[name]) | llm | parser
+
+
+def build_query_classifier_chain(llm):
+    """Build the LLM chain that classifies a query into one of the QueryType labels."""
+    return build_chain("classifier", llm)
+
+
+def build_fallback_chain(llm):
+    """Build the general-purpose chain used for unclassified queries and errors."""
+    return build_chain("fallback", llm)
@@ -0,0 +1,262 @@
+"""
+Compact columnar catalog for the Grocery Price Assistant
+
+A list of per-row dictionaries costs several hundred bytes per item and keeps
+free-text units ("1 kg bag", "200 gm", "12 count") that have to be
+re-interpreted for every comparison. ColumnarCatalog stores the same rows as
+columns instead:
+
+- ids and prices live in typed arrays (8 bytes per value)
+- category, unit and currency strings are interned once and stored as small
+  integer codes
+- every distinct unit string is parsed once (units.parse_unit) into a base
+  quantity, so the price per gram, per ml or per count of every item is
+  precomputed at load time
+
+Rows are materialized on demand as CatalogItem records, which use __slots__.
+"""
+import copy
+import math
+import sys
+from array import array
+from collections.abc import Mapping
+
+from units import parse_unit
+
+# Price per base unit of items whose unit string could not be parsed
+NO_UNIT_PRICE = math.nan
+
+
+class CatalogItem:
+    """A single catalog row materialized from the columns."""
+
+    __slots__ = ("row", "id", "name", "price", "category", "unit", "currency",
+                 "base_quantity", "base_unit", "unit_price")
+
+    def __init__(self, row, id, name, price, category, unit, currency, base_quantity, base_unit, unit_price):
+        self.row = row
+        self.id = id
+        self.name = name
+        self.price = price
+        self.category = category
+        self.unit = unit
+        self.currency = currency
+        self.base_quantity = base_quantity  # e.g. 1000.0 for "1 kg bag", None if unparsed
+        self.base_unit = base_unit  # "g", "ml", "count", "packet" or None
+        self.unit_price = unit_price  # price per base unit, None if unparsed
+
+    def as_dict(self):
+        """The row in the dictionary form used by load_all_grocery_items."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "price": self.price,
+            "category": self.category,
+            "unit": self.unit,
+            "currency": self.currency,
+        }
+
+    def __repr__(self):
+        return f"CatalogItem({self.name!r}, {self.price} per {self.unit!r}, {self.category!r})"
+
+
+class StringPool:
+    """Interns repeated strings and hands out a small integer code for each."""
+
+    __slots__ = ("values", "_codes")
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(sys.intern(value) if isinstance(value, str) else value)
+            self._codes[value] = code
+        return code
+
+    def get(self, value):
+        """Code of an already interned value, or None."""
+        return self._codes.get(value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ColumnarCatalog:
+    """Column-oriented, array-backed store for the grocery catalog."""
+
+    def __init__(self, rows=()):
+        self.ids = array("q")
+        self.names = []
+        self.prices = array("d")
+        self.unit_prices = array("d")  # price per base unit, NaN when the unit is unparseable
+        self.category_codes = array("I")
+        self.unit_codes = array("I")
+        self.currency_codes = array("I")
+        self.categories = StringPool()
+        self.units = StringPool()
+        self.currencies = StringPool()
+        # Per unit code: the parsed base quantity (NaN if unparseable) and base unit
+        self.unit_base_quantities = array("d")
+        self.unit_base_units = []
+        self._rows_by_name = {}
+        self.extend(rows)
+
+    @classmethod
+    def from_columns(cls, ids, names, prices, unit_prices, category_codes, unit_codes, currency_codes,
+                     categories, units, currencies, unit_base_quantities, unit_base_units):
+        """
+        A catalog over existing columns, e.g. memoryviews of a mapped snapshot
+        (catalog_snapshot.py). Columns that are read-only views cannot be appended to.
+        """
+        catalog = cls()
+        catalog.ids = ids
+        catalog.names = names
+        catalog.prices = prices
+        catalog.unit_prices = unit_prices
+        catalog.category_codes = category_codes
+        catalog.unit_codes = unit_codes
+        catalog.currency_codes = currency_codes
+        catalog.categories = categories
+        catalog.units = units
+        catalog.currencies = currencies
+        catalog.unit_base_quantities = unit_base_quantities
+        catalog.unit_base_units = unit_base_units
+        for index in range(len(names) - 1, -1, -1):
+            catalog._rows_by_name[names[index].lower()] = index
+        return catalog
+
+    def _unit_code(self, unit):
+        code = self.units.code(unit or "")
+        if code == len(self.unit_base_quantities):
+            # First time this unit string is seen: parse it once for every row that uses it
+            parsed = parse_unit(unit)
+            if parsed is None:
+                self.unit_base_quantities.append(math.nan)
+                self.unit_base_units.append(None)
+            else:
+                self.unit_base_quantities.append(float(parsed[0]))
+                self.unit_base_units.append(sys.intern(parsed[1]))
+        return code
+
+    def append(self, row):
+        """Add one row given as a dictionary with id, name, price, category, unit and currency."""
+        index = len(self.names)
+        price = float(row["price"])
+        unit_code = self._unit_code(row.get("unit"))
+
+        self.ids.append(int(row.get("id") or 0))
+        self.names.append(row["name"])
+        self.prices.append(price)
+        self.unit_prices.append(price / self.unit_base_quantities[unit_code])
+        self.category_codes.append(self.categories.code(row.get("category") or ""))
+        self.unit_codes.append(unit_code)
+        self.currency_codes.append(self.currencies.code(row.get("currency") or ""))
+        self._rows_by_name.setdefault(row["name"].lower(), index)
+        return index
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self.names)
+        unit_code = self.unit_codes[row]
+        base_quantity = self.unit_base_quantities[unit_code]
+        parsed = not math.isnan(base_quantity)
+        return CatalogItem(
+            row=row,
+            id=self.ids[row],
+            name=self.names[row],
+            price=self.prices[row],
+            category=self.categories.values[self.category_codes[row]],
+            unit=self.units.values[unit_code],
+            currency=self.currencies.values[self.currency_codes[row]],
+            base_quantity=base_quantity if parsed else None,
+            base_unit=self.unit_base_units[unit_code],
+            unit_price=self.unit_prices[row] if parsed else None,
+        )
+
+    def __iter__(self):
+        for row in range(len(self.names)):
+            yield self[row]
+
+    def row_of(self, name):
+        """Row number of the item with this name (case-insensitive), or None."""
+        return self._rows_by_name.get(name.lower())
+
+    def find(self, name):
+        """The CatalogItem with this name (case-insensitive), or None."""
+        row = self.row_of(name)
+        return None if row is None else self[row]
+
+    def base_unit(self, row):
+        """Base unit ("g", "ml", "count", "packet") of a row, or None if its unit is unparseable."""
+        return self.unit_base_units[self.unit_codes[row]]
+
+    def rows_in_category(self, category):
+        """Row numbers of every item in a category (case-sensitive, as stored)."""
+        code = self.categories.get(category)
+        if code is None:
+            return []
+        return [row for row, row_code in enumerate(self.category_codes) if row_code == code]
+
+    def category_names(self):
+        return list(self.categories.values)
+
+    def memory_bytes(self):
+        """Approximate memory held by the columns, interned strings and name index."""
+        arrays = (self.ids, self.prices, self.unit_prices, self.category_codes, self.unit_codes,
+                  self.currency_codes, self.unit_base_quantities)
+        total = sum(sys.getsizeof(column) for column in arrays)
+        total += sys.getsizeof(self.names) + sum(sys.getsizeof(name) for name in self.names)
+        total += sys.getsizeof(self._rows_by_name)
+        for pool in (self.categories, self.units, self.currencies):
+            total += sys.getsizeof(pool.values) + sum(sys.getsizeof(value) for value in pool.values)
+        return total
+
+    def to_dicts(self):
+        """All rows in the dictionary form used by load_all_grocery_items."""
+        return [item.as_dict() for item in self]
+
+    def with_prices(self, prices):
+        """A copy with new prices for some rows ({row: price}); names, units and codes are shared."""
+        catalog = copy.copy(self)
+        catalog.prices = array("d", self.prices)
+        catalog.unit_prices = array("d", self.unit_prices)
+        for row, price in prices.items():
+            catalog.prices[row] = price
+            catalog.unit_prices[row] = price / self.unit_base_quantities[self.unit_codes[row]]
+        return catalog
+
+
+class ColumnarLookup(Mapping):
+    """
+    Read-only item lookup (lowercase name -> item dictionary) over a ColumnarCatalog:
+    the dictionary of one row is built when it is looked up, not for the whole catalog.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __getitem__(self, key):
+        row = self.columns.row_of(key) if key == key.lower() else None
+        if row is None:
+            raise KeyError(key)
+        return self.columns[row].as_dict()
+
+    def __contains__(self, key):
+        return key == key.lower() and self.columns.row_of(key) is not None
+
+    def __iter__(self):
+        return iter(self.columns._rows_by_name)
+
+    def __len__(self):
+        return len(self.columns._rows_by_name)
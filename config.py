@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -6,7 +7,16 @@ Configuration settings for the Grocery Price Assistant
 
 This file manages configuration parameters for:
 1. Ollama LLM API settings
-2. Currency settings
+2. Catalog retrieval settings
+3. Query classification settings
+4. Generation budget settings
+5. Response cache settings
+6. Live catalog refresh settings
+7. Receipt rendering settings
+8. Tracing and metrics settings
+9. HTTP service settings
+10. Currency settings
+11. Database connection pool settings
 
 Database connection parameters are loaded from .env file.
 """
@@ -14,19 +24,131 @@ Database connection parameters are loaded from .env file.
 # Load environment variables from .env file if it exists
 load_dotenv(override=True)
 
-print(f"ENV MODEL_NAME loaded as: {os.getenv('MODEL_NAME')}")
-
 # Ollama LLM configuration
 # -----------------------
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")  # Ollama API endpoint
 MODEL_NAME = os.getenv("MODEL_NAME", "deepseek-r1:32b")  # LLM model to use
-print(f"CONFIG MODEL_NAME set to: {MODEL_NAME}")
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "4"))  # Questions answered at once by get_answers
+# "single": every chain uses MODEL_NAME; "cascade": SMALL_MODEL_NAME answers first and
+# MODEL_NAME is only asked when the small model's answer fails local validation
+MODEL_ROUTING_MODES = ("single", "cascade")
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "single")
+SMALL_MODEL_NAME = os.getenv("SMALL_MODEL_NAME", "qwen2.5:7b")
+# How long Ollama keeps the model loaded after a request: a duration such as "30m", or seconds (-1 = forever)
+_keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_KEEP_ALIVE = int(_keep_alive) if _keep_alive.lstrip("-").isdigit() else _keep_alive
+OLLAMA_WARM_UP = os.getenv("OLLAMA_WARM_UP", "true").lower() == "true"  # Load the model in create_app
+# Several Ollama servers, each optionally limited to some models:
+# "http://gpu1:11434=deepseek-r1:32b|qwen2.5:7b,http://gpu2:11434" (unset = OLLAMA_BASE_URL only)
+OLLAMA_BACKENDS = os.getenv("OLLAMA_BACKENDS", "")
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))  # Seconds between backend probes
+OLLAMA_FAILOVER_RETRIES = int(os.getenv("OLLAMA_FAILOVER_RETRIES", "2"))  # Other backends tried after a failure
+
+# Retrieval configuration
+# -----------------------
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))  # Best-matching items sent to the LLM per question
+RETRIEVAL_MAX_ITEMS = int(os.getenv("RETRIEVAL_MAX_ITEMS", "50"))  # Cap including category siblings
+# Catalogs up to this size go whole into the shared prompt prefix instead of per-question context
+PROMPT_PREFIX_MAX_ITEMS = int(os.getenv("PROMPT_PREFIX_MAX_ITEMS", "200"))
+
+# Query classification
+# --------------------
+# Local classifications below this confidence are re-checked with the LLM classifier chain
+CLASSIFIER_CONFIDENCE_THRESHOLD = float(os.getenv("CLASSIFIER_CONFIDENCE_THRESHOLD", "0.6"))
+# "two_stage": LLM classifier then a specialised chain; "single_pass": one routed call does both
+PIPELINE_MODES = ("two_stage", "single_pass")
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "two_stage")
+# Category and comparison queries are answered from local indexes; set to "true" to have the LLM phrase them
+QUERY_ENGINE_LLM_PHRASING = os.getenv("QUERY_ENGINE_LLM_PHRASING", "false").lower() == "true"
+# Shopping lists the local parser cannot price. "generate": the LLM writes the table and totals;
+# "extract": it only returns (item, quantity, unit) JSON and prices and totals are computed locally
+SHOPPING_LIST_MODES = ("generate", "extract")
+SHOPPING_LIST_MODE = os.getenv("SHOPPING_LIST_MODE", "generate")
+EXTRACTION_RETRIES = int(os.getenv("EXTRACTION_RETRIES", "1"))  # Re-asks for extracted entries that fail validation
+
+# Generation budgets
+# ------------------
+# Per chain: max_tokens for the answer, stop sequences and reasoning: false (no <think> section),
+# true (unlimited) or the most reasoning tokens allowed. Lookup-style chains skip reasoning.
+# Override entries with JSON, e.g. GENERATION_BUDGETS='{"comparison_query": {"reasoning": 256}}'
+DEFAULT_GENERATION_BUDGETS = {
+    "classifier": {"max_tokens": 96, "reasoning": False},
+    "price_query": {"max_tokens": 128, "reasoning": False},
+    "category_query": {"max_tokens": 384, "reasoning": False},
+    "phrasing": {"max_tokens": 256, "reasoning": False},
+    "extractor": {"max_tokens": 256, "reasoning": False},
+    "comparison_query": {"max_tokens": 384, "reasoning": 512},
+    "routed": {"max_tokens": 512, "reasoning": 512},
+    "shopping_list": {"max_tokens": 768, "reasoning": 1024},
+    "fallback": {"max_tokens": 768, "reasoning": 1024},
+}
+_budget_overrides = json.loads(os.getenv("GENERATION_BUDGETS") or "{}")
+GENERATION_BUDGETS = {name: {**budget, **_budget_overrides.get(name, {})}
+                      for name, budget in DEFAULT_GENERATION_BUDGETS.items()}
+
+# Response cache
+# --------------
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))  # Max cached answers (0 disables the cache)
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "0")) or None  # Seconds before an answer expires (0 = never)
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH") or None  # SQLite file so the cache survives restarts
+
+# Live catalog refresh
+# --------------------
+CATALOG_REFRESH_MODE = os.getenv("CATALOG_REFRESH_MODE", "off")  # "off", "poll" or "listen" (Postgres NOTIFY)
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "30"))  # Seconds between polls
+# Memory-mapped catalog snapshot processes start from before asking the database what changed
+# (off unless set; use an absolute path, e.g. /var/lib/grocery/catalog.snapshot)
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "")
+
+# Catalog backend
+# ---------------
+# "memory": the whole catalog is loaded into every process; "search": for catalogs too large to hold,
+# the items a question mentions are looked up in Postgres (pg_trgm, alias and synonym tables) per query
+CATALOG_BACKENDS = ("memory", "search")
+CATALOG_BACKEND = os.getenv("CATALOG_BACKEND", "memory")
+CATALOG_SEARCH_CACHE_SIZE = int(os.getenv("CATALOG_SEARCH_CACHE_SIZE", "10000"))  # Phrases kept in the hot-item LRU
+CATALOG_SEARCH_CACHE_TTL = float(os.getenv("CATALOG_SEARCH_CACHE_TTL", "60"))  # Seconds before a cached lookup expires
+CATALOG_SEARCH_MATCHES = int(os.getenv("CATALOG_SEARCH_MATCHES", "5"))  # Most rows fetched per phrase
+CATALOG_SEARCH_MIN_SIMILARITY = float(os.getenv("CATALOG_SEARCH_MIN_SIMILARITY", "0.4"))  # pg_trgm similarity cutoff
+CATALOG_SEARCH_CATEGORY_ROWS = int(os.getenv("CATALOG_SEARCH_CATEGORY_ROWS", "25"))  # Cheapest and dearest per category
+CATALOG_SEARCH_RANGE_ROWS = int(os.getenv("CATALOG_SEARCH_RANGE_ROWS", "25"))  # Cheapest and dearest per category and unit in a price range
+
+# Receipt rendering
+# -----------------
+RECEIPT_RENDERERS = ("pillow", "pandoc")
+RECEIPT_RENDERER = os.getenv("RECEIPT_RENDERER", "pillow")  # "pillow" (in process) or "pandoc" (xelatex + pdf2image)
+RECEIPT_FONT_DIR = os.getenv("RECEIPT_FONT_DIR") or None  # Directory holding DejaVuSans*.ttf if not in a system path
+RECEIPT_WORKERS = int(os.getenv("RECEIPT_WORKERS", "0")) or None  # Batch render processes (0 = one per CPU)
+
+# Tracing and metrics
+# -------------------
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))  # Fraction of queries whose spans are logged
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH") or None  # JSON-lines span log ("-" = stdout, unset = off)
+METRICS_PATH = os.getenv("METRICS_PATH") or None  # Prometheus text file, e.g. for node_exporter's textfile collector
+METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "10"))  # Min seconds between metrics file writes
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve /metrics on this port (0 = off)
+
+# HTTP service
+# ------------
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+SERVER_MAX_INFLIGHT = int(os.getenv("SERVER_MAX_INFLIGHT", str(MAX_CONCURRENCY)))  # Requests answered at once
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", "32"))  # Requests waiting for a slot before 429s
+SERVER_REQUEST_TIMEOUT = float(os.getenv("SERVER_REQUEST_TIMEOUT", "120"))  # Default per-request deadline (s)
 
 # Currency configuration
 # ---------------------
 CURRENCY = "INR" 
 CURRENCY_SYMBOL = "₹"
 
+# Database connection pool
+# ------------------------
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))  # Connections kept open
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))  # Upper bound on open connections
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "30"))  # Idle seconds before a ping
+DB_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", "3"))  # Reconnect attempts on failure
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))  # Rows per batch for db_setup --import --method values
+
 def get_db_connection():
     """
     Get database connection parameters from environment variables.
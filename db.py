@@ -0,0 +1,331 @@
+"""
+Pooled database access for the Grocery Price Assistant
+
+Every database access in the project goes through the shared connection pool
+in this module instead of opening a fresh psycopg2 connection per call.
+Connections are health-checked before reuse when they have been idle for
+longer than DB_HEALTH_CHECK_INTERVAL seconds, and broken connections are
+discarded and replaced transparently.
+
+psycopg2 is imported on first database access rather than with this module,
+so code that never touches the database does not pay for it.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from config import (get_db_connection, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_HEALTH_CHECK_INTERVAL,
+                    DB_CONNECT_RETRIES)
+
+# Explicit columns with server-side typed conversion (NUMERIC -> float8 arrives as a Python float)
+GROCERY_ITEM_COLUMNS = "id, name, price::float8 AS price, category, unit, currency"
+
+# Days grocery_item_deletions tombstones are kept (db_setup prunes older ones)
+TOMBSTONE_RETENTION_DAYS = 7
+
+
+def connection_errors():
+    """Errors that mean the connection itself is unusable and should be replaced."""
+    import psycopg2
+    return (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 connection pool with health checks and reconnect on failure."""
+
+    def __init__(self, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 health_check_interval=DB_HEALTH_CHECK_INTERVAL, retries=DB_CONNECT_RETRIES, **connect_kwargs):
+        self.connect_kwargs = connect_kwargs or get_db_connection()
+        self.min_size = min_size
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.retries = retries
+        self._pool = None
+        self._last_used = {}  # id(conn) -> monotonic time it was returned to the pool
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        from psycopg2 import pool as pg_pool
+        with self._lock:
+            if self._pool is None or self._pool.closed:
+                self._pool = pg_pool.ThreadedConnectionPool(self.min_size, self.max_size, **self.connect_kwargs)
+            return self._pool
+
+    def _healthy(self, conn):
+        """Ping connections that have been idle for a while; fresh ones are trusted."""
+        if conn.closed:
+            return False
+        idle_since = self._last_used.get(id(conn))
+        if idle_since is None or time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except connection_errors():
+            return False
+
+    def getconn(self):
+        """Check out a healthy connection, replacing broken ones."""
+        import psycopg2
+        from psycopg2 import pool as pg_pool
+        last_error = None
+        for attempt in range(self.retries + 1):
+            try:
+                pool = self._get_pool()
+                conn = pool.getconn()
+            except (pg_pool.PoolError, *connection_errors()) as e:
+                last_error = e
+                time.sleep(min(0.1 * 2 ** attempt, 2.0))
+                continue
+            if self._healthy(conn):
+                return conn
+            # Drop the broken connection; the pool opens a new one on the next getconn
+            self._discard(conn)
+            last_error = psycopg2.OperationalError("connection failed health check")
+        raise last_error
+
+    def putconn(self, conn, broken=False):
+        """Return a connection to the pool, closing it if it is broken."""
+        if broken or conn.closed:
+            self._discard(conn)
+            return
+        self._last_used[id(conn)] = time.monotonic()
+        self._get_pool().putconn(conn)
+
+    def _discard(self, conn):
+        from psycopg2 import pool as pg_pool
+        self._last_used.pop(id(conn), None)
+        try:
+            self._get_pool().putconn(conn, close=True)
+        except pg_pool.PoolError:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for one transaction: committed on success, rolled back
+        on error, and discarded instead of reused if the connection broke.
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except connection_errors():
+            broken = True
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and not self._pool.closed:
+                self._pool.closeall()
+            self._pool = None
+            self._last_used.clear()
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ConnectionPool()
+        return _shared_pool
+
+
+def close_pool():
+    """Close every pooled connection (e.g. before exiting or forking workers)."""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is not None:
+            _shared_pool.close()
+            _shared_pool = None
+
+
+@contextmanager
+def connection():
+    """Borrow a connection from the shared pool for one transaction."""
+    with get_pool().connection() as conn:
+        yield conn
+
+
+def fetch_all(query, params=None):
+    """Run a query on a pooled connection and return the rows as dictionaries."""
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            columns = [desc[0] for desc in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def fetch_grocery_items():
+    """Return every grocery item with explicitly selected, typed columns."""
+    return fetch_all(f"SELECT {GROCERY_ITEM_COLUMNS} FROM grocery_items ORDER BY id;")
+
+
+def fetch_database_time():
+    """Current database time as epoch seconds, used as the catalog sync watermark."""
+    return fetch_all("SELECT extract(epoch FROM now())::float8 AS now;")[0]["now"]
+
+
+def fetch_grocery_item_changes(since):
+    """
+    Return (now, changed_rows, deleted_ids, truncated) for everything changed after
+    the epoch timestamp since, read in one transaction. truncated is True when the
+    whole table was emptied, or since is older than the tombstones kept, and the
+    catalog must be reloaded in full.
+    """
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT extract(epoch FROM now())::float8;")
+            now = cursor.fetchone()[0]
+            if now - since > TOMBSTONE_RETENTION_DAYS * 24 * 60 * 60:
+                # Deletions that old may have been pruned already
+                return now, [], [], True
+
+            cursor.execute(
+                f"SELECT {GROCERY_ITEM_COLUMNS} FROM grocery_items WHERE updated_at > to_timestamp(%s) ORDER BY id;",
+                (since,),
+            )
+            columns = [desc[0] for desc in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+            cursor.execute("SELECT id FROM grocery_item_deletions WHERE deleted_at > to_timestamp(%s);", (since,))
+            deleted = [row[0] for row in cursor.fetchall()]
+
+    truncated = any(item_id is None for item_id in deleted)
+    return now, rows, [item_id for item_id in deleted if item_id is not None], truncated
+
+
+# Items matching each phrase of a question, and the cheapest and dearest items of each category it names,
+# in one round trip. A phrase, as typed or through the synonym table ("dahi" -> "curd"), matches alias
+# table entries and item names exactly (btree indexes); only phrases with no exact match fall back to
+# pg_trgm similarity on the name (trigram index), with the threshold set for this transaction.
+_SEARCH_QUERY = f"""
+SET LOCAL pg_trgm.similarity_threshold = %(min_similarity)s;
+WITH phrases AS (
+    SELECT DISTINCT unnest(%(phrases)s::text[]) AS phrase
+), terms AS (
+    SELECT phrase, phrase AS term FROM phrases
+    UNION
+    SELECT p.phrase, s.canonical FROM phrases p JOIN grocery_synonyms s ON s.term = p.phrase
+), exact AS (
+    SELECT t.phrase, t.term, m.* FROM terms t CROSS JOIN LATERAL (
+        SELECT {GROCERY_ITEM_COLUMNS}, true AS via_alias
+        FROM grocery_item_aliases a JOIN grocery_items g ON g.id = a.item_id
+        WHERE a.alias = t.term
+        UNION
+        SELECT {GROCERY_ITEM_COLUMNS}, t.term <> t.phrase
+        FROM grocery_items
+        WHERE lower(name) = t.term
+        LIMIT %(matches)s
+    ) m
+)
+SELECT phrase, id, name, price, category, unit, currency, 'phrase' AS source, via_alias FROM exact
+UNION ALL
+SELECT t.phrase, m.*, 'phrase', false
+FROM terms t CROSS JOIN LATERAL (
+    SELECT {GROCERY_ITEM_COLUMNS}
+    FROM grocery_items
+    WHERE name %% t.term
+    ORDER BY similarity(name, t.term) DESC
+    LIMIT %(matches)s
+) m
+WHERE t.term = t.phrase AND NOT EXISTS (SELECT 1 FROM exact e WHERE e.phrase = t.phrase)
+UNION ALL
+SELECT NULL, m.*, 'category', false
+FROM unnest(%(categories)s::text[]) c(category) CROSS JOIN LATERAL (
+    (SELECT {GROCERY_ITEM_COLUMNS} FROM grocery_items WHERE category = c.category
+     ORDER BY grocery_items.price LIMIT %(category_rows)s)
+    UNION
+    (SELECT {GROCERY_ITEM_COLUMNS} FROM grocery_items WHERE category = c.category
+     ORDER BY grocery_items.price DESC LIMIT %(category_rows)s)
+) m
+UNION ALL
+SELECT NULL, m.*, 'ranked', false
+FROM unnest(%(probe_categories)s::text[], %(probe_units)s::text[], %(probe_lows)s::numeric[], %(probe_highs)s::numeric[])
+    AS r(category, unit, low, high)
+CROSS JOIN LATERAL (
+    -- Order by the column, not the float8 price it is selected as, to read it off the index;
+    -- prices are non-negative and below DECIMAL(10, 2)'s maximum, so the defaults bound nothing
+    (SELECT {GROCERY_ITEM_COLUMNS} FROM grocery_items
+     WHERE coalesce(category, '') = r.category AND coalesce(unit, '') = r.unit
+       AND price BETWEEN coalesce(r.low, 0) AND coalesce(r.high, 1e9)
+     ORDER BY grocery_items.price LIMIT %(probe_rows)s)
+    UNION
+    (SELECT {GROCERY_ITEM_COLUMNS} FROM grocery_items
+     WHERE coalesce(category, '') = r.category AND coalesce(unit, '') = r.unit
+       AND price BETWEEN coalesce(r.low, 0) AND coalesce(r.high, 1e9)
+     ORDER BY grocery_items.price DESC LIMIT %(probe_rows)s)
+) m;
+"""
+
+
+def search_grocery_items(phrases, categories=(), probes=(), matches=5, min_similarity=0.4, category_rows=25,
+                         probe_rows=1):
+    """
+    Look up the grocery items for many phrases, categories and price probes in a single round trip.
+
+    probes are (category, unit, low, high) tuples, category and unit as in
+    fetch_category_units and either bound None: each reads the probe_rows
+    cheapest and most expensive items of that category and unit priced within
+    the bounds, so ranking and range questions see the rows they would see in
+    the whole catalog. Returns item rows with three extra keys: phrase (None
+    for category and probe rows), source ("phrase", "category" or "ranked")
+    and via_alias, True when the phrase names the item through an alias or synonym.
+    """
+    return fetch_all(_SEARCH_QUERY, {
+        "phrases": list(phrases),
+        "categories": list(categories),
+        "probe_categories": [probe[0] for probe in probes],
+        "probe_units": [probe[1] for probe in probes],
+        "probe_lows": [probe[2] for probe in probes],
+        "probe_highs": [probe[3] for probe in probes],
+        "matches": matches,
+        "min_similarity": min_similarity,
+        "category_rows": category_rows,
+        "probe_rows": probe_rows,
+    })
+
+
+def fetch_category_units():
+    """
+    Every (category, unit) pair in use, "" for a missing one, read by skipping
+    through the category/unit/price index instead of scanning the table.
+    """
+    return [(row["category"], row["unit"]) for row in fetch_all("""
+    WITH RECURSIVE pairs AS (
+        (SELECT coalesce(category, '') AS category, coalesce(unit, '') AS unit FROM grocery_items
+         ORDER BY 1, 2 LIMIT 1)
+        UNION ALL
+        SELECT n.category, n.unit FROM pairs p CROSS JOIN LATERAL (
+            SELECT coalesce(category, '') AS category, coalesce(unit, '') AS unit FROM grocery_items
+            WHERE (coalesce(category, ''), coalesce(unit, '')) > (p.category, p.unit)
+            ORDER BY 1, 2 LIMIT 1
+        ) n
+    )
+    SELECT category, unit FROM pairs;
+    """)]
+
+
+def listen_connection(channel):
+    """
+    Open a dedicated autocommit connection listening on a NOTIFY channel.
+    It is kept out of the pool because it stays blocked waiting for events.
+    """
+    import psycopg2
+    conn = psycopg2.connect(**get_db_connection())
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"LISTEN {channel};")
+    return conn
@@ -1,20 +1,119 @@
+import argparse
+import csv
+import io
+import itertools
+import json
+import sys
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
 import psycopg2
-from config import get_db_connection, CURRENCY, CURRENCY_SYMBOL
+from psycopg2.extras import execute_values
+
+from config import CURRENCY, CURRENCY_SYMBOL, IMPORT_BATCH_SIZE
+from db import TOMBSTONE_RETENTION_DAYS, connection, fetch_grocery_items
+
+# Sample grocery items with prices in INR
+SAMPLE_GROCERY_ITEMS = [
+    ("Milk", 65.00, "Dairy", "1 liter"),
+    ("Bread", 40.00, "Bakery", "1 packet"),
+    ("Eggs", 80.00, "Dairy", "12 count"),
+    ("Apples", 180.00, "Produce", "1 kg"),
+    ("Bananas", 60.00, "Produce", "1 dozen"),
+    ("Chicken Breast", 320.00, "Meat", "1 kg"),
+    ("Rice", 75.00, "Grains", "1 kg bag"),
+    ("Atta (Wheat Flour)", 60.00, "Grains", "1 kg"),
+    ("Tomatoes", 40.00, "Produce", "1 kg"),
+    ("Potatoes", 30.00, "Produce", "1 kg"),
+    ("Onions", 25.00, "Produce", "1 kg"),
+    ("Paneer", 80.00, "Dairy", "200 gm"),
+    ("Curd", 45.00, "Dairy", "500 gm"),
+    ("Tea", 120.00, "Beverages", "250 gm"),
+    ("Sugar", 45.00, "Essentials", "1 kg"),
+    ("Cooking Oil", 180.00, "Essentials", "1 liter"),
+    ("Dal (Lentils)", 110.00, "Pulses", "1 kg"),
+    ("Biscuits", 30.00, "Snacks", "1 packet"),
+    ("Salt", 20.00, "Essentials", "1 kg"),
+    ("Green Chillies", 15.00, "Produce", "100 gm"),
+]
+
+# Names that stand for one specific item (alias, item name)
+SAMPLE_ALIASES = [
+    ("atta", "Atta (Wheat Flour)"),
+    ("gehun ka atta", "Atta (Wheat Flour)"),
+    ("dal", "Dal (Lentils)"),
+    ("hari mirch", "Green Chillies"),
+]
+
+# Everyday words for a kind of item, whichever store's item it is (term, canonical item name)
+SAMPLE_SYNONYMS = [
+    ("dahi", "curd"),
+    ("doodh", "milk"),
+    ("chawal", "rice"),
+    ("aloo", "potatoes"),
+    ("pyaz", "onions"),
+    ("tamatar", "tomatoes"),
+    ("anda", "eggs"),
+    ("chai", "tea"),
+    ("cheeni", "sugar"),
+    ("namak", "salt"),
+]
+
+
+def sample_catalog():
+    """The sample items as catalog rows, for running the app without a database."""
+    return [
+        {"id": item_id, "name": name, "price": Decimal(str(price)), "category": category, "unit": unit,
+         "currency": CURRENCY}
+        for item_id, (name, price, category, unit) in enumerate(SAMPLE_GROCERY_ITEMS, 1)
+    ]
 
 def setup_database():
     """
     Set up the PostgreSQL database with grocery items and their prices in INR.
     
     This function:
-    1. Connects to the PostgreSQL database
+    1. Borrows a connection from the shared pool
     2. Creates the grocery_items table if it doesn't exist
-    3. Populates the table with 20 sample grocery items with prices in INR
+    3. Upserts 20 sample grocery items with prices in INR (keyed on the item name)
+    4. Adds sample aliases and synonyms for the "search" catalog backend
+    
+    Supplier feeds are loaded with import_catalog (python db_setup.py --import feed.csv).
     """
-    # Connect to the database
-    conn = psycopg2.connect(**get_db_connection())
-    conn.autocommit = True
-    cursor = conn.cursor()
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            _create_and_populate(cursor)
 
+    # Verify the data
+    items = fetch_grocery_items()
+    print(f"Inserted {len(items)} grocery items into the database with prices in {CURRENCY}.")
+    
+    # Display a few sample items for verification
+    print("\nSample items:")
+    for item in items[:5]:
+        print(f"{item['name']}: {CURRENCY_SYMBOL}{item['price']} per {item['unit']}")
+    
+    return len(items)
+
+def _create_and_populate(cursor):
+    """Create the grocery_items table and upsert the sample items, aliases and synonyms into it."""
+    create_schema(cursor)
+
+    # Upsert on the item name instead of truncating, so ids and unchanged rows are kept
+    stage_rows(cursor, ((seq, *item, CURRENCY) for seq, item in enumerate(SAMPLE_GROCERY_ITEMS)), method="values")
+    upsert_staged_rows(cursor)
+
+    # Sample aliases and synonyms; existing entries are kept
+    execute_values(cursor, """
+    INSERT INTO grocery_item_aliases (alias, item_id)
+    SELECT a.alias, g.id FROM (VALUES %s) AS a (alias, name) JOIN grocery_items g ON g.name = a.name
+    ON CONFLICT DO NOTHING;
+    """, SAMPLE_ALIASES)
+    execute_values(cursor, "INSERT INTO grocery_synonyms (term, canonical) VALUES %s ON CONFLICT DO NOTHING;",
+                   SAMPLE_SYNONYMS)
+
+def create_schema(cursor):
+    """Create the grocery_items table with its change tracking and search indexes."""
     # Create table for grocery items with price in INR
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS grocery_items (
@@ -27,56 +126,400 @@ def setup_database():
     );
     """)
 
-    # Sample grocery items with prices in INR
-    grocery_items = [
-        ("Milk", 65.00, "Dairy", "1 liter"),
-        ("Bread", 40.00, "Bakery", "1 packet"),
-        ("Eggs", 80.00, "Dairy", "12 count"),
-        ("Apples", 180.00, "Produce", "1 kg"),
-        ("Bananas", 60.00, "Produce", "1 dozen"),
-        ("Chicken Breast", 320.00, "Meat", "1 kg"),
-        ("Rice", 75.00, "Grains", "1 kg bag"),
-        ("Atta (Wheat Flour)", 60.00, "Grains", "1 kg"),
-        ("Tomatoes", 40.00, "Produce", "1 kg"),
-        ("Potatoes", 30.00, "Produce", "1 kg"),
-        ("Onions", 25.00, "Produce", "1 kg"),
-        ("Paneer", 80.00, "Dairy", "200 gm"),
-        ("Curd", 45.00, "Dairy", "500 gm"),
-        ("Tea", 120.00, "Beverages", "250 gm"),
-        ("Sugar", 45.00, "Essentials", "1 kg"),
-        ("Cooking Oil", 180.00, "Essentials", "1 liter"),
-        ("Dal (Lentils)", 110.00, "Pulses", "1 kg"),
-        ("Biscuits", 30.00, "Snacks", "1 packet"),
-        ("Salt", 20.00, "Essentials", "1 kg"),
-        ("Green Chillies", 15.00, "Produce", "100 gm"),
-    ]
+    # Track changes so running assistants can refresh their catalogs incrementally
+    ensure_change_tracking(cursor)
+
+    # Natural key for upserts, plus name (trigram) and category search indexes
+    ensure_search_indexes(cursor)
 
-    # Clear existing data and insert new items
-    cursor.execute("TRUNCATE TABLE grocery_items RESTART IDENTITY;")
+    # Other names for items, used by the "search" catalog backend
+    ensure_alias_tables(cursor)
 
-    for item in grocery_items:
-        cursor.execute(
-            "INSERT INTO grocery_items (name, price, category, unit, currency) VALUES (%s, %s, %s, %s, %s)",
-            (*item, CURRENCY)
+def ensure_change_tracking(cursor):
+    """
+    Add the change tracking used by catalog_sync:
+    - an updated_at column bumped on every insert or update
+    - a grocery_item_deletions tombstone table (a NULL id records a TRUNCATE)
+    - NOTIFY events on the grocery_items_changed channel for every change
+    """
+    cursor.execute("""
+    ALTER TABLE grocery_items ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+    CREATE INDEX IF NOT EXISTS grocery_items_updated_at_idx ON grocery_items (updated_at);
+
+    CREATE TABLE IF NOT EXISTS grocery_item_deletions (
+        id INTEGER,
+        deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE INDEX IF NOT EXISTS grocery_item_deletions_deleted_at_idx ON grocery_item_deletions (deleted_at);
+
+    CREATE OR REPLACE FUNCTION grocery_items_track_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO grocery_item_deletions (id) VALUES (OLD.id);
+            PERFORM pg_notify('grocery_items_changed', 'DELETE:' || OLD.id);
+            RETURN OLD;
+        END IF;
+        NEW.updated_at := now();
+        PERFORM pg_notify('grocery_items_changed', TG_OP || ':' || NEW.id);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION grocery_items_track_truncate() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO grocery_item_deletions (id) VALUES (NULL);
+        PERFORM pg_notify('grocery_items_changed', 'TRUNCATE');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS grocery_items_track_change ON grocery_items;
+    CREATE TRIGGER grocery_items_track_change
+        BEFORE INSERT OR UPDATE OR DELETE ON grocery_items
+        FOR EACH ROW EXECUTE PROCEDURE grocery_items_track_change();
+
+    DROP TRIGGER IF EXISTS grocery_items_track_truncate ON grocery_items;
+    CREATE TRIGGER grocery_items_track_truncate
+        AFTER TRUNCATE ON grocery_items
+        FOR EACH STATEMENT EXECUTE PROCEDURE grocery_items_track_truncate();
+    """)
+    # catalog_sync reloads in full when its last sync is older than this
+    cursor.execute("DELETE FROM grocery_item_deletions WHERE deleted_at < now() - make_interval(days => %s);",
+                   (TOMBSTONE_RETENTION_DAYS,))
+
+def ensure_search_indexes(cursor):
+    """
+    Add the indexes bulk imports and item search rely on:
+    - a unique index on name, the natural key that imports upsert on
+    - an index on lower(name) for exact, case-insensitive item lookups
+    - a trigram (pg_trgm) index on name for fuzzy and substring search
+    - a category index, and category/price and category/unit/price indexes for
+      the cheapest and most expensive items item search reads per category and unit
+    """
+    # Tables created before the unique name index may hold the same name twice
+    cursor.execute("SELECT to_regclass('grocery_items_name_key') IS NULL;")
+    if cursor.fetchone()[0]:
+        duplicates = find_duplicate_names(cursor)
+        if duplicates:
+            listed = ", ".join(f"{name} ({count} rows)" for name, count in duplicates[:10])
+            more = f" and {len(duplicates) - 10:,} more" if len(duplicates) > 10 else ""
+            raise ValueError(f"Cannot add the unique index on grocery_items.name, these names are duplicated: "
+                             f"{listed}{more}. Delete or rename the extra rows and run the setup again.")
+
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS grocery_items_name_key ON grocery_items (name);
+    CREATE INDEX IF NOT EXISTS grocery_items_name_lower_idx ON grocery_items (lower(name));
+    CREATE INDEX IF NOT EXISTS grocery_items_category_idx ON grocery_items (category);
+    CREATE INDEX IF NOT EXISTS grocery_items_category_price_idx ON grocery_items (category, price);
+    CREATE INDEX IF NOT EXISTS grocery_items_category_unit_price_idx
+        ON grocery_items ((coalesce(category, '')), (coalesce(unit, '')), price);
+    """)
+
+    # pg_trgm may not be installable without superuser rights; the rest of the setup still works
+    cursor.execute("SAVEPOINT trigram_index;")
+    try:
+        cursor.execute("""
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS grocery_items_name_trgm_idx ON grocery_items USING gin (name gin_trgm_ops);
+        """)
+        cursor.execute("RELEASE SAVEPOINT trigram_index;")
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT trigram_index;")
+        print(f"Skipping trigram name index (pg_trgm unavailable): {str(e).strip()}")
+
+def find_duplicate_names(cursor):
+    """(name, row count) for every item name held by more than one row, most repeated first."""
+    cursor.execute("""
+    SELECT name, count(*) FROM grocery_items GROUP BY name HAVING count(*) > 1 ORDER BY count(*) DESC, name;
+    """)
+    return cursor.fetchall()
+
+def ensure_alias_tables(cursor):
+    """
+    Add the lookup tables the "search" catalog backend (catalog_search.py) matches
+    question phrases against, both keyed on lowercase, space-separated words:
+    - grocery_item_aliases: a name that stands for specific items ("atta" -> Atta (Wheat Flour))
+    - grocery_synonyms: a word for a kind of item, searched as its canonical name ("dahi" -> "curd")
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS grocery_item_aliases (
+        alias VARCHAR(100) NOT NULL,
+        item_id INTEGER NOT NULL REFERENCES grocery_items (id) ON DELETE CASCADE,
+        PRIMARY KEY (alias, item_id)
+    );
+    CREATE TABLE IF NOT EXISTS grocery_synonyms (
+        term VARCHAR(100) PRIMARY KEY,
+        canonical VARCHAR(100) NOT NULL
+    );
+    """)
+
+# Bulk catalog import
+# -------------------
+# Feeds are streamed into a temporary staging table (COPY or batched
+# execute_values), diffed against grocery_items and upserted on the item name.
+
+IMPORT_COLUMNS = ("name", "price", "category", "unit", "currency")
+IMPORT_FORMATS = ("csv", "jsonl")
+IMPORT_METHODS = ("copy", "values")
+# grocery_items.price is DECIMAL(10, 2): two decimal places, below 10^8
+PRICE_STEP = Decimal("0.01")
+MAX_PRICE = Decimal(10) ** 8
+
+def read_feed(path, file_format=None):
+    """
+    Yield the records of a CSV (with a header row) or JSONL supplier feed as
+    dictionaries. path "-" reads standard input; the format defaults to the
+    file extension.
+    """
+    if file_format is None:
+        file_format = "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown feed format '{file_format}', expected one of {IMPORT_FORMATS}")
+
+    handle = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if file_format == "csv":
+            yield from csv.DictReader(handle)
+        else:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+def normalize_records(records, errors):
+    """
+    Yield (seq, name, price, category, unit, currency) rows for valid records.
+    Invalid records are skipped and described in the errors list.
+    """
+    for seq, record in enumerate(records, 1):
+        try:
+            name = (record.get("name") or "").strip()
+            if not name:
+                raise ValueError("missing name")
+            try:
+                price = Decimal(str(record.get("price", "")).strip().lstrip(CURRENCY_SYMBOL))
+            except ArithmeticError:
+                price = None
+            if price is None or not price.is_finite() or price < 0:
+                raise ValueError(f"invalid price {record.get('price')!r}")
+            # Round like Postgres does when storing into DECIMAL(10, 2), then check it fits
+            if price < MAX_PRICE:
+                price = price.quantize(PRICE_STEP, rounding=ROUND_HALF_UP)
+            if price >= MAX_PRICE:
+                raise ValueError(f"price {record.get('price')!r} does not fit DECIMAL(10, 2)")
+            currency = (record.get("currency") or CURRENCY).strip().upper()
+            category = (record.get("category") or "").strip() or None
+            unit = (record.get("unit") or "").strip() or None
+            if len(name) > 100 or len(category or "") > 50 or len(unit or "") > 20 or len(currency) != 3:
+                raise ValueError("value too long for its column")
+            yield (
+                seq,
+                name,
+                price,
+                category,
+                unit,
+                currency,
+            )
+        except (ValueError, ArithmeticError, AttributeError) as e:
+            errors.append(f"record {seq}: {str(e)}")
+
+class _CopyStream:
+    """File-like object that renders rows as CSV on demand, so COPY streams without a temporary file."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self.rows = 0
+
+    def read(self, size=-1):
+        target = size if size and size > 0 else 1 << 20
+        while self._buffer.tell() < target:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self.rows += 1
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffer.write(data[target:])
+        return data[:target]
+
+def stage_rows(cursor, rows, method="copy", batch_size=IMPORT_BATCH_SIZE):
+    """Load (seq, name, price, category, unit, currency) rows into a temporary staging table. Returns the row count."""
+    if method not in IMPORT_METHODS:
+        raise ValueError(f"Unknown import method '{method}', expected one of {IMPORT_METHODS}")
+    cursor.execute("""
+    CREATE TEMP TABLE IF NOT EXISTS grocery_items_import (
+        seq BIGINT,
+        name VARCHAR(100) NOT NULL,
+        price DECIMAL(10, 2) NOT NULL,
+        category VARCHAR(50),
+        unit VARCHAR(20),
+        currency VARCHAR(3)
+    ) ON COMMIT DROP;
+    """)
+
+    if method == "copy":
+        stream = _CopyStream(rows)
+        cursor.copy_expert(
+            "COPY grocery_items_import (seq, name, price, category, unit, currency) FROM STDIN WITH (FORMAT csv)",
+            stream,
+            size=1 << 16,
         )
+        staged = stream.rows
+    else:
+        staged = 0
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            execute_values(
+                cursor,
+                "INSERT INTO grocery_items_import (seq, name, price, category, unit, currency) VALUES %s",
+                batch,
+                page_size=batch_size,
+            )
+            staged += len(batch)
 
-    # Verify the data
-    cursor.execute("SELECT * FROM grocery_items;")
-    items = cursor.fetchall()
-    print(f"Inserted {len(items)} grocery items into the database with prices in {CURRENCY}.")
-    
-    # Display a few sample items for verification
-    print("\nSample items:")
-    for i in range(min(5, len(items))):
-        print(f"{items[i][1]}: {CURRENCY_SYMBOL}{items[i][2]} per {items[i][4]}")
+    cursor.execute("CREATE INDEX ON grocery_items_import (name, seq); ANALYZE grocery_items_import;")
+    return staged
 
-    # Close the connection
-    cursor.close()
-    conn.close()
-    
-    return len(items)
+# The last occurrence of a name in the feed wins
+_STAGED_FEED = """
+    SELECT DISTINCT ON (name) name, price, category, unit, currency
+    FROM grocery_items_import
+    ORDER BY name, seq DESC
+"""
+
+_ROW_DIFFERS = """
+    (g.price, g.category, g.unit, g.currency) IS DISTINCT FROM (f.price, f.category, f.unit, f.currency)
+"""
+
+def diff_staged_rows(cursor, sample_size=10):
+    """
+    Compare the staging table with grocery_items. Returns counts of new,
+    changed, unchanged and missing (in the table but not in the feed) items,
+    with a few examples of new and changed items.
+    """
+    cursor.execute(f"""
+    WITH feed AS ({_STAGED_FEED})
+    SELECT
+        count(*) FILTER (WHERE g.id IS NULL),
+        count(*) FILTER (WHERE g.id IS NOT NULL AND {_ROW_DIFFERS}),
+        count(*) FILTER (WHERE g.id IS NOT NULL AND NOT {_ROW_DIFFERS})
+    FROM feed f LEFT JOIN grocery_items g ON g.name = f.name;
+    """)
+    new, changed, unchanged = cursor.fetchone()
+
+    cursor.execute("""
+    SELECT count(*) FROM grocery_items g
+    WHERE NOT EXISTS (SELECT 1 FROM grocery_items_import i WHERE i.name = g.name);
+    """)
+    missing = cursor.fetchone()[0]
+
+    cursor.execute(f"""
+    WITH feed AS ({_STAGED_FEED})
+    SELECT f.name, g.price, f.price, g.unit, f.unit, g.category, f.category
+    FROM feed f LEFT JOIN grocery_items g ON g.name = f.name
+    WHERE g.id IS NULL OR {_ROW_DIFFERS}
+    ORDER BY g.id IS NULL, f.name
+    LIMIT %s;
+    """, (sample_size,))
+    samples = cursor.fetchall()
+
+    return {"new": new, "changed": changed, "unchanged": unchanged, "missing": missing, "samples": samples}
+
+def upsert_staged_rows(cursor):
+    """
+    Upsert the staging table into grocery_items on the item name. Rows whose
+    values did not change are left untouched, so their updated_at (and the
+    running assistants' catalogs) are not disturbed. Returns the rows written.
+    """
+    cursor.execute(f"""
+    INSERT INTO grocery_items (name, price, category, unit, currency)
+    {_STAGED_FEED}
+    ON CONFLICT (name) DO UPDATE SET
+        price = EXCLUDED.price,
+        category = EXCLUDED.category,
+        unit = EXCLUDED.unit,
+        currency = EXCLUDED.currency
+    WHERE (grocery_items.price, grocery_items.category, grocery_items.unit, grocery_items.currency)
+        IS DISTINCT FROM (EXCLUDED.price, EXCLUDED.category, EXCLUDED.unit, EXCLUDED.currency);
+    """)
+    return cursor.rowcount
+
+def import_catalog(path, file_format=None, method="copy", batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+    """
+    Bulk import a CSV or JSONL supplier feed into grocery_items.
+
+    Records are streamed into a staging table, compared with the current
+    catalog and upserted on the item name in one transaction. With dry_run the
+    diff is printed and the transaction is rolled back instead.
+    """
+    errors = []
+    start = time.perf_counter()
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            create_schema(cursor)
+            staged = stage_rows(cursor, normalize_records(read_feed(path, file_format), errors), method, batch_size)
+            load_seconds = time.perf_counter() - start
+            diff = diff_staged_rows(cursor)
+            written = 0
+            if dry_run:
+                conn.rollback()
+            else:
+                written = upsert_staged_rows(cursor)
+    seconds = time.perf_counter() - start
+
+    print(f"{'Dry run: ' if dry_run else ''}read {staged + len(errors):,} records, "
+          f"staged {staged:,} via {method} in {load_seconds:.2f}s ({staged / max(load_seconds, 1e-9):,.0f} rows/s)")
+    for error in errors[:10]:
+        print(f"  skipped {error}")
+    if len(errors) > 10:
+        print(f"  ... and {len(errors) - 10:,} more invalid records")
+    print(f"New: {diff['new']:,}  Changed: {diff['changed']:,}  Unchanged: {diff['unchanged']:,}  "
+          f"In database but not in feed: {diff['missing']:,}")
+    for name, old_price, new_price, old_unit, new_unit, old_category, new_category in diff["samples"]:
+        if old_price is None:
+            print(f"  + {name}: {CURRENCY_SYMBOL}{new_price} per {new_unit} ({new_category})")
+        else:
+            print(f"  ~ {name}: {CURRENCY_SYMBOL}{old_price} per {old_unit} ({old_category})"
+                  f" -> {CURRENCY_SYMBOL}{new_price} per {new_unit} ({new_category})")
+    if not dry_run:
+        print(f"Upserted {written:,} rows in {seconds:.2f}s ({staged / max(seconds, 1e-9):,.0f} rows/s overall)")
+
+    return {
+        "records": staged + len(errors),
+        "staged": staged,
+        "skipped": len(errors),
+        "written": written,
+        "seconds": seconds,
+        "rows_per_second": staged / max(seconds, 1e-9),
+        **{key: diff[key] for key in ("new", "changed", "unchanged", "missing")},
+    }
 
 if __name__ == "__main__":
-    print(f"Setting up database with grocery prices in {CURRENCY}...")
-    num_items = setup_database()
-    print(f"Database setup complete with {num_items} grocery items.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Set up the grocery database or bulk import a supplier feed")
+    parser.add_argument("--import", dest="feed", metavar="PATH",
+                        help="CSV or JSONL feed to upsert ('-' for standard input) instead of the sample items")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="Feed format (default: from the file extension)")
+    parser.add_argument("--method", choices=IMPORT_METHODS, default="copy",
+                        help="Stream with COPY or batched execute_values")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Rows per execute_values batch")
+    parser.add_argument("--dry-run", action="store_true", help="Only show what the import would change")
+    args = parser.parse_args()
+
+    try:
+        if args.feed:
+            import_catalog(args.feed, args.format, args.method, args.batch_size, args.dry_run)
+        else:
+            print(f"Setting up database with grocery prices in {CURRENCY}...")
+            num_items = setup_database()
+            print(f"Database setup complete with {num_items} grocery items.")
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
\ No newline at end of file
@@ -0,0 +1,360 @@
+"""
+Local stand-in for the Ollama HTTP API, for benchmarks and tests
+
+FakeOllamaServer answers /api/chat (streamed or not) in one of three modes:
+- "stub": deterministic replies built from the prompt: prices of the catalog
+  items named in the query, JSON for the classifier and routed chains
+- "record": forwards every request to a real Ollama server and appends the
+  reply to a JSONL recording
+- "replay": serves replies from a recording, keyed by a hash of the model,
+  messages and format; requests missing from it get a stub reply and are
+  counted as misses
+
+Stub and replay replies can simulate model latency (load, prefill per prompt
+token not shared with the previous prompt, decode per generated token), and
+every reply reports prompt_eval_count / eval_count like Ollama does.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import OLLAMA_BASE_URL
+
+MODES = ("stub", "record", "replay")
+
+_CATALOG_RE = re.compile(r"\[\{.*?\}\]", re.DOTALL)
+_QUESTION_RE = re.compile(r"(?:User query|The user's query is):\s*(.+)")
+_THINK_SECTION_RE = re.compile(r"<think>.*?</think>\s*", re.DOTALL)
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token) for text that was not tokenized."""
+    return max(1, len(text) // 4)
+
+
+def request_key(body):
+    """Stable key of a chat request: same model, messages and format give the same key."""
+    payload = {"model": body.get("model"), "messages": body.get("messages", []), "format": body.get("format")}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _prompt_catalog(messages):
+    """The first JSON list of items found in the prompt."""
+    for message in messages:
+        match = _CATALOG_RE.search(message.get("content", ""))
+        if match:
+            try:
+                return json.loads(match.group(0))
+            except ValueError:
+                pass
+    return []
+
+
+def _mentioned_items(question, catalog):
+    """Catalog items whose name (without any parenthesised part, singular or plural) appears in the question."""
+    question = question.lower()
+    found = []
+    for item in catalog:
+        name = item.get("name", "").lower()
+        base = name.split(" (")[0]
+        if any(candidate and re.search(rf"\b{re.escape(candidate)}\b", question)
+               for candidate in {name, base, base.rstrip("s")}):
+            found.append(item)
+    return found
+
+
+def stub_reply(messages):
+    """Deterministic reply to a chat prompt from one of the app's chains."""
+    human = messages[-1].get("content", "") if messages else ""
+    match = _QUESTION_RE.search(human)
+    question = match.group(1).strip() if match else human
+    items = _mentioned_items(question, _prompt_catalog(messages))
+    answer = "\n".join(f"{item['name']} costs ₹{item['price']:g} per {item.get('unit')}" for item in items)
+    answer = answer or "I could not find that item in the grocery items database."
+    query_type = "price_query" if items else "unknown"
+
+    if "answer it in a single response" in human:
+        return json.dumps({"type": query_type, "items": [], "answer": answer})
+    if "classify the user's grocery-related query" in human:
+        return json.dumps({"type": query_type, "explanation": "Stub classification"})
+    return f"<think>\nLooking up the items in the database.\n</think>\n\n{answer}"
+
+
+class FakeOllamaServer:
+    """Threaded HTTP server speaking the subset of the Ollama API that ChatOllama uses."""
+
+    def __init__(self, mode="stub", recording=None, upstream=OLLAMA_BASE_URL, host="127.0.0.1", port=0,
+                 load_seconds=0.0, prefill_seconds_per_token=0.0, decode_seconds_per_token=0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+        if mode != "stub" and not recording:
+            raise ValueError(f"Mode '{mode}' needs a recording file")
+        self.mode = mode
+        self.recording = recording
+        self.upstream = upstream.rstrip("/")
+        self.load_seconds = load_seconds
+        self.prefill_seconds_per_token = prefill_seconds_per_token
+        self.decode_seconds_per_token = decode_seconds_per_token
+        self.requests = 0
+        self.misses = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self._recorded = {}
+        self._loaded = False
+        self._last_prompt = ""
+        self._lock = threading.Lock()
+        if mode == "replay":
+            self._recorded = self._read_recording(recording)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve requests in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        """Request and token counters since the server started."""
+        return {
+            "mode": self.mode,
+            "requests": self.requests,
+            "misses": self.misses,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+    @staticmethod
+    def _read_recording(path):
+        recorded = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        recorded[entry["key"]] = entry
+        return recorded
+
+    def _record(self, entry):
+        with self._lock:
+            with open(self.recording, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _forward(self, body):
+        """Ask the real Ollama server for a complete (non-streamed) reply."""
+        request = urllib.request.Request(
+            f"{self.upstream}/api/chat",
+            data=json.dumps({**body, "stream": False}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    @staticmethod
+    def hit_token_limit(body, completion_tokens):
+        """Whether generation stopped at the request's num_predict."""
+        num_predict = (body.get("options") or {}).get("num_predict")
+        return num_predict is not None and 0 <= num_predict <= completion_tokens
+
+    def reply(self, body):
+        """
+        The reply to a chat request as (content, prompt tokens, completion tokens,
+        seconds to wait before the first token, seconds per generated token).
+        """
+        messages = body.get("messages", [])
+        prompt = "".join(message.get("content", "") for message in messages)
+
+        if self.mode == "record":
+            result = self._forward(body)
+            content = result.get("message", {}).get("content", "")
+            prompt_tokens = result.get("prompt_eval_count") or estimate_tokens(prompt)
+            completion_tokens = result.get("eval_count") or estimate_tokens(content)
+            self._record({"key": request_key(body), "model": body.get("model"), "content": content,
+                          "prompt_eval_count": prompt_tokens, "eval_count": completion_tokens})
+            with self._lock:
+                self.requests += 1
+                self.prompt_tokens += prompt_tokens
+                self.completion_tokens += completion_tokens
+            return content, prompt_tokens, completion_tokens, 0.0, 0.0
+
+        entry = self._recorded.get(request_key(body)) if self.mode == "replay" else None
+        if entry is not None:
+            content = entry["content"]
+            prompt_tokens, completion_tokens = entry["prompt_eval_count"], entry["eval_count"]
+        else:
+            content = stub_reply(messages)
+            if body.get("think") is False:
+                # Like think=false: the model answers without a reasoning section
+                content = _THINK_SECTION_RE.sub("", content)
+            prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(content)
+        num_predict = (body.get("options") or {}).get("num_predict")
+        if num_predict is not None and num_predict >= 0 and completion_tokens > num_predict:
+            # Generation stops at the token limit, as with Ollama's num_predict option
+            content = content[:num_predict * 4]
+            completion_tokens = num_predict
+
+        with self._lock:
+            # Like Ollama, only the part of the prompt not shared with the previous one is prefilled
+            shared = len(os.path.commonprefix([self._last_prompt, prompt]))
+            cached_tokens = min(shared // 4, prompt_tokens)
+            delay = (prompt_tokens - cached_tokens) * self.prefill_seconds_per_token
+            if not self._loaded:
+                delay += self.load_seconds
+                self._loaded = True
+            self._last_prompt = prompt
+            self.requests += 1
+            self.misses += self.mode == "replay" and entry is None
+            self.prompt_tokens += prompt_tokens
+            self.cached_prompt_tokens += cached_tokens
+            self.completion_tokens += completion_tokens
+        return content, prompt_tokens, completion_tokens, delay, self.decode_seconds_per_token
+
+    def unload(self):
+        """Forget the loaded model and cached prompt, as keep_alive=0 does."""
+        with self._lock:
+            self._loaded = False
+            self._last_prompt = ""
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                if self.path.startswith("/api/version"):
+                    self._send_json({"version": "0.0.0-fake"})
+                elif self.path.startswith("/api/tags") or self.path.startswith("/api/ps"):
+                    self._send_json({"models": []})
+                else:
+                    self._send_json({"status": "ok"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.startswith("/api/chat"):
+                    self._chat(body)
+                elif self.path.startswith("/api/generate"):
+                    self._generate(body)
+                else:
+                    self._send_json({"error": f"{self.path} is not supported by the fake server"}, status=404)
+
+            def _generate(self, body):
+                # Only used to load or unload the model (no prompt)
+                if body.get("keep_alive") == 0:
+                    server.unload()
+                self._send_json({"model": body.get("model"), "created_at": _now(), "response": "",
+                                 "done": True, "done_reason": "unload" if body.get("keep_alive") == 0 else "load"})
+
+            def _chat(self, body):
+                start = time.perf_counter()
+                try:
+                    content, prompt_tokens, completion_tokens, delay, per_token = server.reply(body)
+                except Exception as e:
+                    self._send_json({"error": str(e)}, status=500)
+                    return
+                time.sleep(delay)
+                prefilled = time.perf_counter()
+                model = body.get("model")
+                tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+
+                if body.get("stream", True):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    try:
+                        for token in tokens:
+                            time.sleep(per_token)
+                            self._write_chunk({"model": model, "created_at": _now(),
+                                               "message": {"role": "assistant", "content": token}, "done": False})
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client stopped reading, e.g. when a generation budget cut the stream short
+                        return
+                    content = ""
+                else:
+                    time.sleep(per_token * len(tokens))
+
+                final = {
+                    "model": model, "created_at": _now(),
+                    "message": {"role": "assistant", "content": content},
+                    "done": True, "done_reason": "length" if server.hit_token_limit(body, completion_tokens) else "stop",
+                    "total_duration": int((time.perf_counter() - start) * 1e9),
+                    "load_duration": 0,
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int((prefilled - start) * 1e9),
+                    "eval_count": completion_tokens,
+                    "eval_duration": int((time.perf_counter() - prefilled) * 1e9),
+                }
+                if body.get("stream", True):
+                    self._write_chunk(final)
+                    self.wfile.write(b"0\r\n\r\n")
+                else:
+                    self._send_json(final)
+
+            def _write_chunk(self, payload):
+                data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Ollama API")
+    parser.add_argument("--mode", default="stub", choices=MODES)
+    parser.add_argument("--recording", help="JSONL file written in record mode and read in replay mode")
+    parser.add_argument("--upstream", default=OLLAMA_BASE_URL, help="Real Ollama server for record mode")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="Simulated model load time")
+    parser.add_argument("--prefill-ms", type=float, default=0.0, help="Simulated prefill time per prompt token")
+    parser.add_argument("--decode-ms", type=float, default=0.0, help="Simulated time per generated token")
+    args = parser.parse_args()
+    fake = FakeOllamaServer(args.mode, args.recording, args.upstream, port=args.port, load_seconds=args.load_seconds,
+                            prefill_seconds_per_token=args.prefill_ms / 1000,
+                            decode_seconds_per_token=args.decode_ms / 1000)
+    print(f"Fake Ollama ({args.mode}) listening on {fake.base_url}")
+    fake.start()
+    try:
+        fake._thread.join()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,121 @@
+"""
+Per-chain generation budgets for the Grocery Price Assistant
+
+Each chain built in create_app gets a GenerationBudget from
+GENERATION_BUDGETS: the most tokens its answer may take, stop sequences and
+how much the model may reason first. Lookup-style chains (price, category,
+classifier) run with reasoning off, so deepseek-r1 does not spend hundreds of
+<think> tokens finding "Milk" in a 20-row list; the others get a reasoning
+cap.
+
+The budget is passed to Ollama as num_predict (answer tokens plus the
+reasoning cap) and stop, and guard() sits between the model and the output
+parser. It raises BudgetExceeded when Ollama stops at num_predict, or, while
+streaming, as soon as the reasoning passes its cap (which also stops the
+generation). create_app catches it and answers deterministically from the
+catalog instead of returning a truncated answer.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional, Union
+
+from config import GENERATION_BUDGETS
+
+# Enough characters to see a <think> tag split across streamed chunks
+_TAG_WINDOW = 16
+
+
+class BudgetExceeded(Exception):
+    """
+    A chain used up its generation budget; reason is "max_tokens" or "reasoning".
+    thinking tells whether the output stopped inside a <think> section.
+    """
+
+    def __init__(self, chain, reason, thinking=False):
+        super().__init__(f"{chain} exceeded its {reason} budget")
+        self.chain = chain
+        self.reason = reason
+        self.thinking = thinking
+
+
+@dataclass
+class GenerationBudget:
+    """Generation limits for one chain."""
+    chain: str
+    max_tokens: Optional[int] = None
+    # False: no reasoning, True: unlimited, a number: most reasoning tokens allowed
+    reasoning: Union[bool, int] = True
+    stop: List[str] = field(default_factory=list)
+
+    @classmethod
+    def for_chain(cls, chain, budgets=None):
+        """The budget configured for a chain in GENERATION_BUDGETS (unlimited if absent)."""
+        settings = (GENERATION_BUDGETS if budgets is None else budgets).get(chain, {})
+        return cls(chain, settings.get("max_tokens"), settings.get("reasoning", True), list(settings.get("stop") or []))
+
+    @property
+    def reasoning_cap(self):
+        if isinstance(self.reasoning, bool):
+            return 0 if self.reasoning is False else None
+        return int(self.reasoning)
+
+    @property
+    def num_predict(self):
+        """Ollama's limit on all generated tokens, reasoning included (None when reasoning is unlimited)."""
+        if self.max_tokens is None or self.reasoning_cap is None:
+            return None
+        return self.max_tokens + self.reasoning_cap
+
+    def model_options(self):
+        """ChatOllama settings enforcing this budget."""
+        options = {}
+        if self.num_predict is not None:
+            options["num_predict"] = self.num_predict
+        if self.stop:
+            options["stop"] = self.stop
+        if self.reasoning is False:
+            # Ollama's think=false: thinking models answer directly
+            options["reasoning"] = False
+        return options
+
+    def guard(self):
+        """Runnable passing model output through, raising BudgetExceeded on an overrun."""
+        from langchain_core.runnables import RunnableGenerator
+
+        def transform(messages):
+            watch = _BudgetWatch(self)
+            for message in messages:
+                watch.check(message)
+                yield message
+
+        async def atransform(messages):
+            watch = _BudgetWatch(self)
+            async for message in messages:
+                watch.check(message)
+                yield message
+
+        return RunnableGenerator(transform, atransform, name=f"budget.{self.chain}")
+
+
+class _BudgetWatch:
+    """Counts streamed reasoning chunks (about one token each) and spots num_predict stops."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.cap = budget.reasoning_cap
+        self.tail = ""
+        self.thinking = False
+        self.reasoning_tokens = 0
+
+    def check(self, message):
+        content = message.content if isinstance(message.content, str) else ""
+        self.tail = (self.tail + content)[-_TAG_WINDOW:]
+        if "</think>" in self.tail:
+            self.thinking = False
+        elif "<think>" in self.tail:
+            self.thinking = True
+        if self.cap and ((self.thinking and content) or message.additional_kwargs.get("reasoning_content")):
+            self.reasoning_tokens += 1
+            if self.reasoning_tokens > self.cap:
+                raise BudgetExceeded(self.budget.chain, "reasoning", thinking=True)
+        if (message.response_metadata or {}).get("done_reason") == "length":
+            raise BudgetExceeded(self.budget.chain, "max_tokens", thinking=self.thinking)
@@ -1,13 +1,23 @@
 import os
 import sys
 import re
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
 import tempfile
 import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-# Import main application functionality
-from main import create_app
-from config import CURRENCY, CURRENCY_SYMBOL
+from config import (CURRENCY, CURRENCY_SYMBOL, RECEIPT_RENDERER, RECEIPT_RENDERERS, RECEIPT_WORKERS,
+                    MAX_CONCURRENCY)
+from receipt_renderer import OUTPUT_FORMATS, render_receipt
+from telemetry import span
+from units import format_number
 
 def clean_response(text):
     """Remove thinking sections and tidy up the receipt content."""
@@ -19,19 +29,76 @@ def clean_response(text):
     
     return cleaned.strip()
 
-def generate_receipt(grocery_query):
-    """Generate a receipt based on the user's grocery query."""
+def unique_receipt_name(order_id=None):
+    """
+    Base file name for a receipt that cannot collide with another receipt, even
+    when many are generated in the same second or by several processes.
+    """
+    label = re.sub(r'[^A-Za-z0-9_-]+', '-', str(order_id)).strip('-') if order_id else ""
+    stamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    return f"receipt_{label or stamp}_{uuid.uuid4().hex[:8]}"
+
+def _amount(value):
+    return f"{CURRENCY_SYMBOL}{format_number(str(value))}"
+
+def format_items(shopping_list):
+    """Receipt body for a structured ShoppingList: line items, calculations and total."""
+    lines = [
+        "| Item | Quantity | Unit Price | Amount |",
+        "|------|----------|------------|--------|",
+    ]
+    for item in shopping_list.items:
+        lines.append(f"| {item.name} | {format_number(str(item.quantity))} {item.unit} | "
+                     f"{_amount(item.unit_price)} | {_amount(item.amount)} |")
+    lines.append("")
+    lines.append("Calculations:")
+    for item in shopping_list.items:
+        lines.append(f"- {item.calculation}")
+    lines.append("")
+    lines.append(f"**{'Subtotal' if shopping_list.unresolved else 'Total'}: {_amount(shopping_list.total)}**")
+    if shopping_list.unresolved:
+        lines.append("")
+        lines.append(f"Could not price: {', '.join(shopping_list.unresolved)}")
+    return "\n".join(lines)
+
+def receipt_content(grocery_query, get_answer):
+    """
+    The receipt body for a query: the structured shopping list when the app can
+    price one locally, otherwise the text answer.
+    """
+    shopping_list = get_answer.shopping_list(grocery_query)
+    if shopping_list is not None:
+        return format_items(shopping_list)
+    return get_answer(grocery_query)
+
+async def areceipt_content(grocery_query, get_answer):
+    """Async variant of receipt_content."""
+    shopping_list = await get_answer.ashopping_list(grocery_query)
+    if shopping_list is not None:
+        return format_items(shopping_list)
+    return await get_answer.aget_answer(grocery_query)
+
+def generate_receipt(grocery_query, get_answer=None):
+    """
+    Generate a receipt based on the user's grocery query. Pass an existing
+    get_answer (from create_app) to avoid rebuilding the app per receipt.
+    """
     # Use the main application's answer generation
-    get_answer = create_app()
-    receipt_content = get_answer(grocery_query)
-    
+    if get_answer is None:
+        from main import create_app
+        get_answer = create_app()
+    return build_receipt(receipt_content(grocery_query, get_answer))
+
+def build_receipt(receipt_content, receipt_number=None):
+    """Wrap an answer in the receipt header and footer."""
     # Clean the content to remove thinking sections
     cleaned_content = clean_response(receipt_content)
     
     # Improve the receipt with additional formatting
     current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     store_name = "GroceryMart"
-    receipt_number = datetime.now().strftime("%Y%m%d%H%M%S")
+    if receipt_number is None:
+        receipt_number = datetime.now().strftime("%Y%m%d%H%M%S")
     
     enhanced_receipt = f"""
 # {store_name} - Receipt #{receipt_number}
@@ -108,12 +175,14 @@ def generate_png_with_markitdown(markdown_text, output_path=None):
                         '-o',
                         f"{temp_output}.pdf"
                     ]
-                    subprocess.run(md_to_pdf_cmd, check=True)
+                    with span("receipt.pandoc"):
+                        subprocess.run(md_to_pdf_cmd, check=True)
                     
                     # Convert PDF to PNG
                     from pdf2image import convert_from_path
-                    images = convert_from_path(f"{temp_output}.pdf", dpi=300)
-                    images[0].save(output_path)
+                    with span("receipt.pdf2image"):
+                        images = convert_from_path(f"{temp_output}.pdf", dpi=300)
+                        images[0].save(output_path)
                     
                     print(f"Receipt saved as PNG: {output_path}")
                     return output_path
@@ -145,12 +214,14 @@ def generate_png_with_markitdown(markdown_text, output_path=None):
                         '-o',
                         f"{temp_output}.pdf"
                     ]
-                    subprocess.run(md_to_pdf_cmd, check=True)
+                    with span("receipt.pandoc"):
+                        subprocess.run(md_to_pdf_cmd, check=True)
                     
                     # Convert PDF to PNG
                     from pdf2image import convert_from_path
-                    images = convert_from_path(f"{temp_output}.pdf", dpi=300)
-                    images[0].save(output_path)
+                    with span("receipt.pdf2image"):
+                        images = convert_from_path(f"{temp_output}.pdf", dpi=300)
+                        images[0].save(output_path)
                     
                     print(f"Receipt saved as PNG (with 'Rs.' instead of ₹): {output_path}")
                     return output_path
@@ -170,14 +241,154 @@ def generate_png_with_markitdown(markdown_text, output_path=None):
         print(f"Error generating PNG: {str(e)}")
         return None
 
+def save_receipt(markdown_text, output_path, output_format="png", renderer=RECEIPT_RENDERER):
+    """
+    Render a receipt to output_path. The native Pillow renderer draws PNG, PDF
+    or plain text in process; the "pandoc" renderer uses the original
+    pandoc + xelatex + pdf2image pipeline (PNG only).
+    """
+    if renderer not in RECEIPT_RENDERERS:
+        raise ValueError(f"Unknown receipt renderer '{renderer}', expected one of {RECEIPT_RENDERERS}")
+    if renderer == "pandoc":
+        if output_format != "png":
+            raise ValueError("The pandoc renderer only produces PNG receipts")
+        return generate_png_with_markitdown(markdown_text, output_path)
+    
+    try:
+        with span("receipt.render", format=output_format):
+            output_path = render_receipt(markdown_text, output_path, output_format)
+        print(f"Receipt saved as {output_format.upper()}: {output_path}")
+        return output_path
+    except Exception as e:
+        print(f"Error rendering receipt: {str(e)}")
+        return None
+
+def read_orders(path):
+    """
+    Read batch orders from a JSONL file ("-" for standard input). Each line is
+    either a JSON string holding the query or an object with a "query" and an
+    optional "id".
+    """
+    handle = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        orders = []
+        for line_number, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"query": record}
+            if not str(record.get("query", "")).strip():
+                print(f"Skipping line {line_number}: no query")
+                continue
+            orders.append({"id": record.get("id"), "query": record["query"]})
+        return orders
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+def _render_job(markdown_text, base_path, output_format, renderer):
+    """Write one receipt's markdown and rendered file. Runs in a worker process."""
+    with open(f"{base_path}.md", 'w', encoding='utf-8') as f:
+        f.write(markdown_text)
+    start = time.perf_counter()
+    output_path = save_receipt(markdown_text, base_path, output_format, renderer)
+    return output_path, time.perf_counter() - start
+
+async def _process_orders(get_answer, orders, output_dir, output_format, renderer, concurrency, pool):
+    """Answer orders concurrently and hand each receipt to the render pool as soon as its answer is ready."""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    batch_number = datetime.now().strftime("%Y%m%d%H%M%S")
+    
+    async def process(sequence, order):
+        result = {"id": order["id"], "query": order["query"]}
+        try:
+            async with semaphore:
+                start = time.perf_counter()
+                answer = await areceipt_content(order["query"], get_answer)
+                result["answer_seconds"] = time.perf_counter() - start
+            markdown_text = build_receipt(answer, f"{batch_number}-{sequence:05d}")
+            base_path = os.path.join(output_dir, unique_receipt_name(order["id"]))
+            output_path, result["render_seconds"] = await loop.run_in_executor(
+                pool, _render_job, markdown_text, base_path, output_format, renderer)
+            result["receipt"] = output_path
+            result["status"] = "ok" if output_path else "render_failed"
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+        return result
+    
+    return await asyncio.gather(*(process(n, order) for n, order in enumerate(orders, 1)))
+
+def run_batch(path, output_dir="receipts", output_format="png", renderer=RECEIPT_RENDERER,
+              concurrency=MAX_CONCURRENCY, workers=RECEIPT_WORKERS):
+    """
+    Generate receipts for every order in a JSONL file (or stdin) with one app:
+    answers are computed concurrently and receipts rendered in a process pool.
+    Writes results.jsonl to output_dir and reports receipts per minute.
+    """
+    orders = read_orders(path)
+    if not orders:
+        print("No orders to process.")
+        return []
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Spawn (not fork) the render workers: forked children would inherit the
+    # app's pooled database connections and close them when they exit
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        from main import create_app
+        get_answer = create_app()
+        print(f"\nProcessing {len(orders)} orders ({concurrency} answered at once, {workers} render workers)...")
+        start = time.perf_counter()
+        results = asyncio.run(_process_orders(get_answer, orders, output_dir, output_format, renderer,
+                                              concurrency, pool))
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.shutdown()
+    
+    with open(os.path.join(output_dir, "results.jsonl"), 'w', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    
+    succeeded = [r for r in results if r["status"] == "ok"]
+    print(f"\nBatch complete: {len(succeeded)}/{len(results)} receipts in {elapsed:.1f}s "
+          f"({len(succeeded) / elapsed * 60:.1f} receipts/min)")
+    if succeeded:
+        print(f"  mean answer time: {statistics.mean(r['answer_seconds'] for r in succeeded):.2f}s")
+        print(f"  mean render time: {statistics.mean(r['render_seconds'] for r in succeeded) * 1000:.0f} ms")
+    for result in results:
+        if result["status"] != "ok":
+            print(f"  failed ({result['status']}): {result['query']} {result.get('error', '')}")
+    print(f"Receipts and results.jsonl written to {output_dir}/")
+    return results
+
 def main():
     """Main function to process grocery queries and generate receipts."""
-    print("Grocery Receipt PNG Generator")
+    parser = argparse.ArgumentParser(description="Generate a grocery receipt from a shopping list")
+    parser.add_argument("query", nargs="*", help="Grocery list, e.g. '2.5kg rice, 750ml cooking oil'")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="png", help="Receipt output format")
+    parser.add_argument("--renderer", choices=RECEIPT_RENDERERS, default=RECEIPT_RENDERER,
+                        help="Native Pillow renderer or the pandoc + xelatex pipeline")
+    parser.add_argument("--batch", metavar="PATH",
+                        help="JSONL file of orders ('-' for standard input) to turn into receipts in one run")
+    parser.add_argument("--output-dir", default="receipts", help="Where batch receipts are written")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY, help="Batch orders answered at once")
+    parser.add_argument("--workers", type=int, default=RECEIPT_WORKERS, help="Batch render processes")
+    args = parser.parse_args()
+    
+    print("Grocery Receipt Generator")
     print(f"All prices are in {CURRENCY} ({CURRENCY_SYMBOL})")
     
-    if len(sys.argv) > 1:
+    if args.batch:
+        run_batch(args.batch, args.output_dir, args.format, args.renderer, args.concurrency, args.workers)
+        return
+    
+    if args.query:
         # If argument provided, use it as the query
-        query = ' '.join(sys.argv[1:])
+        query = ' '.join(args.query)
     else:
         # Otherwise, ask for input
         query = input("\nEnter your grocery list (e.g., '2.5kg rice, 750ml cooking oil, 3 packets of biscuits'): ")
@@ -191,14 +402,14 @@ def main():
     receipt_md = generate_receipt(query)
     
     # Save markdown version for reference (without think sections)
-    md_path = f"receipt_{datetime.now().strftime('%Y%m%d%H%M%S')}.md"
+    base_path = unique_receipt_name()
+    md_path = f"{base_path}.md"
     with open(md_path, 'w', encoding='utf-8') as f:
         f.write(receipt_md)
     print(f"Receipt content saved as: {md_path}")
     
-    # Generate PNG
-    png_path = f"receipt_{datetime.now().strftime('%Y%m%d%H%M%S')}.png"
-    png_path = generate_png_with_markitdown(receipt_md, png_path)
+    # Render the receipt
+    png_path = save_receipt(receipt_md, f"{base_path}.{args.format}", args.format, args.renderer)
     
     if png_path and os.path.exists(png_path):
         # Try to open the image with the default viewer
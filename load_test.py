@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import statistics
+import time
+
+import httpx
+
+from config import SERVER_HOST, SERVER_PORT
+from testSystem import TEST_PROMPTS
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+async def run_step(client, url, rate, duration, prompts, timeout, stream):
+    """
+    Open-loop load at a fixed arrival rate: requests start on a Poisson schedule
+    whether or not earlier ones finished, like independent clients would.
+    """
+    results = []
+
+    async def one(question):
+        start = time.perf_counter()
+        try:
+            if stream:
+                async with client.stream("POST", url, json={"question": question, "timeout": timeout}) as response:
+                    async for _ in response.aiter_bytes():
+                        pass
+                    status = response.status_code
+            else:
+                response = await client.post(url, json={"question": question, "timeout": timeout})
+                status = response.status_code
+                if status == 200 and response.json().get("shared"):
+                    status = "200 shared"
+        except httpx.HTTPError:
+            status = "connection error"
+        results.append((status, time.perf_counter() - start))
+
+    tasks = []
+    start = time.perf_counter()
+    next_arrival = start
+    while next_arrival - start < duration:
+        await asyncio.sleep(max(next_arrival - time.perf_counter(), 0))
+        tasks.append(asyncio.create_task(one(random.choice(prompts))))
+        next_arrival += random.expovariate(rate)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    ok = [seconds for status, seconds in results if str(status).startswith("200")]
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "offered_qps": rate,
+        "requests": len(results),
+        "ok_qps": len(ok) / elapsed,
+        "success_ratio": len(ok) / len(results) if results else 0.0,
+        "statuses": statuses,
+        "p50": percentile(ok, 50) if ok else None,
+        "p95": percentile(ok, 95) if ok else None,
+        "p99": percentile(ok, 99) if ok else None,
+        "mean": statistics.mean(ok) if ok else None,
+    }
+
+
+async def run_load_test(base_url, rates, duration, prompts, timeout, stream, slo, min_success):
+    """Step the offered load up and report the highest rate that met the latency SLO and success ratio."""
+    url = f"{base_url}/answer/stream" if stream else f"{base_url}/answer"
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    steps = []
+    async with httpx.AsyncClient(timeout=timeout + 10, limits=limits) as client:
+        health = (await client.get(f"{base_url}/health")).json()
+        print(f"Server: max {health['max_inflight']} in flight, {health['max_queue']} queued")
+        for rate in rates:
+            print(f"Offering {rate:g} queries/s for {duration:g}s...")
+            step = await run_step(client, url, rate, duration, prompts, timeout, stream)
+            step["sustained"] = (step["success_ratio"] >= min_success and step["p95"] is not None
+                                 and step["p95"] <= slo)
+            steps.append(step)
+
+    print(f"\n{'Offered':>8} {'OK q/s':>8} {'Success':>8} {'p50 (s)':>8} {'p95 (s)':>8} {'p99 (s)':>8}  Statuses")
+    print("-" * 90)
+    for step in steps:
+        latency = " ".join(f"{step[p]:>8.2f}" if step[p] is not None else f"{'-':>8}" for p in ("p50", "p95", "p99"))
+        print(f"{step['offered_qps']:>8g} {step['ok_qps']:>8.2f} {step['success_ratio']:>8.1%} {latency}  "
+              f"{json.dumps(step['statuses'])}{'' if step['sustained'] else '  (not sustained)'}")
+    sustained = [step["ok_qps"] for step in steps if step["sustained"]]
+    if sustained:
+        print(f"\nSustained throughput: {max(sustained):.2f} queries/s "
+              f"(p95 <= {slo:g}s, >= {min_success:.0%} successful)")
+    else:
+        print(f"\nNo step met p95 <= {slo:g}s with >= {min_success:.0%} successful requests")
+    return steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure sustained QPS of the HTTP service (server.py)")
+    parser.add_argument("--url", default=f"http://{SERVER_HOST}:{SERVER_PORT}")
+    parser.add_argument("--rates", default="1,2,4,8,16", help="Comma-separated offered loads in queries/s")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per step")
+    parser.add_argument("--timeout", type=float, default=30, help="Deadline sent with every request")
+    parser.add_argument("--slo", type=float, default=10, help="p95 latency (s) a sustained step must meet")
+    parser.add_argument("--min-success", type=float, default=0.99, help="Fraction of 200s a sustained step needs")
+    parser.add_argument("--stream", action="store_true", help="Load /answer/stream instead of /answer")
+    parser.add_argument("--output", help="Write the per-step results as JSON")
+    args = parser.parse_args()
+    steps = asyncio.run(run_load_test(args.url.rstrip("/"), [float(r) for r in args.rates.split(",")],
+                                      args.duration, TEST_PROMPTS, args.timeout, args.stream, args.slo,
+                                      args.min_success))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(steps, f, indent=2)
@@ -1,295 +1,853 @@
-from langchain_ollama import ChatOllama
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
-from langchain.output_parsers import PydanticOutputParser
-from pydantic.v1 import BaseModel, Field, validator
-from langchain.chains import LLMChain
-from typing import List, Dict, Optional, Literal, Union, Any
-import psycopg2
+import asyncio
+import contextvars
+import hashlib
 import json
-import decimal
-from config import get_db_connection, OLLAMA_BASE_URL, MODEL_NAME, CURRENCY, CURRENCY_SYMBOL
+import threading
+import time
+from config import (MODEL_NAME, MODEL_ROUTING, MODEL_ROUTING_MODES, SMALL_MODEL_NAME, OLLAMA_KEEP_ALIVE, OLLAMA_WARM_UP, CURRENCY, CURRENCY_SYMBOL,
+                    CLASSIFIER_CONFIDENCE_THRESHOLD, PIPELINE_MODE, PIPELINE_MODES,
+                    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_PATH, MAX_CONCURRENCY,
+                    CATALOG_REFRESH_MODE, CATALOG_SNAPSHOT_PATH, CATALOG_BACKEND, CATALOG_BACKENDS,
+                    QUERY_ENGINE_LLM_PHRASING, SHOPPING_LIST_MODE, SHOPPING_LIST_MODES, EXTRACTION_RETRIES,
+                    OLLAMA_BACKENDS, GENERATION_BUDGETS)
+from db import fetch_database_time, fetch_grocery_items
+from shopping_parser import (parse_shopping_list, format_shopping_list, resolve_item, find_item_mentions,
+                             ParsedShoppingList)
+from response_cache import ResponseCache
+from catalog_sync import CatalogState, CatalogSync
+from catalog_snapshot import load_snapshot
+from catalog_search import CatalogSearch
+from retrieval import LARGE_CATALOG_NOTE
+from streaming import AnswerHold, ThinkStripper, strip_think_stream, astrip_think_stream, aiter_chunks
+from telemetry import telemetry, span
+from ollama_pool import OllamaPool
+from model_cascade import CascadeStats, validate_output
+from query_classifier import QUERY_TYPES
+from generation_budget import BudgetExceeded, GenerationBudget
+from prompts import SHARED_PREFIX
 
-# Define structured output models using Pydantic
-class GroceryItem(BaseModel):
-    name: str
-    quantity: float
-    unit: str
-    unit_price: float
-    amount: float
-    calculation: str = Field(description="Step-by-step calculation explanation")
+# LangChain (chains.py), pydantic (models.py) and psycopg2 (db.py) are imported on
+# first use: answers computed from the catalog alone never need them
 
-class ShoppingList(BaseModel):
-    items: List[GroceryItem]
-    total: float
-    
-    @validator('total')
-    def validate_total(cls, total, values):
-        """Validate that the total matches the sum of item amounts"""
-        if 'items' in values:
-            calculated_total = sum(item.amount for item in values['items'])
-            # Check with a small tolerance for floating-point issues
-            if abs(total - calculated_total) > 0.01:
-                # Auto-correct the total
-                return calculated_total
-        return total
+# Reply when a chain runs out of generation budget and nothing can be computed locally
+BUDGET_EXCEEDED_ANSWER = ("I could not work that out within the answer length limit. "
+                          "Please ask about fewer items at a time.")
+# Items relevant to a question whose type is unknown: matches, their categories and price extremes
+FALLBACK_CONTEXT = {"include_siblings": True, "include_ranked": True, "include_categories": True}
 
-class CategoryListing(BaseModel):
-    category: str
-    items: List[Dict[str, Any]]
-
-class QueryType(BaseModel):
-    type: Literal["price_query", "shopping_list", "category_query", "comparison_query", "unknown"]
-    explanation: str = Field(description="Explanation of why this query type was selected")
-
-def create_app():
+def create_app(pipeline=PIPELINE_MODE, use_cache=True, refresh_mode=CATALOG_REFRESH_MODE,
+               warm_up=OLLAMA_WARM_UP, shared_prefix=True, base_url=None, callbacks=None,
+               grocery_items=None, backends=None, model_routing=MODEL_ROUTING,
+               shopping_list_mode=SHOPPING_LIST_MODE, snapshot_path=CATALOG_SNAPSHOT_PATH,
+               catalog_backend=CATALOG_BACKEND):
     """
     Initialize the improved Grocery Price Assistant using structured LangChain components.
+    
+    Returns get_answer(question). It also exposes get_answer.stream / .astream for
+    streaming, get_answer.aget_answer for asyncio callers, get_answer.get_answers /
+    .aget_answers for concurrent batches, get_answer.cache (None if disabled),
+    get_answer.catalog_sync / .refresh_catalog() for the live catalog and
+    get_answer.plan_answer(question, state) for callers that run the parts themselves
+    (get_answer.chain(name) returns the chain a part names).
+    get_answer.ollama_pool holds the Ollama backends and their latency stats.
+    get_answer.shopping_list(question) / .ashopping_list return a structured
+    ShoppingList (e.g. for receipts) when the question can be priced locally.
+    
+    shopping_list_mode="extract" has the LLM only list the (item, quantity, unit)
+    entries the local parser could not resolve, as JSON validated with ExtractedItem;
+    prices, conversions and totals are computed locally and only invalid entries are
+    asked again. "generate" lets the shopping list chain write the table itself.
+    
+    Each chain has a generation budget (GENERATION_BUDGETS, generation_budget.py):
+    max answer tokens, stop sequences and reasoning off or capped. A chain that
+    runs out of budget is answered deterministically from the catalog instead.
+    
+    model_routing="cascade" runs every chain on SMALL_MODEL_NAME first and only
+    re-runs it on MODEL_NAME when the output fails validation against the catalog
+    (model_cascade.py); get_answer.cascade_stats counts the answers per tier.
+    
+    pipeline selects how queries the local classifier is unsure about are answered:
+    - "two_stage": classify with the LLM, then invoke the specialised chain for that type
+    - "single_pass": one structured LLM call returns the query type and the answer
+      (or, for shopping lists, the extracted items which are then priced locally)
+    
+    refresh_mode ("off", "poll" or "listen") keeps the catalog in sync with the
+    database while the app runs; get_answer.refresh_catalog() syncs on demand.
+    
+    When snapshot_path holds a catalog snapshot (catalog_snapshot.py) the app starts
+    from the memory-mapped file without waiting for the database, then fetches the
+    rows changed since the snapshot in the background. Otherwise the catalog is read
+    from the database and the snapshot written for the next process.
+    
+    catalog_backend="search" never loads the catalog: the items each question mentions
+    are looked up in the database (catalog_search.py) and the question is answered
+    from just those rows, with an LRU cache of hot items in front; get_answer.catalog_search
+    holds its stats. The response cache, live refresh and snapshot are not used then.
+    
+    Every chain is built once, the first time a query needs it, so answers computed
+    locally (parsed shopping lists, query engine lookups, cached answers) never
+    import LangChain. Its prompt starts with SHARED_PREFIX holding the catalog, so
+    Ollama can reuse the cached prefix between queries. warm_up loads the
+    model and fills that cache before the first query; shared_prefix=False sends
+    retrieved per-question context instead of the whole catalog (for comparisons).
+    
+    Every LLM call goes through an OllamaPool: the least loaded healthy backend
+    serving MODEL_NAME answers it and failures are retried on another one. backends
+    ("url[=model|model],...") or base_url (a single server, e.g. fake_ollama.py)
+    replace OLLAMA_BACKENDS; callbacks are LangChain callback handlers attached to every LLM call, and
+    grocery_items replaces the catalog loaded from the database.
     """
+    if pipeline not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline '{pipeline}', expected one of {PIPELINE_MODES}")
+    if shopping_list_mode not in SHOPPING_LIST_MODES:
+        raise ValueError(f"Unknown shopping list mode '{shopping_list_mode}', expected one of {SHOPPING_LIST_MODES}")
+    if model_routing not in MODEL_ROUTING_MODES:
+        raise ValueError(f"Unknown model routing '{model_routing}', expected one of {MODEL_ROUTING_MODES}")
+    if catalog_backend not in CATALOG_BACKENDS:
+        raise ValueError(f"Unknown catalog backend '{catalog_backend}', expected one of {CATALOG_BACKENDS}")
+    
     print("Initializing Grocery Price Assistant...")
-    print(f"Using model: {MODEL_NAME}")
+    print(f"Using model: {MODEL_NAME}" + (f" (after {SMALL_MODEL_NAME})" if model_routing == "cascade" else ""))
+    print(f"Using pipeline: {pipeline}")
     print(f"Prices stored in: {CURRENCY}")
     
-    # Load all grocery items from database
-    grocery_items = load_all_grocery_items()
-    
-    # Handle Decimal serialization
-    def decimal_default(obj):
-        if isinstance(obj, decimal.Decimal):
-            return float(obj)
-        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
-    
-    grocery_items_json = json.dumps(grocery_items, indent=2, default=decimal_default)
-    print(f"Loaded {len(grocery_items)} grocery items into memory")
-    
-    # Create a dictionary lookup for faster item access
-    item_lookup = {item['name'].lower(): item for item in grocery_items}
-    
-    # Initialize LLM with more precise settings
-    llm = ChatOllama(
-        base_url=OLLAMA_BASE_URL,
-        model=MODEL_NAME,
-        temperature=0,  # Zero temperature for deterministic outputs
-    )
-    
-    # 1. Query Classifier Chain
-    query_classifier_prompt = ChatPromptTemplate.from_template("""
-    Your task is to classify the user's grocery-related query into one of these types:
-    - price_query: User wants to know the price of specific items
-    - shopping_list: User wants to calculate the total cost of multiple items with quantities
-    - category_query: User wants to see all items in a specific category
-    - comparison_query: User wants to compare prices between items
-    - unknown: Query doesn't fit any of the above categories
-
-    User query: {question}
-
-    Respond with a JSON object containing the type and an explanation.
-    """)
-    
-    query_classifier_parser = JsonOutputParser()
-    
-    query_classifier_chain = query_classifier_prompt | llm | query_classifier_parser
-    
-    # 2. Price Query Chain
-    price_query_prompt = ChatPromptTemplate.from_template("""
-    You are a grocery price lookup assistant. The user wants to know the price of specific items.
-    
-    Here is the complete list of grocery items with their prices and units:
-    {grocery_items}
-    
-    User query: {question}
-    
-    Find the exact matching item(s) in the database and provide their prices.
-    State the price per unit clearly: e.g., "Milk costs ₹65 per liter"
-    Do not convert units or perform calculations unless specifically requested.
-    
-    ONLY respond with the price information, nothing else.
-    """)
-    
-    price_query_chain = price_query_prompt | llm | StrOutputParser()
-    
-    # 3. Shopping List Chain
-    shopping_list_prompt = ChatPromptTemplate.from_template("""
-    You are a precise grocery shopping calculator. Extract the items and quantities from the query.
-    
-    Here is the complete list of grocery items with their prices and units:
-    {grocery_items}
-    
-    User query: {question}
-    
-    For each item mentioned in the query:
-    1. Find the exact matching item in the database (do not guess or invent items)
-    2. Extract the quantity requested
-    3. Calculate the exact cost based on the requested quantity and unit
-    4. For weight conversions: 1 kg = 1000 g
-    5. For volume conversions: 1 liter = 1000 ml
-    6. Show a clear calculation for each item
-    
-    IMPORTANT: Be precise with your math calculations. Double-check all arithmetic.
-    
-    Format your response as a detailed calculation with:
-    - A table showing Item, Unit Price, Quantity, and Amount for each item
-    - Step-by-step calculations below the table
-    - The total sum at the end
-    """)
-    
-    shopping_list_chain = shopping_list_prompt | llm | StrOutputParser()
-    
-    # 4. Category Query Chain
-    category_query_prompt = ChatPromptTemplate.from_template("""
-    You are a grocery category lookup assistant. The user wants to see items in a specific category.
-    
-    Here is the complete list of grocery items with their prices and units:
-    {grocery_items}
-    
-    User query: {question}
-    
-    1. Identify which category the user is asking about
-    2. List all items in that category with their prices
-    3. Format each item as: "[Item]: ₹[price] per [unit]"
-    
-    If the requested category doesn't exist, list the available categories instead.
-    """)
-    
-    category_query_chain = category_query_prompt | llm | StrOutputParser()
-    
-    # 5. Comparison Query Chain
-    comparison_query_prompt = ChatPromptTemplate.from_template("""
-    You are a grocery price comparison assistant. The user wants to compare prices between items.
-    
-    Here is the complete list of grocery items with their prices and units:
-    {grocery_items}
-    
-    User query: {question}
-    
-    1. Identify the items being compared
-    2. Find their prices and units in the database
-    3. Convert to the same unit if needed for fair comparison
-    4. Clearly state which item is cheaper/more expensive
-    5. Show your calculations for the comparison
-    
-    Be precise with your comparisons and make sure to account for different units.
-    """)
+    # Search backend: nothing is loaded, items are looked up per question and the prompts carry
+    # them with the question; answers are not cached as a whole since the rows are fetched per query
+    catalog_search = None
+    if catalog_backend == "search" and grocery_items is None:
+        catalog_search = CatalogSearch()
+        use_cache, refresh_mode, shared_prefix, snapshot_path = False, "off", False, None
+    
+    # Start from the mapped snapshot when there is one, else load all grocery items from the
+    # database, with the lookups and indexes derived from them
+    snapshot_path = snapshot_path if grocery_items is None else None
+    snapshot = load_snapshot(snapshot_path)
+    watermark = None
+    if catalog_search is not None:
+        catalog = CatalogState([])
+        print("Looking up grocery items per question in the database")
+    elif snapshot is not None:
+        catalog = CatalogState.from_snapshot(snapshot)
+        watermark = snapshot.watermark
+        print(f"Loaded {len(catalog.columns)} grocery items from snapshot {snapshot_path}")
+    else:
+        if grocery_items is None:
+            watermark, grocery_items = load_catalog_from_database()
+        catalog = CatalogState(grocery_items)
+        print(f"Loaded {len(catalog.grocery_items)} grocery items into memory")
+    
+    # Every option and setting besides the catalog that changes answers, so a restart with other
+    # ones never serves answers the persistent cache kept from these
+    answer_settings = (pipeline, shopping_list_mode, model_routing, MODEL_NAME,
+                       SMALL_MODEL_NAME if model_routing == "cascade" else None, shared_prefix,
+                       backends or base_url or OLLAMA_BACKENDS, CLASSIFIER_CONFIDENCE_THRESHOLD,
+                       QUERY_ENGINE_LLM_PHRASING, EXTRACTION_RETRIES, GENERATION_BUDGETS)
+    settings_hash = hashlib.sha256(repr(answer_settings).encode("utf-8")).hexdigest()[:8]
+    
+    def cache_version(state):
+        return f"{state.version}:{pipeline}:{settings_hash}"
+    
+    # Cache answers per catalog version so any price change invalidates them
+    cache = None
+    if use_cache and RESPONSE_CACHE_SIZE > 0:
+        cache = ResponseCache(
+            max_size=RESPONSE_CACHE_SIZE,
+            ttl=RESPONSE_CACHE_TTL,
+            path=RESPONSE_CACHE_PATH,
+            version=cache_version(catalog),
+        )
     
-    comparison_query_chain = comparison_query_prompt | llm | StrOutputParser()
+    def on_catalog_change(new_state):
+        # Retire cached answers before the new catalog becomes visible to queries
+        if cache is not None:
+            cache.set_version(cache_version(new_state))
+    
+    # Keep the in-memory catalog (and its snapshot) in sync with the database without restarting
+    catalog_sync = CatalogSync(catalog, mode=refresh_mode, on_change=on_catalog_change,
+                               snapshot_path=snapshot_path, watermark=watermark)
+    if snapshot is None and watermark is not None:
+        catalog_sync.save_snapshot()
+    catalog_sync.start(catch_up=snapshot is not None)
+    
+    # Route every LLM call across the configured Ollama backends (probed once a model is needed)
+    ollama_pool = OllamaPool.from_config(backends or base_url)
+    
+    # Cascade mode: chains run with this config use the small model
+    small_model_config = {"configurable": {"model": SMALL_MODEL_NAME}}
+    cascade_stats = CascadeStats(SMALL_MODEL_NAME, MODEL_NAME) if model_routing == "cascade" else None
+    
+    # Chains by name (prompts.CHAIN_PROMPTS), each built the first time a query needs it
+    chains = {}
+    chains_lock = threading.Lock()
+    
+    def get_chain(name):
+        """The chain called name, building it (and importing LangChain) on first use"""
+        chain = chains.get(name)
+        if chain is None:
+            with chains_lock:
+                chain = chains.get(name)
+                if chain is None:
+                    from chains import build_chain, chain_llm
+                    ollama_pool.start()
+                    with span("build_chain", chain=name):
+                        chain = chains[name] = build_chain(name, chain_llm(ollama_pool, name, callbacks))
+        return chain
+    
+    def small_model_answer(chain_name, inputs, state):
+        """
+        Cascade mode: run the chain called chain_name on the small model and return its output if it
+        passes local validation, else None (the caller then runs the large model).
+        Also returns the seconds spent, which count against the escalated call.
+        """
+        name = f"chain.{chain_name}"
+        chain = get_chain(chain_name)
+        start = time.perf_counter()
+        with span(name, model=SMALL_MODEL_NAME) as current:
+            try:
+                output = chain.invoke(inputs, config=small_model_config)
+                problems = validate_output(name, output, inputs, state)
+            except Exception as e:
+                output, problems = None, [f"{type(e).__name__}: {e}"]
+            current.set(valid=not problems)
+        seconds = time.perf_counter() - start
+        if problems:
+            print(f"Escalating {name} to {MODEL_NAME}: {problems[0]}")
+            return None, seconds
+        cascade_stats.record(name, seconds)
+        return output, seconds
+    
+    async def asmall_model_answer(chain_name, inputs, state):
+        """Async variant of small_model_answer"""
+        name = f"chain.{chain_name}"
+        chain = get_chain(chain_name)
+        start = time.perf_counter()
+        with span(name, model=SMALL_MODEL_NAME) as current:
+            try:
+                output = await chain.ainvoke(inputs, config=small_model_config)
+                problems = validate_output(name, output, inputs, state)
+            except Exception as e:
+                output, problems = None, [f"{type(e).__name__}: {e}"]
+            current.set(valid=not problems)
+        seconds = time.perf_counter() - start
+        if problems:
+            print(f"Escalating {name} to {MODEL_NAME}: {problems[0]}")
+            return None, seconds
+        cascade_stats.record(name, seconds)
+        return output, seconds
+    
+    def invoke_part(part, state):
+        """Run one answer part: final strings pass through, chains are invoked inside a span"""
+        if isinstance(part, str):
+            return part
+        chain_name, inputs = part
+        chain = get_chain(chain_name)
+        small_seconds = None
+        if cascade_stats is not None:
+            output, small_seconds = small_model_answer(chain_name, inputs, state)
+            if output is not None:
+                return output
+        start = time.perf_counter()
+        with span(f"chain.{chain_name}") as current:
+            try:
+                output = chain.invoke(inputs)
+            except BudgetExceeded as e:
+                current.set(budget_exceeded=e.reason)
+                output = over_budget_output(e, inputs, state)
+        if small_seconds is not None:
+            cascade_stats.record(f"chain.{chain_name}", small_seconds, time.perf_counter() - start)
+        return output
+    
+    async def ainvoke_part(part, state):
+        """Async variant of invoke_part"""
+        if isinstance(part, str):
+            return part
+        chain_name, inputs = part
+        chain = get_chain(chain_name)
+        small_seconds = None
+        if cascade_stats is not None:
+            output, small_seconds = await asmall_model_answer(chain_name, inputs, state)
+            if output is not None:
+                return output
+        start = time.perf_counter()
+        with span(f"chain.{chain_name}") as current:
+            try:
+                output = await chain.ainvoke(inputs)
+            except BudgetExceeded as e:
+                current.set(budget_exceeded=e.reason)
+                output = over_budget_output(e, inputs, state)
+        if small_seconds is not None:
+            cascade_stats.record(f"chain.{chain_name}", small_seconds, time.perf_counter() - start)
+        return output
+    
+    def stream_part(part, state):
+        """
+        Stream one answer part, recording the chain's time to first chunk on its span.
+        In cascade mode the small model's answer is validated before any of it is
+        shown, so it arrives as one chunk; only an escalated answer is streamed.
+        When Ollama may cut a chain's answer short (num_predict), only its reasoning
+        streams and the answer is held back until the generation ends. A stream cut
+        off by its generation budget ends with the deterministic answer instead.
+        """
+        if isinstance(part, str):
+            yield part
+            return
+        chain_name, inputs = part
+        chain = get_chain(chain_name)
+        small_seconds = None
+        if cascade_stats is not None:
+            output, small_seconds = small_model_answer(chain_name, inputs, state)
+            if output is not None:
+                yield output
+                return
+        hold = answer_hold(chain_name)
+        with span(f"chain.{chain_name}") as current:
+            start = first_chunk = time.perf_counter()
+            try:
+                for chunk in chain.stream(inputs):
+                    if first_chunk is not None:
+                        current.set(first_chunk_ms=round((time.perf_counter() - first_chunk) * 1000, 3))
+                        first_chunk = None
+                    chunk = hold.feed(chunk) if hold is not None else chunk
+                    if chunk:
+                        yield chunk
+            except BudgetExceeded as e:
+                current.set(budget_exceeded=e.reason)
+                yield over_budget_continuation(e, inputs, state)
+            else:
+                held = hold.release() if hold is not None else ""
+                if held:
+                    yield held
+        if small_seconds is not None:
+            cascade_stats.record(f"chain.{chain_name}", small_seconds, time.perf_counter() - start)
+    
+    async def astream_part(part, state):
+        """Async variant of stream_part"""
+        if isinstance(part, str):
+            yield part
+            return
+        chain_name, inputs = part
+        chain = get_chain(chain_name)
+        small_seconds = None
+        if cascade_stats is not None:
+            output, small_seconds = await asmall_model_answer(chain_name, inputs, state)
+            if output is not None:
+                yield output
+                return
+        hold = answer_hold(chain_name)
+        with span(f"chain.{chain_name}") as current:
+            start = first_chunk = time.perf_counter()
+            try:
+                async for chunk in chain.astream(inputs):
+                    if first_chunk is not None:
+                        current.set(first_chunk_ms=round((time.perf_counter() - first_chunk) * 1000, 3))
+                        first_chunk = None
+                    chunk = hold.feed(chunk) if hold is not None else chunk
+                    if chunk:
+                        yield chunk
+            except BudgetExceeded as e:
+                current.set(budget_exceeded=e.reason)
+                yield over_budget_continuation(e, inputs, state)
+            else:
+                held = hold.release() if hold is not None else ""
+                if held:
+                    yield held
+        if small_seconds is not None:
+            cascade_stats.record(f"chain.{chain_name}", small_seconds, time.perf_counter() - start)
+    
+    def answer_hold(chain_name):
+        """An AnswerHold for chains whose answer may stop at num_predict, else None"""
+        return AnswerHold() if GenerationBudget.for_chain(chain_name).num_predict is not None else None
+    
+    def over_budget_output(error, inputs, state):
+        """Deterministic stand-in for the output of a chain that ran out of generation budget"""
+        telemetry.metrics.inc("grocery_budget_overruns_total", chain=error.chain, reason=error.reason)
+        print(f"{error}; answering from the catalog")
+        question = inputs.get("question", "")
+        local_type = state.classifier.classify(question).type
+        if error.chain == "classifier":
+            return {"type": local_type, "explanation": "Local classification (generation budget exceeded)"}
+        if error.chain == "routed":
+            # No answer: routed_parts falls back to the query engine or the specialised chain
+            return {"type": local_type, "items": [], "answer": ""}
+        if error.chain == "phrasing":
+            return inputs["answer"]
+        if error.chain == "extractor":
+            # Nothing extracted: the entries are reported as unpriced
+            return {"items": []}
+        query_type = error.chain if error.chain in QUERY_TYPES else local_type
+        if query_type == "shopping_list":
+            parsed = parse_shopping_list(question, state.item_lookup, state.name_index)
+            if parsed is not None and parsed.items:
+                return format_shopping_list(parsed)
+        return (state.engine.answer(question, query_type) or state.engine.answer_prices(question)
+                or BUDGET_EXCEEDED_ANSWER)
+    
+    def over_budget_continuation(error, inputs, state):
+        """Text that ends a stream cut off by its budget, closing an unfinished <think> section"""
+        return ("\n</think>\n\n" if error.thinking else "\n\n") + over_budget_output(error, inputs, state)
+    
+    def prefix_inputs(state):
+        """The shared prefix inputs, identical for every query on the same catalog"""
+        return {"catalog": state.retriever.prefix_catalog if shared_prefix else LARGE_CATALOG_NOTE}
+    
+    def chain_inputs(question, state, **context_options):
+        """Inputs for an answering chain: the shared prefix, then the items for this question"""
+        inputs = prefix_inputs(state)
+        inputs["question"] = question
+        if shared_prefix and state.retriever.catalog_in_prefix:
+            inputs["grocery_items"] = "All grocery items are listed in the database above."
+        else:
+            inputs["grocery_items"] = ("Here are the grocery items relevant to the query, with their prices and units:\n"
+                                       + state.retriever.context(question, **context_options))
+        return inputs
+    
+    def warm_up_model(state):
+        """
+        Load the model and prefill the shared prefix on every backend so no first query
+        pays for either. Sent as a plain /api/chat request, so it does not import LangChain.
+        """
+        messages = [{"role": "system", "content": SHARED_PREFIX.format(**prefix_inputs(state))},
+                    {"role": "user", "content": "Reply with OK."}]
+        models = [SMALL_MODEL_NAME, MODEL_NAME] if cascade_stats is not None else [MODEL_NAME]
+        ollama_pool.start()
+        for model in models:
+            for backend in ollama_pool.backends_for(model):
+                start = time.perf_counter()
+                try:
+                    with span("warm_up", backend=backend.url, model=model):
+                        reply = backend.chat(model, messages, keep_alive=OLLAMA_KEEP_ALIVE,
+                                             options={"temperature": 0, "num_predict": 1})
+                        telemetry.record_llm_reply(reply, reply.get("message", {}).get("content", ""))
+                    print(f"Warmed up {model} on {backend.url} in {time.perf_counter() - start:.1f}s")
+                except Exception as e:
+                    print(f"Model warm-up failed for {model} on {backend.url}: {str(e)}")
+    
+    def price_extracted_item(entry, parsed, state):
+        """Validate and price one extracted entry into parsed; returns the problem if it is unusable"""
+        from pydantic.v1 import ValidationError
+        from models import ExtractedItem
+        try:
+            item = ExtractedItem.parse_obj(entry)
+        except ValidationError as e:
+            return "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+        line_item = resolve_item(item.name, item.quantity, item.unit, state.item_lookup, state.name_index)
+        if line_item is None:
+            if item.name.lower() not in state.item_lookup and not find_item_mentions(item.name, state.name_index):
+                return f"'{item.name}' is not in the database; use the exact item name"
+            return f"{item.quantity:g} {item.unit or '(no unit)'} does not match how {item.name} is sold"
+        parsed.items.append(line_item)
+        return None
+    
+    def describe_entry(entry):
+        if not isinstance(entry, dict):
+            return str(entry)
+        return " ".join(str(part) for part in (entry.get("quantity"), entry.get("unit"), entry.get("name")) if part)
+    
+    def extract_shopping_list(question, state, parsed):
+        """
+        Extract mode: the LLM lists (item, quantity, unit) entries, each validated with
+        ExtractedItem and priced into parsed locally. Entries that fail are asked again,
+        with the reason, up to EXTRACTION_RETRIES times; the i-th corrected entry replaces
+        the i-th invalid one and whatever is still invalid is reported as unresolved.
+        """
+        inputs = {**chain_inputs(question, state), "corrections": ""}
+        with span("extract", attempt=0):
+            result = invoke_part(("extractor", inputs), state)
+        entries = result.get("items") if isinstance(result, dict) else None
+        if not isinstance(entries, list) or not entries:
+            parsed.unresolved.append(question)
+            return parsed
+        # (entry as first extracted, latest attempt at it, why that attempt is unusable)
+        invalid = []
+        for entry in entries:
+            problem = price_extracted_item(entry, parsed, state)
+            if problem is not None:
+                invalid.append((entry, entry, problem))
+        for attempt in range(1, EXTRACTION_RETRIES + 1):
+            if not invalid:
+                break
+            # Re-ask only the entries that could not be used
+            retry_question = ", ".join(describe_entry(original) for original, _, _ in invalid)
+            inputs = {**chain_inputs(retry_question, state), "corrections": (
+                "\n    These entries from an earlier answer could not be used. Return one corrected entry for each, "
+                "in the same order:\n"
+                + "\n".join(f"    - {json.dumps(latest, ensure_ascii=False)}: {problem}"
+                            for _, latest, problem in invalid))}
+            with span("extract", attempt=attempt):
+                result = invoke_part(("extractor", inputs), state)
+            corrected = result.get("items") if isinstance(result, dict) else None
+            if not isinstance(corrected, list):
+                continue
+            still_invalid = []
+            for index, (original, latest, problem) in enumerate(invalid):
+                if index < len(corrected):
+                    latest = corrected[index]
+                    problem = price_extracted_item(latest, parsed, state)
+                if problem is not None:
+                    still_invalid.append((original, latest, problem))
+            invalid = still_invalid
+        parsed.unresolved.extend(describe_entry(original) for original, _, _ in invalid)
+        return parsed
+    
+    def extracted_answer(parsed):
+        """Locally computed answer for an extracted shopping list, naming what could not be priced"""
+        answer = format_shopping_list(parsed)
+        if parsed.unresolved:
+            answer += f"\n\nCould not price: {', '.join(parsed.unresolved)}"
+        return answer
+    
+    def shopping_list_parts(parsed, state):
+        """Answer parts for a locally priced shopping list; only unresolved fragments go to the LLM"""
+        if parsed.unresolved and shopping_list_mode == "extract":
+            remaining_question = ", ".join(parsed.unresolved)
+            extracted = extract_shopping_list(remaining_question, state, ParsedShoppingList(items=list(parsed.items)))
+            if extracted.items:
+                return [extracted_answer(extracted)]
+            # Nothing could be priced locally; let the shopping list chain try the whole request
+            return [("shopping_list", chain_inputs(remaining_question, state))]
+        parts = [format_shopping_list(parsed)]
+        if parsed.unresolved:
+            # Only send the fragments the parser could not resolve to the LLM
+            remaining_question = ", ".join(parsed.unresolved)
+            parts.append(f"\n\nRemaining items ({remaining_question}):\n\n")
+            parts.append(("shopping_list", chain_inputs(remaining_question, state)))
+        return parts
+    
+    def routed_parts(question, state):
+        """Single-pass pipeline: one LLM call returns the query type and the answer or extracted items"""
+        result = invoke_part(("routed", chain_inputs(question, state, **FALLBACK_CONTEXT)), state)
+        query_type = result.get("type", "unknown")
+        
+        if query_type == "shopping_list" and result.get("items"):
+            parsed = ParsedShoppingList()
+            for entry in result["items"]:
+                line_item = resolve_item(entry.get("name", ""), entry.get("quantity", ""), entry.get("unit"),
+                                         state.item_lookup, state.name_index)
+                if line_item is not None:
+                    parsed.items.append(line_item)
+                else:
+                    parsed.unresolved.append(
+                        f"{entry.get('quantity', '')} {entry.get('unit') or ''} {entry.get('name', '')}".strip())
+            if parsed.items:
+                return shopping_list_parts(parsed, state)
+        
+        answer = result.get("answer")
+        if answer:
+            return [answer]
+        # The model classified the query but did not answer it; use the query engine or specialised chain
+        return typed_parts(query_type, question, state)
+    
+    def typed_parts(query_type, question, state):
+        """Answer parts for a classified question: the local query engine first, then the specialised chain"""
+        if query_type == "shopping_list" and shopping_list_mode == "extract":
+            return shopping_list_parts(ParsedShoppingList(unresolved=[question]), state)
+        # Category listings, superlatives, comparisons and price ranges are index lookups
+        answer = state.engine.answer(question, query_type)
+        if answer is None:
+            return [chain_for_type(query_type, question, state)]
+        if QUERY_ENGINE_LLM_PHRASING:
+            return [("phrasing", {**prefix_inputs(state), "question": question, "answer": answer})]
+        return [answer]
+    
+    def plan_answer(question, state):
+        """
+        Route a question and return the parts of its answer in order: strings that are
+        already final (computed locally) and (chain name, inputs) pairs still to be run.
+        Classification happens here; the answering chains are left to the caller so
+        they can be invoked or streamed.
+        """
+        with span("route") as route:
+            # Fast path: price shopping lists locally without calling the LLM
+            parsed = parse_shopping_list(question, state.item_lookup, state.name_index)
+            if parsed is not None and parsed.items:
+                route.set(query_type="shopping_list", route="local_parser")
+                return shopping_list_parts(parsed, state)
+            
+            # First, classify the query type locally and only ask the LLM when unsure
+            classification = state.classifier.classify(question)
+            if classification.confidence >= CLASSIFIER_CONFIDENCE_THRESHOLD:
+                query_type = classification.type
+                route.set(classifier="local", confidence=round(classification.confidence, 3))
+            elif pipeline == "single_pass":
+                route.set(route="single_pass")
+                return routed_parts(question, state)
+            else:
+                query_type_result = invoke_part(("classifier", {
+                    **prefix_inputs(state),
+                    "question": question
+                }), state)
+                
+                query_type = query_type_result.get("type", "unknown")
+                route.set(classifier="llm")
+            
+            route.set(query_type=query_type)
+            return typed_parts(query_type, question, state)
+    
+    def state_for(question):
+        """
+        The catalog a question is answered from: one snapshot per query, even if a refresh
+        swaps in a new one meanwhile, or with the search backend the rows it matched
+        """
+        if catalog_search is None:
+            return catalog_sync.state
+        return catalog_search.state_for(question)
+    
+    async def astate_for(question):
+        """Async variant of state_for; database lookups run off the event loop (in this trace)"""
+        if catalog_search is None:
+            return catalog_sync.state
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, contextvars.copy_context().run, state_for, question)
     
     def get_answer(question: str) -> str:
         """Process a natural language question and return an answer about grocery prices"""
+        state = state_for(question)
+        with span("query", pipeline=pipeline) as query:
+            if cache is None:
+                return compute_answer(question, state)
+            answer = cache.get(question)
+            query.set(cache_hit=answer is not None)
+            if answer is None:
+                answer = compute_answer(question, state)
+                cache.put(question, answer, version=cache_version(state))
+            return answer
+    
+    def compute_answer(question, state):
+        """Answer a question without consulting the response cache"""
         try:
-            # First, classify the query type
-            query_type_result = query_classifier_chain.invoke({
-                "question": question
-            })
-            
-            query_type = query_type_result.get("type", "unknown")
-            
-            # Handle different query types with specialized chains
-            if query_type == "price_query":
-                return price_query_chain.invoke({
-                    "question": question,
-                    "grocery_items": grocery_items_json
-                })
-                
-            elif query_type == "shopping_list":
-                return shopping_list_chain.invoke({
-                    "question": question,
-                    "grocery_items": grocery_items_json
-                })
-                
-            elif query_type == "category_query":
-                return category_query_chain.invoke({
-                    "question": question,
-                    "grocery_items": grocery_items_json
-                })
-                
-            elif query_type == "comparison_query":
-                return comparison_query_chain.invoke({
-                    "question": question,
-                    "grocery_items": grocery_items_json
-                })
-                
-            else:  # unknown or fallback
-                return fallback_response(question, grocery_items_json, llm)
-                
+            return "".join(invoke_part(part, state) for part in plan_answer(question, state))
         except Exception as e:
             # Fallback to the general method if any error occurs
             print(f"Error in query processing: {str(e)}")
-            return fallback_response(question, grocery_items_json, llm)
-
-    # General fallback response method
-    def fallback_response(question, grocery_items_json, llm):
-        """Generate a response using the general-purpose method as a fallback"""
-        response_prompt = ChatPromptTemplate.from_template(
-            """You are a grocery shopping assistant who helps calculate prices based on grocery items database.
-
-Here is the complete list of grocery items with their prices and units:
-{grocery_items}
-
-The user's query is: {question}
-
-First, identify which grocery items from the database are relevant to the query, and then:
-
-1. For price queries:
-   - Look up the price of each item from the database
-   - State the price per unit clearly: e.g., "Milk costs ₹65 per liter"
-
-2. For shopping list queries (user wants to buy items with quantities):
-   - Create a formatted table with columns: Item | Unit Price | Quantity | Amount
-   - For each item, calculate the exact cost based on the requested quantity
-   - For weight conversions: 1 kg = 1000 g 
-   - For volume conversions: 1 liter = 1000 ml
-   - Show calculation steps: e.g., "Rice: ₹75/kg × 0.75kg = ₹56.25"
-   - Sum up the total at the end
-   - DOUBLE-CHECK YOUR MATH: Verify that all calculations are correct
+            return fallback_response(question, state)
+    
+    async def aget_answer(question: str) -> str:
+        """Coroutine variant of get_answer built on the chains' ainvoke support"""
+        state = await astate_for(question)
+        with span("query", pipeline=pipeline) as query:
+            if cache is not None:
+                answer = cache.get(question)
+                query.set(cache_hit=answer is not None)
+                if answer is not None:
+                    return answer
+            answer = await acompute_answer(question, state)
+            if cache is not None:
+                cache.put(question, answer, version=cache_version(state))
+            return answer
+    
+    async def acompute_answer(question, state):
+        """Async variant of compute_answer"""
+        # Classification is a single short call; run it off the event loop (in this trace)
+        loop = asyncio.get_running_loop()
+        try:
+            parts = await loop.run_in_executor(None, contextvars.copy_context().run, plan_answer, question, state)
+            answer = []
+            for part in parts:
+                answer.append(await ainvoke_part(part, state))
+            return "".join(answer)
+        except Exception as e:
+            # Fallback to the general method if any error occurs
+            print(f"Error in query processing: {str(e)}")
+            with span("fallback"):
+                return await ainvoke_part(fallback_part(question, state), state)
+    
+    async def aget_answers(questions, max_concurrency=MAX_CONCURRENCY):
+        """
+        Answer many questions concurrently, at most max_concurrency at a time.
+        Results keep the input order; a question that fails yields its exception
+        in place of an answer instead of failing the whole batch.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def answer_one(question):
+            async with semaphore:
+                return await aget_answer(question)
+        
+        return await asyncio.gather(*(answer_one(q) for q in questions), return_exceptions=True)
+    
+    def get_answers(questions, max_concurrency=MAX_CONCURRENCY):
+        """Blocking wrapper around aget_answers for callers without an event loop"""
+        return asyncio.run(aget_answers(questions, max_concurrency))
+    
+    def stream_answer(question, strip_think=True):
+        """
+        Stream the answer to a question as it is generated, with <think> reasoning
+        sections removed, so callers can show the real answer as soon as it starts.
+        strip_think=False yields the raw chunks, reasoning included.
+        """
+        state = state_for(question)
+        with span("query", pipeline=pipeline, streamed=True) as query:
+            if cache is not None:
+                cached = cache.get(question)
+                query.set(cache_hit=cached is not None)
+                if cached is not None:
+                    yield from strip_think_stream([cached]) if strip_think else [cached]
+                    return
+            
+            try:
+                parts = plan_answer(question, state)
+            except Exception as e:
+                print(f"Error in query processing: {str(e)}")
+                parts = [fallback_part(question, state)]
+            
+            raw_chunks = []
+            stripper = ThinkStripper()
+            for part in parts:
+                for chunk in stream_part(part, state):
+                    raw_chunks.append(chunk)
+                    visible = stripper.feed(chunk) if strip_think else chunk
+                    if visible:
+                        yield visible
+            tail = stripper.flush() if strip_think else ""
+            if tail:
+                yield tail
+            
+            if cache is not None:
+                cache.put(question, "".join(raw_chunks), version=cache_version(state))
+    
+    async def astream_answer(question, strip_think=True):
+        """
+        Async generator variant of stream_answer built on the chains' astream support.
+        strip_think=False yields the raw chunks, reasoning included.
+        """
+        state = await astate_for(question)
+        with span("query", pipeline=pipeline, streamed=True) as query:
+            if cache is not None:
+                cached = cache.get(question)
+                query.set(cache_hit=cached is not None)
+                if cached is not None:
+                    chunks = aiter_chunks([cached])
+                    async for visible in astrip_think_stream(chunks) if strip_think else chunks:
+                        yield visible
+                    return
+            
+            # Classification is a single short call; run it off the event loop (in this trace)
+            loop = asyncio.get_running_loop()
+            try:
+                parts = await loop.run_in_executor(None, contextvars.copy_context().run, plan_answer, question, state)
+            except Exception as e:
+                print(f"Error in query processing: {str(e)}")
+                parts = [fallback_part(question, state)]
+            
+            raw_chunks = []
+            stripper = ThinkStripper()
+            for part in parts:
+                async for chunk in astream_part(part, state):
+                    raw_chunks.append(chunk)
+                    visible = stripper.feed(chunk) if strip_think else chunk
+                    if visible:
+                        yield visible
+            tail = stripper.flush() if strip_think else ""
+            if tail:
+                yield tail
+            
+            if cache is not None:
+                cache.put(question, "".join(raw_chunks), version=cache_version(state))
 
-3. For category queries:
-   - List all items in the specified category with their prices
-   - Format each item as: "[Item]: ₹[price] per [unit]"
+    def chain_for_type(query_type, question, state):
+        """Pick the specialised chain for a query type and build its inputs"""
+        # Handle different query types with specialized chains
+        if query_type == "price_query":
+            return "price_query", chain_inputs(question, state)
+            
+        elif query_type == "shopping_list":
+            return "shopping_list", chain_inputs(question, state)
+            
+        elif query_type == "category_query":
+            return "category_query", chain_inputs(question, state, include_siblings=True,
+                                                      include_categories=True)
+            
+        elif query_type == "comparison_query":
+            return "comparison_query", chain_inputs(question, state, include_siblings=True,
+                                                        include_ranked=True)
+            
+        else:  # unknown or fallback
+            return fallback_part(question, state)
 
-4. For comparison queries:
-   - Convert to the same unit before comparing (if needed)
-   - Clearly state which item is cheaper/more expensive
+    def fallback_part(question, state):
+        """The general-purpose fallback chain and its inputs"""
+        return "fallback", chain_inputs(question, state, **FALLBACK_CONTEXT)
 
-IMPORTANT: Only use the exact prices and units from the provided grocery items data.
-Do NOT invent or assume any information not present in the database.
-"""
-        )
-        
-        response_chain = response_prompt | llm | StrOutputParser()
-        
-        return response_chain.invoke({
-            "question": question,
-            "grocery_items": grocery_items_json
-        })
-    
+    # General fallback response method
+    def fallback_response(question, state):
+        """Generate a response using the general-purpose method as a fallback"""
+        with span("fallback"):
+            return invoke_part(fallback_part(question, state), state)
+    
+    def shopping_list(question):
+        """
+        The structured ShoppingList for a shopping list question, priced locally, or
+        None when it cannot be (in extract mode the LLM extracts what the parser cannot)
+        """
+        state = state_for(question)
+        with span("shopping_list"):
+            parsed = parse_shopping_list(question, state.item_lookup, state.name_index)
+            if parsed is None or not parsed.items:
+                if shopping_list_mode != "extract" or state.classifier.classify(question).type != "shopping_list":
+                    return None
+                parsed = ParsedShoppingList(unresolved=[question])
+            if parsed.unresolved:
+                if shopping_list_mode != "extract":
+                    return None
+                remaining_question = ", ".join(parsed.unresolved)
+                parsed = extract_shopping_list(remaining_question, state, ParsedShoppingList(items=list(parsed.items)))
+            if not parsed.items:
+                return None
+            from models import to_shopping_list
+            return to_shopping_list(parsed)
+    
+    async def ashopping_list(question):
+        """Async variant of shopping_list (run off the event loop, in this trace)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, contextvars.copy_context().run, shopping_list, question)
+    
+    if warm_up:
+        # Import LangChain while the model loads, so the first LLM query does not pay for it either
+        threading.Thread(target=__import__, args=("chains",), name="import-chains", daemon=True).start()
+        warm_up_model(catalog)
+    
+    # Prometheus endpoint when METRICS_PORT is set (once per process)
+    telemetry.start_metrics_server()
+    
+    get_answer.cache = cache
+    get_answer.plan_answer = plan_answer
+    get_answer.chain = get_chain
+    get_answer.telemetry = telemetry
+    get_answer.ollama_pool = ollama_pool
+    get_answer.cascade_stats = cascade_stats
+    get_answer.shopping_list = shopping_list
+    get_answer.ashopping_list = ashopping_list
+    get_answer.stream = stream_answer
+    get_answer.astream = astream_answer
+    get_answer.aget_answer = aget_answer
+    get_answer.aget_answers = aget_answers
+    get_answer.get_answers = get_answers
+    get_answer.catalog_sync = catalog_sync
+    get_answer.catalog_search = catalog_search
+    get_answer.refresh_catalog = catalog_sync.sync_now
     return get_answer
 
 def load_all_grocery_items():
     """Load all grocery items from the database."""
+    return load_catalog_from_database()[1]
+
+def load_catalog_from_database():
+    """
+    Load all grocery items from the database, with the database time read just
+    before them (the watermark later syncs start from). Returns (None, []) when
+    the database is unavailable.
+    """
     try:
-        # Connect to database
-        conn = psycopg2.connect(**get_db_connection())
-        cursor = conn.cursor()
-        
-        # Fetch all grocery items
-        cursor.execute("SELECT * FROM grocery_items;")
-        columns = [desc[0] for desc in cursor.description]
-        items = cursor.fetchall()
-        
-        # Convert to list of dictionaries
-        grocery_items = []
-        for item in items:
-            item_dict = dict(zip(columns, item))
-            grocery_items.append(item_dict)
-        
-        # Close connection
-        cursor.close()
-        conn.close()
-        
-        return grocery_items
+        with span("db.load_catalog") as load:
+            watermark = fetch_database_time()
+            # Explicit, server-side typed columns through the shared connection pool
+            items = fetch_grocery_items()
+            load.set(items=len(items))
+            return watermark, items
     except Exception as e:
         print(f"Error loading grocery items: {str(e)}")
-        return []
+        print("Warning: answering from an empty catalog until the database is reachable")
+        return None, []
 
 def main():
     """Main function to run the Grocery Price Assistant."""
@@ -311,8 +869,11 @@ def main():
         if not user_input.strip():
             continue
             
-        response = get_answer(user_input)
-        print(f"\nAssistant: {response}")
+        # Stream the answer so it appears as soon as the reasoning section ends
+        print("\nAssistant: ", end="", flush=True)
+        for chunk in get_answer.stream(user_input):
+            print(chunk, end="", flush=True)
+        print()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+Model cascade for the Grocery Price Assistant
+
+With MODEL_ROUTING="cascade" every chain is first run on SMALL_MODEL_NAME and
+its output is checked locally against the catalog snapshot the question was
+planned on:
+
+- every item the question names is mentioned in the answer, and the answer
+  only names catalog items;
+- every quoted price is the catalog price of a mentioned item, that price
+  converted to a display unit (per kg, liter, piece or packet), a
+  difference between such prices, an amount the question gives, or one
+  calculated from a price (quantity × price, what a budget buys and the
+  change left);
+- shopping list rows quote the catalog unit price and the stated total equals
+  the sum of the line amounts (the check ShoppingList.validate_total makes);
+- JSON outputs carry a known query type (or an item list), and single-pass
+  shopping list entries resolve to catalog items;
+- rephrased query engine answers keep exactly the computed amounts.
+
+Only outputs that fail a check are recomputed with MODEL_NAME. CascadeStats
+counts how often each tier answers and estimates the latency saved.
+"""
+import re
+import threading
+from decimal import Decimal
+
+from config import CURRENCY_SYMBOL
+from query_classifier import QUERY_TYPES
+from shopping_parser import find_item_mentions, resolve_item
+from telemetry import telemetry
+from units import parse_unit
+
+_THINK_RE = re.compile(r"<think>.*?(?:</think>|$)", re.DOTALL)
+_AMOUNT_RE = re.compile(rf"(?:{re.escape(CURRENCY_SYMBOL)}|\brs\.?|\binr)\s*(\d[\d,]*(?:\.\d+)?)", re.IGNORECASE)
+_TOTAL_RE = re.compile(r"\btotal\b", re.IGNORECASE)
+_NUMBER_RE = re.compile(r"(?<![\w.])(\d[\d,]*(?:\.\d+)?)")
+
+# Quoted amounts within this many rupees of an expected one are accepted
+_TOLERANCE = Decimal("0.01")
+# Display units a price per base unit (g, ml, count, packet) may be quoted in
+_DISPLAY_SCALES = (1, 100, 1000)
+
+
+def _visible(answer):
+    return _THINK_RE.sub("", answer or "").strip()
+
+
+def _amounts(text):
+    return [Decimal(value.replace(",", "")) for value in _AMOUNT_RE.findall(text)]
+
+
+def _close(amount, expected, tolerance=_TOLERANCE):
+    return any(abs(amount - value) <= tolerance for value in expected)
+
+
+def _numbers(text):
+    """Plain numbers in a text (quantities such as "2 kg" or "16.67 kg"), ₹ amounts left out."""
+    return [Decimal(value.replace(",", "")) for value in _NUMBER_RE.findall(_AMOUNT_RE.sub(" ", text))]
+
+
+def _unit_prices(keys, state):
+    """Catalog prices of these items: as listed, and exactly per g, ml, count or packet."""
+    prices = set()
+    for key in keys:
+        item = state.item_lookup[key]
+        price = Decimal(str(item["price"]))
+        prices.add(price)
+        catalog_quantity = parse_unit(item.get("unit"))
+        if catalog_quantity is not None:
+            prices.add(price / catalog_quantity[0])
+    return prices
+
+
+def _item_prices(keys, state):
+    """Prices a correct answer may quote for these items: catalog prices and per-unit conversions."""
+    prices = set()
+    for price in _unit_prices(keys, state):
+        prices.update((price * scale).quantize(Decimal("0.01")) for scale in _DISPLAY_SCALES)
+    # "Curd is ₹15 cheaper than Milk"
+    prices.update(abs(a - b) for a in list(prices) for b in list(prices) if a != b)
+    return prices
+
+
+def _calculated_amounts(keys, question, answer, state):
+    """
+    Amounts a correct calculation on these items' prices may quote besides the prices
+    themselves: the amounts the question gives ("with ₹500"), quantity × price for the
+    quantities stated, and for each amount given as a budget, what the whole units it
+    buys cost and the change left.
+    """
+    budgets = _amounts(question)
+    amounts = set(budgets)
+    prices = _unit_prices(keys, state)
+    quantities = set(_numbers(question) + _numbers(answer))
+    for price in prices:
+        amounts.update((quantity * price).quantize(Decimal("0.01")) for quantity in quantities)
+        for budget in budgets:
+            if price > 0:
+                spent = (budget // price) * price
+                amounts.update((spent.quantize(Decimal("0.01")), (budget - spent).quantize(Decimal("0.01"))))
+    return amounts
+
+
+def _check_mentions(answer, question, state, problems):
+    """Items the question names must appear in the answer; returns the items the answer names."""
+    mentioned = find_item_mentions(answer, state.name_index)
+    missing = [key for key in find_item_mentions(question, state.name_index) if key not in mentioned]
+    if missing:
+        problems.append(f"answer does not mention {', '.join(missing)}")
+    return mentioned
+
+
+def _check_prices(answer, question, mentioned, state, problems):
+    allowed = _item_prices(mentioned, state) | _calculated_amounts(mentioned, question, answer, state)
+    wrong = [amount for amount in _amounts(answer) if not _close(amount, allowed)]
+    if wrong:
+        problems.append(f"amounts not in the catalog: {', '.join(str(amount) for amount in wrong)}")
+
+
+def _check_shopping_list(answer, state, problems):
+    """Rows must quote the catalog unit price and the total must equal the sum of the line amounts."""
+    line_amounts = {}
+    total = None
+    for line in answer.splitlines():
+        amounts = _amounts(line)
+        if not amounts:
+            continue
+        if _TOTAL_RE.search(line):
+            total = amounts[-1]
+            continue
+        keys = find_item_mentions(line, state.name_index)
+        if len(keys) != 1:
+            continue
+        key = keys[0]
+        if len(amounts) >= 2 and not _close(amounts[0], _item_prices([key], state)):
+            problems.append(f"{state.item_lookup[key]['name']} is quoted at ₹{amounts[0]}")
+        # Rows and calculation steps repeat items; their amounts must agree
+        amount = amounts[-1]
+        if key in line_amounts and abs(line_amounts[key] - amount) > _TOLERANCE:
+            problems.append(f"{state.item_lookup[key]['name']} has amounts ₹{line_amounts[key]} and ₹{amount}")
+        line_amounts.setdefault(key, amount)
+    if not line_amounts:
+        problems.append("no priced items")
+    elif total is None:
+        problems.append("no total")
+    elif abs(total - sum(line_amounts.values())) > _TOLERANCE * len(line_amounts):
+        problems.append(f"total ₹{total} does not add up to ₹{sum(line_amounts.values())}")
+
+
+def validate_text(answer, query_type, question, state):
+    """Problems found in a text answer to a question of query_type (an empty list means it looks right)."""
+    answer = _visible(answer)
+    if not answer:
+        return ["empty answer"]
+    problems = []
+    if query_type == "shopping_list" or (query_type == "unknown" and _TOTAL_RE.search(answer)):
+        _check_shopping_list(answer, state, problems)
+        return problems
+    mentioned = _check_mentions(answer, question, state, problems)
+    if query_type in ("price_query", "comparison_query") and mentioned and not _amounts(answer):
+        problems.append("no prices quoted")
+    if _amounts(answer) and not mentioned:
+        problems.append("prices quoted without catalog items")
+    _check_prices(answer, question, mentioned, state, problems)
+    return problems
+
+
+def validate_routed(result, question, state):
+    """Problems in the single-pass JSON: a known type and either resolvable items or a valid answer."""
+    if not isinstance(result, dict) or result.get("type") not in QUERY_TYPES:
+        return ["unknown query type"]
+    if result["type"] == "shopping_list" and result.get("items"):
+        unknown = [entry.get("name", "") for entry in result["items"]
+                   if not isinstance(entry, dict) or resolve_item(entry.get("name", ""), entry.get("quantity", ""),
+                                                                  entry.get("unit"), state.item_lookup,
+                                                                  state.name_index) is None]
+        return [f"unresolvable items: {', '.join(map(str, unknown))}"] if unknown else []
+    if not result.get("answer"):
+        # Answered later by the query engine or a specialised chain
+        return []
+    return validate_text(result["answer"], result["type"], question, state)
+
+
+def validate_phrasing(answer, computed):
+    """A rephrased answer must quote exactly the amounts of the computed one."""
+    answer = _visible(answer)
+    if not answer:
+        return ["empty answer"]
+    expected, quoted = _amounts(computed), _amounts(answer)
+    problems = [f"₹{amount} missing" for amount in expected if not _close(amount, quoted)]
+    problems += [f"₹{amount} added" for amount in quoted if not _close(amount, expected)]
+    return problems
+
+
+def validate_output(chain, output, inputs, state):
+    """Problems with a chain's output, by span name (e.g. "chain.price_query")."""
+    chain = chain.removeprefix("chain.")
+    question = inputs.get("question", "")
+    if chain == "classifier":
+        return [] if isinstance(output, dict) and output.get("type") in QUERY_TYPES else ["unknown query type"]
+    if chain == "routed":
+        return validate_routed(output, question, state)
+    if chain == "extractor":
+        # Entries are validated one by one afterwards and only the invalid ones re-asked
+        return [] if isinstance(output, dict) and isinstance(output.get("items"), list) else ["no item list"]
+    if chain == "phrasing":
+        return validate_phrasing(output, inputs.get("answer", ""))
+    if not isinstance(output, str):
+        return ["unexpected output"]
+    return validate_text(output, chain if chain in QUERY_TYPES else "unknown", question, state)
+
+
+class CascadeStats:
+    """How often each tier answers, per chain, and the latency the small tier saves."""
+
+    def __init__(self, small_model, large_model):
+        self.small_model = small_model
+        self.large_model = large_model
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def record(self, chain, small_seconds, large_seconds=None):
+        """Record one cascaded call; large_seconds is set when it was escalated."""
+        tier = "small" if large_seconds is None else "large"
+        with self._lock:
+            counts = self._chains.setdefault(chain, {"small": 0, "large": 0, "small_seconds": 0.0,
+                                                     "escalated_small_seconds": 0.0, "large_seconds": 0.0})
+            counts[tier] += 1
+            if large_seconds is None:
+                counts["small_seconds"] += small_seconds
+            else:
+                counts["escalated_small_seconds"] += small_seconds
+                counts["large_seconds"] += large_seconds
+        telemetry.metrics.inc("grocery_cascade_answers_total", chain=chain, tier=tier)
+
+    def snapshot(self):
+        """
+        Per chain and overall: answers per tier, escalation rate, mean latency per tier
+        and the estimated seconds saved, i.e. small-tier answers priced at the large
+        tier's mean latency minus the time spent on the small tier (including the
+        attempts that were escalated). None until the large tier has been timed.
+        """
+        with self._lock:
+            chains = {name: dict(counts) for name, counts in self._chains.items()}
+        total = {"small": 0, "large": 0, "small_seconds": 0.0, "escalated_small_seconds": 0.0, "large_seconds": 0.0}
+        for counts in chains.values():
+            for field, value in counts.items():
+                total[field] += value
+        return {
+            "small_model": self.small_model,
+            "large_model": self.large_model,
+            "chains": {name: self._summary(counts) for name, counts in sorted(chains.items())},
+            "total": self._summary(total),
+        }
+
+    @staticmethod
+    def _summary(counts):
+        calls = counts["small"] + counts["large"]
+        small_mean = counts["small_seconds"] / counts["small"] if counts["small"] else None
+        large_mean = counts["large_seconds"] / counts["large"] if counts["large"] else None
+        saved = None
+        if large_mean is not None:
+            saved = counts["small"] * large_mean - counts["small_seconds"] - counts["escalated_small_seconds"]
+        return {
+            "calls": calls,
+            "small_answers": counts["small"],
+            "large_answers": counts["large"],
+            "escalation_rate": counts["large"] / calls if calls else 0.0,
+            "small_mean_seconds": small_mean,
+            "large_mean_seconds": large_mean,
+            "seconds_saved": saved,
+            "mean_seconds_saved": saved / calls if saved is not None and calls else None,
+        }
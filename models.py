@@ -0,0 +1,66 @@
+"""
+Structured output models for the Grocery Price Assistant
+
+Pydantic models for priced shopping lists (returned by
+get_answer.shopping_list) and for what the LLM chains return. They are
+imported on first use, so answering from the catalog alone does not import
+pydantic.
+"""
+from typing import List, Dict, Optional, Literal, Any
+
+from pydantic.v1 import BaseModel, Field, validator
+
+from shopping_parser import ParsedShoppingList
+
+class GroceryItem(BaseModel):
+    name: str
+    quantity: float
+    unit: str
+    unit_price: float
+    amount: float
+    calculation: str = Field(description="Step-by-step calculation explanation")
+
+class ShoppingList(BaseModel):
+    items: List[GroceryItem]
+    total: float
+    unresolved: List[str] = Field(default_factory=list, description="Requested items that could not be priced")
+    
+    @validator('total')
+    def validate_total(cls, total, values):
+        """Validate that the total matches the sum of item amounts"""
+        if 'items' in values:
+            calculated_total = sum(item.amount for item in values['items'])
+            # Check with a small tolerance for floating-point issues
+            if abs(total - calculated_total) > 0.01:
+                # Auto-correct the total
+                return calculated_total
+        return total
+
+class ExtractedItem(BaseModel):
+    """One shopping list entry as the extractor chain returns it, before it is priced locally"""
+    name: str
+    quantity: float
+    unit: Optional[str] = None
+    
+    @validator('quantity')
+    def validate_quantity(cls, quantity):
+        if quantity <= 0:
+            raise ValueError("quantity must be positive")
+        return quantity
+
+def to_shopping_list(parsed: ParsedShoppingList) -> ShoppingList:
+    """Structured ShoppingList for locally priced line items (e.g. for receipts)"""
+    items = [
+        GroceryItem(name=item.name, quantity=float(item.quantity), unit=item.unit, unit_price=float(item.unit_price),
+                    amount=float(item.amount), calculation=item.calculation)
+        for item in parsed.items
+    ]
+    return ShoppingList(items=items, total=float(parsed.total), unresolved=parsed.unresolved)
+
+class CategoryListing(BaseModel):
+    category: str
+    items: List[Dict[str, Any]]
+
+class QueryType(BaseModel):
+    type: Literal["price_query", "shopping_list", "category_query", "comparison_query", "unknown"]
+    explanation: str = Field(description="Explanation of why this query type was selected")
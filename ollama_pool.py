@@ -0,0 +1,313 @@
+"""
+Pool of Ollama servers for the Grocery Price Assistant
+
+OllamaPool holds the backends listed in OLLAMA_BACKENDS (or just
+OLLAMA_BASE_URL), each optionally limited to some models. Every call goes to
+the healthy backend serving the model with the fewest outstanding requests;
+if it fails before producing output, the call is retried on another backend
+(up to OLLAMA_FAILOVER_RETRIES times). A background thread probes /api/tags
+every OLLAMA_HEALTH_INTERVAL seconds so failed backends rejoin once they
+answer again.
+
+chat_model() returns a PooledChatOllama (chains.py), a LangChain chat model
+backed by the pool, so chains are built exactly as with ChatOllama
+(prompt | llm | parser) and callbacks still receive Ollama's token counts and
+durations. LangChain is only imported when the first such model is created.
+"""
+import asyncio
+import json
+import statistics
+import threading
+import time
+import urllib.request
+from collections import deque
+
+from config import (OLLAMA_BASE_URL, OLLAMA_BACKENDS, OLLAMA_HEALTH_INTERVAL, OLLAMA_FAILOVER_RETRIES,
+                    MODEL_NAME)
+from telemetry import telemetry
+
+# Consecutive failures after which a backend is skipped until a probe succeeds
+_MAX_CONSECUTIVE_FAILURES = 3
+# Completed requests kept per backend for latency percentiles
+_LATENCY_WINDOW = 512
+
+
+class NoBackendAvailable(Exception):
+    """No backend serves the model, or every attempt failed."""
+
+
+def parse_backends(spec):
+    """
+    Parse "url[=model|model],url..." into [(url, models or None)];
+    None means the backend serves any model.
+    """
+    backends = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        url, _, models = entry.partition("=")
+        model_names = [model.strip() for model in models.split("|") if model.strip()]
+        backends.append((url.strip().rstrip("/"), model_names or None))
+    return backends
+
+
+def _is_connection_error(error):
+    """Errors meaning the backend itself is unreachable, not that the request was bad."""
+    if isinstance(error, (ConnectionError, TimeoutError, OSError)):
+        return True
+    return type(error).__module__.split(".")[0] in ("httpx", "httpcore")
+
+
+class Backend:
+    """One Ollama server: its clients, in-flight count, health and latency history."""
+
+    def __init__(self, url, models=None):
+        self.url = url
+        self.models = set(models) if models else None
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+        self.latencies = deque(maxlen=_LATENCY_WINDOW)
+        self._clients = {}
+
+    def serves(self, model):
+        return self.models is None or model in self.models
+
+    def client(self, model, options):
+        """The ChatOllama for this backend, model and options (created once)."""
+        key = (model, tuple(sorted(options.items())))
+        client = self._clients.get(key)
+        if client is None:
+            from langchain_ollama import ChatOllama
+            client = self._clients[key] = ChatOllama(base_url=self.url, model=model, **options)
+        return client
+
+    def chat(self, model, messages, timeout=300, **body):
+        """One non-streamed /api/chat request sent straight to this backend; returns Ollama's reply."""
+        request = urllib.request.Request(
+            f"{self.url}/api/chat",
+            data=json.dumps({"model": model, "messages": messages, "stream": False, **body}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "url": self.url,
+            "models": sorted(self.models) if self.models else None,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "mean_seconds": statistics.mean(latencies) if latencies else None,
+            "p50_seconds": latencies[len(latencies) // 2] if latencies else None,
+            "p95_seconds": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] if latencies else None,
+        }
+
+
+class OllamaPool:
+    """Least-outstanding-requests routing with failover and health probing across Ollama backends."""
+
+    def __init__(self, backends, health_interval=OLLAMA_HEALTH_INTERVAL, retries=OLLAMA_FAILOVER_RETRIES):
+        if not backends:
+            raise ValueError("An Ollama pool needs at least one backend")
+        self.backends = [Backend(url, models) for url, models in backends]
+        self.health_interval = health_interval
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = False
+
+    @classmethod
+    def from_config(cls, spec=None, **options):
+        """Pool for spec ("url[=models],..."), else OLLAMA_BACKENDS, else OLLAMA_BASE_URL."""
+        return cls(parse_backends(spec or OLLAMA_BACKENDS or OLLAMA_BASE_URL), **options)
+
+    def chat_model(self, model=MODEL_NAME, callbacks=None, **options):
+        """A LangChain chat model that sends every call through this pool."""
+        from chains import PooledChatOllama
+        return PooledChatOllama(pool=self, model=model, options=options, callbacks=callbacks)
+
+    # Routing
+
+    def backends_for(self, model):
+        return [backend for backend in self.backends if backend.serves(model)]
+
+    def _acquire(self, model, exclude):
+        """Pick the least loaded backend for model, counting the request against it."""
+        with self._lock:
+            candidates = [backend for backend in self.backends_for(model) if backend not in exclude]
+            if not candidates:
+                return None
+            # Backends marked down are only used when nothing healthy is left
+            candidates = [backend for backend in candidates if backend.healthy] or candidates
+            backend = min(candidates, key=lambda b: (b.outstanding, statistics.mean(b.latencies)
+                                                     if b.latencies else 0.0))
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend, seconds, error=None):
+        with self._lock:
+            backend.outstanding -= 1
+            backend.requests += 1
+            if error is None:
+                backend.consecutive_failures = 0
+                backend.latencies.append(seconds)
+            else:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                backend.last_error = f"{type(error).__name__}: {error}"
+                if _is_connection_error(error) or backend.consecutive_failures >= _MAX_CONSECUTIVE_FAILURES:
+                    backend.healthy = False
+        status = "ok" if error is None else "error"
+        telemetry.metrics.inc("grocery_backend_requests_total", backend=backend.url, status=status)
+        if error is None:
+            telemetry.metrics.observe("grocery_backend_seconds", seconds, backend=backend.url)
+
+    def _attempts(self, model, tried):
+        """Acquire up to retries + 1 distinct backends for model, one at a time."""
+        for _ in range(self.retries + 1):
+            backend = self._acquire(model, tried)
+            if backend is None:
+                return
+            tried.append(backend)
+            yield backend
+
+    def _failed(self, model, tried, errors):
+        if not tried:
+            return NoBackendAvailable(f"No Ollama backend serves model '{model}'")
+        return NoBackendAvailable(f"All Ollama backends failed for '{model}': " + "; ".join(errors))
+
+    def call(self, model, fn):
+        """Run fn(backend), failing over to another backend on error."""
+        tried, errors = [], []
+        for backend in self._attempts(model, tried):
+            start = time.perf_counter()
+            try:
+                result = fn(backend)
+            except Exception as e:
+                self._release(backend, time.perf_counter() - start, e)
+                errors.append(f"{backend.url}: {e}")
+                continue
+            self._release(backend, time.perf_counter() - start)
+            return result
+        raise self._failed(model, tried, errors)
+
+    async def acall(self, model, fn):
+        """Async variant of call; fn(backend) returns an awaitable."""
+        tried, errors = [], []
+        for backend in self._attempts(model, tried):
+            start = time.perf_counter()
+            try:
+                result = await fn(backend)
+            except asyncio.CancelledError:
+                self._release(backend, time.perf_counter() - start)
+                raise
+            except Exception as e:
+                self._release(backend, time.perf_counter() - start, e)
+                errors.append(f"{backend.url}: {e}")
+                continue
+            self._release(backend, time.perf_counter() - start)
+            return result
+        raise self._failed(model, tried, errors)
+
+    def stream(self, model, fn):
+        """Yield from fn(backend); fails over only while nothing has been yielded yet."""
+        tried, errors = [], []
+        for backend in self._attempts(model, tried):
+            start = time.perf_counter()
+            started = False
+            try:
+                for chunk in fn(backend):
+                    started = True
+                    yield chunk
+            except GeneratorExit:
+                self._release(backend, time.perf_counter() - start)
+                raise
+            except Exception as e:
+                self._release(backend, time.perf_counter() - start, e)
+                if started:
+                    raise
+                errors.append(f"{backend.url}: {e}")
+                continue
+            self._release(backend, time.perf_counter() - start)
+            return
+        raise self._failed(model, tried, errors)
+
+    async def astream(self, model, fn):
+        """Async variant of stream."""
+        tried, errors = [], []
+        for backend in self._attempts(model, tried):
+            start = time.perf_counter()
+            started = False
+            try:
+                async for chunk in fn(backend):
+                    started = True
+                    yield chunk
+            except (GeneratorExit, asyncio.CancelledError):
+                self._release(backend, time.perf_counter() - start)
+                raise
+            except Exception as e:
+                self._release(backend, time.perf_counter() - start, e)
+                if started:
+                    raise
+                errors.append(f"{backend.url}: {e}")
+                continue
+            self._release(backend, time.perf_counter() - start)
+            return
+        raise self._failed(model, tried, errors)
+
+    # Health probing
+
+    def probe(self, backend, timeout=2.0):
+        """Check one backend with GET /api/tags; a success clears its failure state."""
+        try:
+            with urllib.request.urlopen(f"{backend.url}/api/tags", timeout=timeout) as response:
+                json.loads(response.read() or b"{}")
+        except Exception as e:
+            with self._lock:
+                backend.healthy = False
+                backend.last_error = f"probe: {type(e).__name__}: {e}"
+            return False
+        with self._lock:
+            backend.healthy = True
+            backend.consecutive_failures = 0
+        return True
+
+    def probe_all(self):
+        return [self.probe(backend) for backend in self.backends]
+
+    def start(self):
+        """Probe every backend now and then every health_interval seconds in the background; idempotent."""
+        if self._started:
+            return self
+        self._started = True
+        self.probe_all()
+        if self._thread is None and self.health_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.health_interval + 5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.health_interval):
+            self.probe_all()
+
+    def stats(self):
+        """Per-backend health, load and latency."""
+        with self._lock:
+            return [backend.stats() for backend in self.backends]
+
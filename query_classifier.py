@@ -0,0 +1,131 @@
+"""
+Local query classifier for the Grocery Price Assistant
+
+Assigns one of the QueryType labels to a question from keyword, quantity
+pattern and catalog-name features, together with a confidence score. Only
+questions classified below CLASSIFIER_CONFIDENCE_THRESHOLD need the LLM
+classifier chain.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+from config import CURRENCY_SYMBOL
+from shopping_parser import build_name_index, find_item_mentions
+from units import NUMBER_PATTERN, UNIT_PATTERN
+
+QUERY_TYPES = ("price_query", "shopping_list", "category_query", "comparison_query", "unknown")
+
+_QUANTITY_RE = re.compile(rf"(?<![\w.])(?:{NUMBER_PATTERN}|an?)\s*(?:{UNIT_PATTERN})(?!\w)", re.IGNORECASE)
+_BARE_NUMBER_RE = re.compile(r"(?<![\w.₹])\d+(?:\.\d+)?(?!\w)")
+
+_PRICE_RE = re.compile(r"\b(?:price|prices|priced|cost|costs|rate|rates|how much)\b", re.IGNORECASE)
+_LIST_RE = re.compile(r"\b(?:buy|need|want|calculate|total|bill|order|get me)\b", re.IGNORECASE)
+_CATEGORY_RE = re.compile(
+    r"\b(?:category|categories|section|what items|which items|show me all|list all|all items)\b", re.IGNORECASE
+)
+_COMPARISON_RE = re.compile(
+    r"\b(?:compare|comparison|cheaper|costlier|more expensive|less expensive|difference|versus|vs|which is)\b",
+    re.IGNORECASE,
+)
+_SUPERLATIVE_RE = re.compile(
+    r"\b(?:most expensive|least expensive|cheapest|costliest|priciest|highest|lowest)\b", re.IGNORECASE
+)
+# Price filters ("under ₹50", "between ₹30 and ₹60") are comparisons, not budgets
+_AMOUNT = rf"(?:{re.escape(CURRENCY_SYMBOL)}|rs\.?|inr)\s*\d+(?:\.\d+)?"
+_RANGE_RE = re.compile(
+    rf"\b(?:under|below|less than|cheaper than|at most|up to|upto|within|over|above|more than|costlier than"
+    rf"|at least|greater than|between)\s+{_AMOUNT}(?:\s*(?:and|-|to)\s*{_AMOUNT})?",
+    re.IGNORECASE,
+)
+_BUDGET_RE = re.compile(
+    rf"{re.escape(CURRENCY_SYMBOL)}\s*\d|\brs\.?\s*\d|\bbudget\b|\bhow many\b|\bafford\b|\bif i have\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class Classification:
+    """A query type label with its confidence and the features that produced it."""
+    type: str
+    confidence: float
+    features: List[str] = field(default_factory=list)
+
+    @property
+    def explanation(self):
+        return "Local classifier features: " + (", ".join(self.features) or "none")
+
+
+class LocalQueryClassifier:
+    """Feature-weighted classifier that needs no LLM round trip."""
+
+    def __init__(self, item_lookup, name_index=None, categories=None):
+        self.name_index = name_index if name_index is not None else build_name_index(item_lookup)
+        if categories is None:
+            categories = {item.get("category") for item in item_lookup.values()}
+        categories = {category for category in categories if category}
+        self.category_re = None
+        if categories:
+            pattern = "|".join(re.escape(c) for c in sorted(categories, key=len, reverse=True))
+            self.category_re = re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE)
+
+    def classify(self, question) -> Classification:
+        scores = dict.fromkeys(QUERY_TYPES, 0.0)
+        scores["unknown"] = 0.5
+        features = []
+
+        items = find_item_mentions(question, self.name_index)
+        quantities = len(_QUANTITY_RE.findall(question))
+        if not quantities and items and _BARE_NUMBER_RE.search(question):
+            # "3 bread" or "6 eggs": a bare number next to catalog items
+            quantities = len(_BARE_NUMBER_RE.findall(question))
+        if items:
+            features.append(f"{len(items)} catalog item(s)")
+        if quantities:
+            features.append(f"{quantities} quantity mention(s)")
+
+        has_range = bool(_RANGE_RE.search(question))
+        has_budget = bool(_BUDGET_RE.search(_RANGE_RE.sub(" ", question)))
+        has_comparison = bool(_COMPARISON_RE.search(question))
+        has_superlative = bool(_SUPERLATIVE_RE.search(question))
+
+        if has_budget:
+            # Budget questions are answered by the general-purpose fallback chain
+            scores["unknown"] += 4
+            features.append("budget wording")
+
+        if has_range:
+            scores["comparison_query"] += 6
+            features.append("price range wording")
+
+        if has_comparison or has_superlative:
+            scores["comparison_query"] += 4 + (2 if has_superlative else 0)
+            if len(items) >= 2:
+                scores["comparison_query"] += 1
+            features.append("superlative wording" if has_superlative else "comparison wording")
+
+        if self.category_re is not None and self.category_re.search(question):
+            scores["category_query"] += 3
+            features.append("category name")
+        if _CATEGORY_RE.search(question):
+            scores["category_query"] += 2
+            features.append("listing wording")
+
+        if quantities and items and not has_budget:
+            scores["shopping_list"] += 3 + min(quantities - 1, 3)
+        if _LIST_RE.search(question):
+            scores["shopping_list"] += 1
+            features.append("shopping wording")
+
+        if _PRICE_RE.search(question):
+            scores["price_query"] += 2
+            features.append("price wording")
+        if items:
+            scores["price_query"] += 1
+        if quantities or has_comparison or has_superlative or has_range:
+            scores["price_query"] -= 2
+
+        label = max(scores, key=scores.get)
+        positive_total = sum(score for score in scores.values() if score > 0)
+        confidence = scores[label] / positive_total if positive_total else 0.0
+        return Classification(type=label, confidence=round(confidence, 3), features=features)
@@ -0,0 +1,508 @@
+"""
+Index-backed query engine for the Grocery Price Assistant
+
+Category listings, cheapest/most expensive (top-k) questions, "cheaper per
+kg" comparisons and price range filters are pure lookups, so they are
+answered here from indexes over the ColumnarCatalog instead of asking the LLM
+to scan the catalog:
+
+- category -> rows
+- rows sorted by price, overall and per category
+- rows sorted by price per base unit (g, ml, count, packet), overall and per category
+
+Top-k reads the ends of a sorted index and range filters bisect it, so both
+take O(log n + k). QueryEngine.answer returns None for anything it cannot
+answer with certainty, and the caller falls back to the LLM chains.
+"""
+import math
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from decimal import Decimal
+
+from config import CURRENCY_SYMBOL
+from retrieval import STOPWORDS
+from shopping_parser import find_item_mentions
+from units import NUMBER_PATTERN, UNIT_PATTERN, format_number, parse_number, to_base
+
+# Unit prices are shown per kg, per liter, per piece or per packet unless the question names a unit
+DISPLAY_UNITS = {
+    "g": ("kg", 1000),
+    "ml": ("liter", 1000),
+    "count": ("piece", 1),
+    "packet": ("packet", 1),
+}
+
+_AMOUNT = rf"(?:{re.escape(CURRENCY_SYMBOL)}|\brs\.?|\binr)\s*(\d+(?:\.\d+)?)"
+
+_PER_UNIT_RE = re.compile(rf"\bper\s+(?:an?\s+)?({UNIT_PATTERN})\b", re.IGNORECASE)
+_EXPENSIVE_RE = re.compile(
+    r"\b(?:most expensive|costliest|priciest|highest(?:[- ]priced)?|dearest)\b", re.IGNORECASE
+)
+_CHEAP_RE = re.compile(
+    r"\b(?:cheapest|least expensive|lowest(?:[- ]priced)?|most affordable)\b", re.IGNORECASE
+)
+_CHEAPER_RE = re.compile(r"\b(?:cheaper|less expensive|cheapest|lower)\b", re.IGNORECASE)
+_TOP_K_RE = re.compile(
+    rf"\b(?:top|first)\s+({NUMBER_PATTERN})\b|\b({NUMBER_PATTERN})\s+(?:most|least|cheapest|costliest|priciest"
+    r"|highest|lowest)\b",
+    re.IGNORECASE,
+)
+_BETWEEN_RE = re.compile(rf"\bbetween\s+{_AMOUNT}\s*(?:and|-|to)\s*{_AMOUNT}", re.IGNORECASE)
+_MAX_PRICE_RE = re.compile(
+    rf"\b(?:under|below|less than|cheaper than|at most|up to|upto|within|not more than)\s+{_AMOUNT}", re.IGNORECASE
+)
+_MIN_PRICE_RE = re.compile(
+    rf"\b(?:over|above|more than|costlier than|at least|greater than)\s+{_AMOUNT}", re.IGNORECASE
+)
+_WORD_RE = re.compile(r"\w+")
+
+# Words that do not narrow which items a question is about ("cheapest item in your store")
+_SCOPE_WORDS = STOPWORDS | {
+    "product", "products", "thing", "things", "one", "ones", "grocery", "groceries", "everything", "anything",
+    "inventory", "catalog", "catalogue", "store", "shop", "stock", "list", "available", "sold", "sell", "sells",
+    "we", "there", "that", "get", "tell", "give", "find", "know", "please", "by", "on", "at", "be", "whole",
+    "entire", "overall", "priced", "costing", "unit", "cheap", "more", "less", "than", "rs", "inr", "s",
+}
+
+
+def _money(value):
+    return f"{CURRENCY_SYMBOL}{format_number(Decimal(repr(value)))}"
+
+
+def category_matcher(categories):
+    """
+    Spellings of the categories a question may use (singular or plural) mapped to
+    the category, and a regex finding them; the regex is None without categories.
+    """
+    spellings = {}
+    for category in categories:
+        lower = category.lower()
+        for variant in (lower, lower.rstrip("s"), lower + "s"):
+            spellings.setdefault(variant, category)
+    if not spellings:
+        return spellings, None
+    pattern = "|".join(re.escape(s) for s in sorted(spellings, key=len, reverse=True))
+    return spellings, re.compile(rf"\b({pattern})\b", re.IGNORECASE)
+
+
+def parse_per_unit(question):
+    """(base unit, base units per display unit, display unit) for "per kg" style wording, or None."""
+    match = _PER_UNIT_RE.search(question)
+    if not match:
+        return None
+    base = to_base(1, match.group(1))
+    if base is None:
+        return None
+    return base[1], float(base[0]), match.group(1).lower()
+
+
+def parse_top_k(question):
+    """How many items a superlative asks for ("top 3 cheapest"), 1 by default."""
+    match = _TOP_K_RE.search(question)
+    if not match:
+        return 1
+    number = parse_number(match.group(1) or match.group(2))
+    return max(int(number), 1) if number is not None else 1
+
+
+def parse_price_bounds(question):
+    """(low, high) price bounds from range wording, or None."""
+    match = _BETWEEN_RE.search(question)
+    if match:
+        low, high = sorted((float(match.group(1)), float(match.group(2))))
+        return low, high
+    high = _MAX_PRICE_RE.search(question)
+    low = _MIN_PRICE_RE.search(question)
+    if high is None and low is None:
+        return None
+    return (float(low.group(1)) if low else None), (float(high.group(1)) if high else None)
+
+
+def asks_superlative(question):
+    """Whether a question asks for the cheapest or most expensive items."""
+    return bool(_EXPENSIVE_RE.search(question) or _CHEAP_RE.search(question))
+
+
+class PriceIndex:
+    """Rows sorted by a price column, for top-k reads and bisected range filters."""
+
+    __slots__ = ("prices", "rows")
+
+    def __init__(self, rows, values):
+        ordered = sorted(rows, key=values.__getitem__)
+        self.rows = array("q", ordered)
+        self.prices = array("d", (values[row] for row in ordered))
+
+    @classmethod
+    def from_arrays(cls, rows, prices):
+        """An index over rows already sorted by price, e.g. memoryviews of a mapped snapshot."""
+        index = cls.__new__(cls)
+        index.rows = rows
+        index.prices = prices
+        return index
+
+    def repriced(self, old_values, values, changed):
+        """
+        A copy with the changed rows moved to the positions of their new values, in
+        O(n) copying plus O(k log n) bisects. Rows are ordered by (value, row), as in an
+        index built from scratch, so each changed row is found by bisecting on its old value.
+        """
+        if len(changed) * 8 > len(self.rows):
+            # Most rows moved: sorting again is cheaper
+            return PriceIndex(sorted(self.rows), values)
+        removed = []
+        for row in changed:
+            position = self._position(self.prices, self.rows, old_values[row], row)
+            if position < len(self.rows) and self.rows[position] == row:
+                removed.append(position)
+        if not removed:
+            return self
+        removed.sort()
+        rows, prices = array("q"), array("d")
+        start = 0
+        for position in removed:
+            rows.extend(self.rows[start:position])
+            prices.extend(self.prices[start:position])
+            start = position + 1
+        rows.extend(self.rows[start:])
+        prices.extend(self.prices[start:])
+
+        moved = sorted((values[self.rows[position]], self.rows[position]) for position in removed)
+        new_rows, new_prices = array("q"), array("d")
+        start = 0
+        for value, row in moved:
+            position = self._position(prices, rows, value, row)
+            new_rows.extend(rows[start:position])
+            new_prices.extend(prices[start:position])
+            new_rows.append(row)
+            new_prices.append(value)
+            start = position
+        new_rows.extend(rows[start:])
+        new_prices.extend(prices[start:])
+        return PriceIndex.from_arrays(new_rows, new_prices)
+
+    @staticmethod
+    def _position(prices, rows, value, row):
+        """Where (value, row) is, or would be inserted, in rows ordered by (price, row)."""
+        start = bisect_left(prices, value)
+        end = bisect_right(prices, value, start)
+        return bisect_left(rows, row, start, end)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lowest(self, k=1):
+        return list(self.rows[:k])
+
+    def highest(self, k=1):
+        return list(reversed(self.rows[max(len(self.rows) - k, 0):]))
+
+    def between(self, low=None, high=None):
+        """Rows priced within [low, high] (either bound may be None), cheapest first."""
+        start = 0 if low is None else bisect_left(self.prices, low)
+        end = len(self.prices) if high is None else bisect_right(self.prices, high)
+        return list(self.rows[start:end])
+
+
+class QueryEngine:
+    """Deterministic answers to category, superlative, comparison and range questions."""
+
+    def __init__(self, columns, name_index, indexes=None):
+        """indexes: (category_rows, price_index, unit_price_index) already built, e.g. from a snapshot."""
+        self.columns = columns
+        self.name_index = name_index
+        self.category_rows, self.price_index, self.unit_price_index = indexes or self.build_indexes(columns)
+
+        self._category_spellings, self.category_re = category_matcher(self.category_rows)
+
+    @staticmethod
+    def build_indexes(columns):
+        """Category -> rows, and the price and price per base unit indexes, overall and per category."""
+        rows_by_category = defaultdict(list)
+        rows_by_unit = defaultdict(list)
+        for row in range(len(columns)):
+            category = columns.categories.values[columns.category_codes[row]]
+            rows_by_category[category].append(row)
+            base_unit = columns.base_unit(row)
+            if base_unit is not None:
+                rows_by_unit[(None, base_unit)].append(row)
+                rows_by_unit[(category, base_unit)].append(row)
+
+        category_rows = {category: rows for category, rows in rows_by_category.items() if category}
+        price_index = {None: PriceIndex(range(len(columns)), columns.prices)}
+        price_index.update((category, PriceIndex(rows, columns.prices)) for category, rows in category_rows.items())
+        # (category or None, base unit) -> rows sorted by price per base unit
+        unit_price_index = {key: PriceIndex(rows, columns.unit_prices) for key, rows in rows_by_unit.items()}
+        return category_rows, price_index, unit_price_index
+
+    def with_prices(self, columns, rows):
+        """
+        An engine over columns whose prices changed at rows (ColumnarCatalog.with_prices):
+        the category index and the price indexes without those rows are shared, and the
+        changed rows are moved within the others.
+        """
+        rows_by_price_key = defaultdict(list)
+        rows_by_unit_key = defaultdict(list)
+        for row in rows:
+            category = columns.categories.values[columns.category_codes[row]]
+            rows_by_price_key[None].append(row)
+            rows_by_price_key[category].append(row)
+            base_unit = columns.base_unit(row)
+            if base_unit is not None:
+                rows_by_unit_key[(None, base_unit)].append(row)
+                rows_by_unit_key[(category, base_unit)].append(row)
+        price_index = dict(self.price_index)
+        for key in rows_by_price_key.keys() & price_index.keys():
+            price_index[key] = price_index[key].repriced(self.columns.prices, columns.prices, rows_by_price_key[key])
+        unit_price_index = dict(self.unit_price_index)
+        for key in rows_by_unit_key.keys() & unit_price_index.keys():
+            unit_price_index[key] = unit_price_index[key].repriced(self.columns.unit_prices, columns.unit_prices,
+                                                                   rows_by_unit_key[key])
+        return QueryEngine(columns, self.name_index, (self.category_rows, price_index, unit_price_index))
+
+    # Index lookups
+
+    def find_category(self, question):
+        """The catalog category named in a question, or None."""
+        if self.category_re is None:
+            return None
+        match = self.category_re.search(question)
+        return self._category_spellings[match.group(1).lower()] if match else None
+
+    def items_in_category(self, category):
+        return [self.columns[row] for row in self.category_rows.get(category, ())]
+
+    def ranked(self, k=1, cheapest=True, category=None, base_unit=None):
+        """The k cheapest (or most expensive) items, by price or by price per base_unit."""
+        index = self._index(category, base_unit)
+        if index is None:
+            return []
+        rows = index.lowest(k) if cheapest else index.highest(k)
+        return [self.columns[row] for row in rows]
+
+    def in_price_range(self, low=None, high=None, category=None, base_unit=None, scale=1):
+        """Items priced within [low, high], per scale base units when base_unit is given."""
+        index = self._index(category, base_unit)
+        if index is None:
+            return []
+        low = None if low is None else low / scale
+        high = None if high is None else high / scale
+        return [self.columns[row] for row in index.between(low, high)]
+
+    def _index(self, category, base_unit):
+        if base_unit is None:
+            return self.price_index.get(category)
+        return self.unit_price_index.get((category, base_unit))
+
+    # Question answering
+
+    def answer(self, question, query_type):
+        """Answer a category_query or comparison_query, or return None to leave it to the LLM."""
+        if query_type == "category_query":
+            return self.answer_category(question)
+        if query_type == "comparison_query":
+            return self.answer_comparison(question)
+        return None
+
+    def answer_prices(self, question):
+        """List the price of every item a question names, or None if it names none."""
+        items = [self.columns.find(name) for name in find_item_mentions(question, self.name_index)]
+        items = [item for item in items if item is not None]
+        if not items:
+            return None
+        return "\n".join(f"{item.name} costs {_money(item.price)} per {item.unit}" for item in items)
+
+    def answer_category(self, question):
+        category = self.find_category(question)
+        if category is None or self._unresolved_scope(question):
+            return None
+        if parse_price_bounds(question) is not None:
+            return self.answer_range(question, category)
+        if asks_superlative(question):
+            return self.answer_superlative(question, category)
+
+        lines = [f"Items in the {category} category:"]
+        lines.extend(f"- {item.name}: {_money(item.price)} per {item.unit}" for item in self.items_in_category(category))
+        return "\n".join(lines)
+
+    def answer_comparison(self, question):
+        mentions = find_item_mentions(question, self.name_index)
+        if len(mentions) >= 2:
+            return self.answer_item_comparison(question, mentions)
+        if mentions:
+            return None
+        category = self.find_category(question)
+        if parse_price_bounds(question) is not None:
+            return self.answer_range(question, category)
+        if asks_superlative(question):
+            return self.answer_superlative(question, category)
+        return None
+
+    def answer_superlative(self, question, category=None):
+        """
+        "most expensive item", "3 cheapest dairy items", "cheapest per kg". Items are
+        ranked by price per base unit, grouped by unit when they are not all sold by the
+        same one; unless the question names a unit, the top items by listed price follow.
+        """
+        if self._unresolved_scope(question):
+            return None
+        cheapest = bool(_CHEAP_RE.search(question)) and not _EXPENSIVE_RE.search(question)
+        k = parse_top_k(question)
+        word = "cheapest" if cheapest else "most expensive"
+        scope = f" in the {category} category" if category else ""
+        asked_unit = parse_per_unit(question)
+        per_unit = asked_unit or self._common_unit(category)
+        if per_unit is None:
+            answer = self._answer_superlative_by_unit(k, cheapest, category, word, scope)
+        else:
+            answer = self._answer_superlative_per_unit(k, cheapest, category, word, scope, per_unit)
+        if answer is None or asked_unit is not None:
+            return answer
+        # "most expensive item" may mean the highest listed price, so give that item too
+        return "\n".join([answer] + self._listed_price_lines(k, cheapest, category, word, scope))
+
+    def _answer_superlative_per_unit(self, k, cheapest, category, word, scope, per_unit):
+        items = self.ranked(k, cheapest, category, per_unit[0])
+        if not items:
+            return None
+
+        unit_text = f" per {per_unit[2]}"
+        if k == 1:
+            item = items[0]
+            return f"The {word} item{scope}{unit_text} is {item.name} at {self._listed_price_text(item, per_unit)}."
+        lines = [f"The {len(items)} {word} items{scope}{unit_text}:"]
+        lines.extend(f"{position}. {item.name}: {self._listed_price_text(item, per_unit)}"
+                     for position, item in enumerate(items, 1))
+        return "\n".join(lines)
+
+    def _listed_price_lines(self, k, cheapest, category, word, scope):
+        """The k cheapest (or most expensive) items by the price they are listed at, whatever the quantity."""
+        items = self.ranked(k, cheapest, category)
+        if k == 1:
+            return [f"By listed price, the {word} item{scope} is {items[0].name} at "
+                    f"{_money(items[0].price)} per {items[0].unit}."] if items else []
+        lines = [f"By listed price, the {len(items)} {word} items{scope}:"] if items else []
+        lines.extend(f"{position}. {item.name}: {_money(item.price)} per {item.unit}"
+                     for position, item in enumerate(items, 1))
+        return lines
+
+    def _answer_superlative_by_unit(self, k, cheapest, category, word, scope):
+        """Top-k per base unit for items sold by weight, volume, count and packet alike."""
+        lines = []
+        for base_unit, (label, scale) in DISPLAY_UNITS.items():
+            items = self.ranked(k, cheapest, category, base_unit)
+            if items:
+                per_unit = (base_unit, scale, label)
+                ranked = ", ".join(f"{item.name} at {self._listed_price_text(item, per_unit)}" for item in items)
+                lines.append(f"- per {label}: {ranked}")
+        if not lines:
+            return None
+        subject = f"The {word} item{scope}" if k == 1 else f"The {k} {word} items{scope}"
+        return "\n".join([f"{subject}, by the unit items are sold in:"] + lines)
+
+    def answer_range(self, question, category=None):
+        """"items under ₹50", "dairy items between ₹40 and ₹80", "produce over ₹50 per kg"."""
+        if self._unresolved_scope(question):
+            return None
+        low, high = parse_price_bounds(question)
+        per_unit = parse_per_unit(question)
+        base_unit, scale, unit_label = per_unit if per_unit else (None, 1, None)
+        items = self.in_price_range(low, high, category, base_unit, scale)
+
+        if low is not None and high is not None:
+            bounds = f"between {_money(low)} and {_money(high)}"
+        elif high is not None:
+            bounds = f"at or under {_money(high)}"
+        else:
+            bounds = f"at or over {_money(low)}"
+        scope = f" in the {category} category" if category else ""
+        unit_text = f" per {unit_label}" if unit_label else ""
+        if not items:
+            return f"No items{scope} are priced {bounds}{unit_text}."
+        lines = [f"Items{scope} priced {bounds}{unit_text}:"]
+        lines.extend(f"- {item.name}: {self._price_text(item, per_unit)}" for item in items)
+        return "\n".join(lines)
+
+    def answer_item_comparison(self, question, mentions):
+        """
+        Compare named items per base unit (units.parse_unit of their catalog units), or
+        None when they are not all sold by the same base unit (e.g. milk per liter, curd per gm).
+        """
+        items = [self.columns.find(name) for name in mentions]
+        items = [item for item in items if item is not None]
+        if len(items) < 2:
+            return None
+
+        per_unit = parse_per_unit(question)
+        base_units = {item.base_unit for item in items}
+        if len(base_units) != 1 or None in base_units:
+            return None
+        base_unit = base_units.pop()
+        if per_unit is not None and per_unit[0] != base_unit:
+            # Asked per kg but the items are not sold by weight: not comparable locally
+            return None
+        if per_unit is None:
+            label, scale = DISPLAY_UNITS[base_unit]
+            per_unit = (base_unit, scale, label)
+
+        def sort_key(item):
+            return item.unit_price * per_unit[1]
+
+        ordered = sorted(items, key=sort_key, reverse=True)
+        lines = [f"- {item.name}: {self._listed_price_text(item, per_unit)}" for item in ordered]
+
+        unit_text = f" per {per_unit[2]}"
+        most, least = ordered[0], ordered[-1]
+        if math.isclose(sort_key(most), sort_key(least)):
+            summary = f"{' and '.join(item.name for item in ordered)} cost the same{unit_text}."
+        elif len(ordered) == 2 and _CHEAPER_RE.search(question):
+            summary = f"{least.name} is cheaper than {most.name}{unit_text}."
+        elif len(ordered) == 2:
+            summary = f"{most.name} is more expensive than {least.name}{unit_text}."
+        else:
+            summary = f"{most.name} is the most expensive and {least.name} the cheapest{unit_text}."
+        return "\n".join([summary] + lines)
+
+    # Question parsing helpers
+
+    def _common_unit(self, category):
+        """(base unit, base units per display unit, display unit) every item in scope is sold by, or None."""
+        index = self.price_index.get(category)
+        base_units = [base_unit for scope, base_unit in self.unit_price_index if scope == category]
+        if index is None or len(base_units) != 1 or base_units[0] not in DISPLAY_UNITS:
+            return None
+        if len(self.unit_price_index[(category, base_units[0])]) != len(index):
+            # Some items have units that could not be parsed
+            return None
+        label, scale = DISPLAY_UNITS[base_units[0]]
+        return base_units[0], scale, label
+
+    def _unresolved_scope(self, question):
+        """
+        Words of a question that narrow its scope beyond the category the engine
+        resolved ("fruit" without a Fruit category): answering those for the whole
+        catalog would be wrong, so callers leave them to the LLM.
+        """
+        text = question
+        for pattern in (_BETWEEN_RE, _MAX_PRICE_RE, _MIN_PRICE_RE, _PER_UNIT_RE, _TOP_K_RE, _EXPENSIVE_RE, _CHEAP_RE,
+                        _CHEAPER_RE, self.category_re):
+            if pattern is not None:
+                text = pattern.sub(" ", text)
+        return [word for word in _WORD_RE.findall(text.lower()) if word not in _SCOPE_WORDS and not word.isdigit()]
+
+    def _price_text(self, item, per_unit):
+        if per_unit is None or item.unit_price is None:
+            return f"{_money(item.price)} per {item.unit}"
+        return f"{_money(item.unit_price * per_unit[1])} per {per_unit[2]}"
+
+    def _listed_price_text(self, item, per_unit):
+        """Price per display unit, followed by the listed price when the item is sold in another quantity."""
+        text = self._price_text(item, per_unit)
+        if not self._is_display_unit(item, per_unit):
+            text += f" ({_money(item.price)} per {item.unit})"
+        return text
+
+    def _is_display_unit(self, item, per_unit):
+        return item.base_quantity is not None and math.isclose(item.base_quantity, per_unit[1])
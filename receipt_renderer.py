@@ -0,0 +1,404 @@
+"""
+Native receipt renderer for the Grocery Price Assistant
+
+Draws the markdown receipts built by grocery_receipt.generate_receipt straight
+to a PNG with Pillow, in process: no pandoc, xelatex or PDF rasterization.
+DejaVu Sans is used for every style, so the ₹ glyph is drawn natively instead
+of falling back to "Rs.".
+
+Fonts are loaded once per style and size, and text measurements are cached,
+so rendering a receipt after the first one only costs the layout and drawing.
+The same layout can be saved as a PDF, and receipts can also be rendered as
+plain text.
+
+Supported markdown: headings, paragraphs, **bold** / *italic* / `code`
+runs, bullet and numbered lists, pipe tables, horizontal rules and the
+\\[ ... \\] math blocks the LLM sometimes emits.
+"""
+import functools
+import os
+import re
+import textwrap
+
+from PIL import Image, ImageDraw, ImageFont
+
+from config import CURRENCY_SYMBOL, RECEIPT_FONT_DIR
+
+OUTPUT_FORMATS = ("png", "pdf", "txt")
+
+# A4 width at 150 dpi
+PAGE_WIDTH = 1240
+MARGIN = 80
+BASE_SIZE = 26
+LINE_SPACING = 1.45
+HEADING_SIZES = {1: 44, 2: 38, 3: 32, 4: 28, 5: 26, 6: 26}
+# Receipts are drawn in 8-bit grayscale: a third of the pixels of RGB to encode
+TEXT_COLOR = 33
+MUTED_COLOR = 110
+RULE_COLOR = 200
+TABLE_HEADER_FILL = 240
+TEXT_WIDTH = 72  # characters per line in plain text receipts
+
+_FONT_FILES = {
+    "regular": ("DejaVuSans.ttf",),
+    "bold": ("DejaVuSans-Bold.ttf", "DejaVuSans.ttf"),
+    "italic": ("DejaVuSans-Oblique.ttf", "DejaVuSans.ttf"),
+    "mono": ("DejaVuSansMono.ttf", "DejaVuSans.ttf"),
+}
+_FONT_DIRS = (
+    RECEIPT_FONT_DIR,
+    "/usr/share/fonts/truetype/dejavu",
+    "/usr/share/fonts/dejavu",
+    "/usr/share/fonts/TTF",
+    "/usr/local/share/fonts",
+    "/Library/Fonts",
+    os.path.expanduser("~/Library/Fonts"),
+    "C:/Windows/Fonts",
+)
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*$")
+_LIST_RE = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+_RULE_RE = re.compile(r"^(?:-{3,}|\*{3,}|_{3,})$")
+_TABLE_SEPARATOR_RE = re.compile(r"^\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?$")
+_INLINE_RE = re.compile(r"(\*\*.+?\*\*|__.+?__|\*[^*\s][^*]*?\*|`[^`]+`)")
+
+# LaTeX the model writes in calculations, reduced to plain text
+_MATH_REPLACEMENTS = [
+    (re.compile(r"\\(?:text|mathrm|textbf|mathbf)\{([^{}]*)\}"), r"\1"),
+    (re.compile(r"\\frac\{([^{}]*)\}\{([^{}]*)\}"), r"\1/\2"),
+    (re.compile(r"\\times"), "×"),
+    (re.compile(r"\\div"), "÷"),
+    (re.compile(r"\\cdot"), "·"),
+    (re.compile(r"\\approx"), "≈"),
+    (re.compile(r"\\(?:quad|qquad|,|;|!)"), " "),
+    (re.compile(r"\\([₹$%&#])"), r"\1"),
+    (re.compile(r"\\[a-zA-Z]+"), ""),
+    (re.compile(r"[{}]"), ""),
+]
+
+
+# Fonts and measurements
+
+@functools.lru_cache(maxsize=None)
+def get_font(style, size):
+    """Load (once) the TrueType font for a style and size."""
+    for filename in _FONT_FILES[style]:
+        for directory in _FONT_DIRS:
+            if directory and os.path.exists(os.path.join(directory, filename)):
+                return ImageFont.truetype(os.path.join(directory, filename), size)
+        try:
+            # Let Pillow search the platform font directories
+            return ImageFont.truetype(filename, size)
+        except OSError:
+            continue
+    print(f"Receipt font {_FONT_FILES[style][0]} not found; set RECEIPT_FONT_DIR. Using Pillow's default font.")
+    return ImageFont.load_default(size)
+
+
+@functools.lru_cache(maxsize=None)
+def has_native_currency():
+    """Whether the regular receipt font is DejaVu (which includes the ₹ glyph)."""
+    font = get_font("regular", BASE_SIZE)
+    return isinstance(font, ImageFont.FreeTypeFont) and "DejaVu" in (font.getname()[0] or "")
+
+
+@functools.lru_cache(maxsize=8192)
+def text_width(style, size, text):
+    return get_font(style, size).getlength(text)
+
+
+@functools.lru_cache(maxsize=None)
+def line_height(size):
+    return int(size * LINE_SPACING)
+
+
+# Markdown parsing
+
+def clean_math(text):
+    """Reduce a LaTeX math fragment to plain text: "\\text{Amount} = 75 \\times 2" -> "Amount = 75 × 2"."""
+    text = text.strip()
+    for pattern, replacement in _MATH_REPLACEMENTS:
+        text = pattern.sub(replacement, text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def inline_runs(text, style="regular"):
+    """Split inline markdown into (style, text) runs."""
+    text = re.sub(r"\\\((.*?)\\\)", lambda m: clean_math(m.group(1)), text)
+    runs = []
+    for part in _INLINE_RE.split(text):
+        if not part:
+            continue
+        if part.startswith(("**", "__")) and len(part) > 4:
+            runs.append(("bold", part[2:-2]))
+        elif part.startswith("`"):
+            runs.append(("mono", part[1:-1]))
+        elif part.startswith("*") and len(part) > 2:
+            runs.append(("italic" if style == "regular" else style, part[1:-1]))
+        else:
+            runs.append((style, part))
+    return runs
+
+
+def plain_text(text):
+    """Inline markdown with the markers removed."""
+    return "".join(run for _, run in inline_runs(text))
+
+
+def _table_cells(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|"):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split("|")]
+
+
+@functools.lru_cache(maxsize=64)
+def parse_markdown(text):
+    """
+    Parse receipt markdown into a tuple of blocks:
+    ("heading", level, text), ("paragraph", text), ("item", depth, marker, text),
+    ("table", header, rows), ("math", text) and ("rule",).
+    """
+    blocks = []
+    lines = text.strip().splitlines()
+    i = 0
+    while i < len(lines):
+        stripped = lines[i].strip()
+        if not stripped:
+            i += 1
+            continue
+
+        if stripped.startswith("\\["):
+            # Display math, possibly spread over several lines
+            math = [stripped[2:]]
+            while "\\]" not in math[-1] and i + 1 < len(lines):
+                i += 1
+                math.append(lines[i].strip())
+            math[-1] = math[-1].split("\\]")[0]
+            blocks.append(("math", clean_math(" ".join(math))))
+            i += 1
+            continue
+
+        if _RULE_RE.match(stripped):
+            blocks.append(("rule",))
+            i += 1
+            continue
+
+        heading = _HEADING_RE.match(stripped)
+        if heading:
+            blocks.append(("heading", len(heading.group(1)), heading.group(2)))
+            i += 1
+            continue
+
+        if stripped.startswith("|"):
+            table = []
+            while i < len(lines) and lines[i].strip().startswith("|"):
+                if not _TABLE_SEPARATOR_RE.match(lines[i].strip()):
+                    table.append(tuple(plain_text(cell) for cell in _table_cells(lines[i])))
+                i += 1
+            columns = max(len(row) for row in table)
+            table = [row + ("",) * (columns - len(row)) for row in table]
+            blocks.append(("table", table[0], tuple(table[1:])))
+            continue
+
+        item = _LIST_RE.match(lines[i])
+        if item:
+            depth = len(item.group(1).replace("\t", "    ")) // 2
+            marker = "•" if item.group(2) in "-*+" else item.group(2)
+            blocks.append(("item", depth, marker, item.group(3)))
+            i += 1
+            continue
+
+        # Paragraph: consecutive lines that do not start another block
+        paragraph = [stripped]
+        i += 1
+        while i < len(lines):
+            following = lines[i].strip()
+            if (not following or following.startswith(("|", "\\[", "#")) or _RULE_RE.match(following)
+                    or _LIST_RE.match(lines[i])):
+                break
+            paragraph.append(following)
+            i += 1
+        blocks.append(("paragraph", " ".join(paragraph)))
+    return tuple(blocks)
+
+
+# Layout
+
+def wrap_runs(runs, size, max_width):
+    """Break styled runs into lines of (style, text, x) fragments no wider than max_width."""
+    space = text_width("regular", size, " ")
+    lines = []
+    line = []
+    x = 0
+    need_space = False
+    for style, text in runs:
+        for piece in re.split(r"(\s+)", text):
+            if not piece:
+                continue
+            if piece.isspace():
+                need_space = bool(line)
+                continue
+            width = text_width(style, size, piece)
+            gap = space if need_space else 0
+            if line and x + gap + width > max_width:
+                lines.append(line)
+                line, x, gap = [], 0, 0
+            line.append((style, piece, x + gap))
+            x += gap + width
+            need_space = False
+    if line:
+        lines.append(line)
+    return lines
+
+
+class _Layout:
+    """Accumulates draw operations top to bottom."""
+
+    def __init__(self, width):
+        self.width = width
+        self.content_width = width - 2 * MARGIN
+        self.y = MARGIN
+        self.ops = []
+
+    def text_lines(self, runs, size, x=MARGIN, max_width=None, color=TEXT_COLOR):
+        for line in wrap_runs(runs, size, max_width or self.content_width - (x - MARGIN)):
+            for style, text, offset in line:
+                self.ops.append(("text", x + offset, self.y, style, size, text, color))
+            self.y += line_height(size)
+
+    def rule(self):
+        self.y += BASE_SIZE // 2
+        self.ops.append(("line", (MARGIN, self.y, self.width - MARGIN, self.y), RULE_COLOR, 2))
+        self.y += BASE_SIZE // 2 + BASE_SIZE // 2
+
+    def table(self, header, rows, size=BASE_SIZE - 2):
+        padding = size // 2
+        columns = len(header)
+        natural = [
+            max(text_width("bold" if r == 0 else "regular", size, row[c]) for r, row in enumerate((header,) + rows))
+            + 2 * padding
+            for c in range(columns)
+        ]
+        scale = min(1.0, self.content_width / sum(natural))
+        widths = [w * scale for w in natural]
+
+        for r, row in enumerate((header,) + rows):
+            style = "bold" if r == 0 else "regular"
+            cells = [wrap_runs([(style, cell)], size, max(widths[c] - 2 * padding, 1)) for c, cell in enumerate(row)]
+            height = max(len(lines) for lines in cells) * line_height(size) + padding
+            top = self.y
+            if r == 0:
+                self.ops.append(("rect", (MARGIN, top, MARGIN + sum(widths), top + height), TABLE_HEADER_FILL))
+            x = MARGIN
+            for c, lines in enumerate(cells):
+                for n, line in enumerate(lines):
+                    for fragment_style, text, offset in line:
+                        self.ops.append(("text", x + padding + offset, top + padding // 2 + n * line_height(size),
+                                         fragment_style, size, text, TEXT_COLOR))
+                x += widths[c]
+            self.ops.append(("line", (MARGIN, top + height, MARGIN + sum(widths), top + height), RULE_COLOR, 1))
+            self.y = top + height
+        self.y += BASE_SIZE // 2
+
+
+@functools.lru_cache(maxsize=64)
+def layout(markdown_text, width=PAGE_WIDTH):
+    """Lay out a receipt. Returns (draw operations, page height)."""
+    if not has_native_currency():
+        markdown_text = markdown_text.replace(CURRENCY_SYMBOL, "Rs.")
+    page = _Layout(width)
+    for block in parse_markdown(markdown_text):
+        kind = block[0]
+        if kind == "heading":
+            size = HEADING_SIZES[block[1]]
+            page.y += size // 3
+            page.text_lines(inline_runs(block[2], "bold"), size)
+            page.y += size // 4
+        elif kind == "paragraph":
+            page.text_lines(inline_runs(block[1]), BASE_SIZE)
+            page.y += BASE_SIZE // 2
+        elif kind == "item":
+            _, depth, marker, text = block
+            indent = MARGIN + depth * 2 * BASE_SIZE
+            page.ops.append(("text", indent, page.y, "regular", BASE_SIZE, marker, TEXT_COLOR))
+            page.text_lines(inline_runs(text), BASE_SIZE, x=indent + 1.5 * BASE_SIZE)
+        elif kind == "math":
+            page.text_lines([("italic", block[1])], BASE_SIZE, x=MARGIN + 3 * BASE_SIZE, color=MUTED_COLOR)
+        elif kind == "table":
+            page.y += BASE_SIZE // 4
+            page.table(block[1], block[2])
+        elif kind == "rule":
+            page.rule()
+    return tuple(page.ops), int(page.y + MARGIN)
+
+
+# Output
+
+def render_image(markdown_text, width=PAGE_WIDTH):
+    """Render receipt markdown to a Pillow image."""
+    ops, height = layout(markdown_text, width)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for op in ops:
+        if op[0] == "text":
+            _, x, y, style, size, text, color = op
+            draw.text((x, y), text, font=get_font(style, size), fill=color)
+        elif op[0] == "line":
+            draw.line(op[1], fill=op[2], width=op[3])
+        elif op[0] == "rect":
+            draw.rectangle(op[1], fill=op[2])
+    return image
+
+
+def render_text(markdown_text, width=TEXT_WIDTH):
+    """Render receipt markdown as plain text with aligned table columns."""
+    out = []
+    for block in parse_markdown(markdown_text):
+        kind = block[0]
+        if kind == "heading":
+            text = plain_text(block[2])
+            out.extend(["", text, ("=" if block[1] == 1 else "-") * min(len(text), width)])
+        elif kind == "paragraph":
+            out.extend(textwrap.wrap(plain_text(block[1]), width) + [""])
+        elif kind == "item":
+            _, depth, marker, text = block
+            indent = "  " * depth
+            marker = "-" if marker == "•" else marker
+            out.extend(textwrap.wrap(plain_text(text), width, initial_indent=f"{indent}{marker} ",
+                                     subsequent_indent=f"{indent}  "))
+        elif kind == "math":
+            out.append(f"    {block[1]}")
+        elif kind == "table":
+            header, rows = block[1], block[2]
+            widths = [max(len(row[c]) for row in (header,) + rows) for c in range(len(header))]
+            line = "-+-".join("-" * w for w in widths)
+            out.append(" | ".join(cell.ljust(w) for cell, w in zip(header, widths)).rstrip())
+            out.append(line)
+            out.extend(" | ".join(cell.ljust(w) for cell, w in zip(row, widths)).rstrip() for row in rows)
+            out.append("")
+        elif kind == "rule":
+            out.append("-" * width)
+    return "\n".join(out).strip() + "\n"
+
+
+def render_receipt(markdown_text, output_path, output_format="png"):
+    """
+    Render receipt markdown to output_path as a PNG image, a PDF or plain text.
+    The extension is added when missing. Returns the path written.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown receipt format '{output_format}', expected one of {OUTPUT_FORMATS}")
+    if not output_path.endswith(f".{output_format}"):
+        output_path += f".{output_format}"
+
+    if output_format == "txt":
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(render_text(markdown_text))
+    elif output_format == "pdf":
+        render_image(markdown_text).save(output_path, "PDF", resolution=150)
+    else:
+        render_image(markdown_text).save(output_path, "PNG", compress_level=3)
+    return output_path
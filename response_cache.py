@@ -0,0 +1,186 @@
+"""
+Response cache for the Grocery Price Assistant
+
+Answers are cached under a normalized form of the question (case, whitespace,
+punctuation, number/unit canonicalization and price phrasing) together with a
+hash of the catalog they were computed from. Any price change produces a new
+catalog version, so stale answers are never served.
+
+The in-memory cache is a bounded LRU with optional TTL. An optional SQLite
+file backs it so cached answers survive restarts.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from units import NUMBER_PATTERN, UNIT_PATTERN, format_number, parse_number, to_base
+
+_QUANTITY_RE = re.compile(rf"(?<![\w.])({NUMBER_PATTERN})\s*({UNIT_PATTERN})(?!\w)", re.IGNORECASE)
+
+# Phrasings that all ask for a price ("how much does milk cost" == "price of milk")
+_PRICE_PHRASE_RE = re.compile(
+    r"\b(?:how much (?:does|do|is|are|will)|what(?:'s| is| are) the (?:price|cost|rate)s? of"
+    r"|(?:price|cost|rate)s? (?:of|for)|how much|costs?|prices?|rates?)\b"
+)
+
+_FILLER_WORDS = {"a", "an", "the", "please", "me", "tell", "what", "whats", "is", "are", "of", "for"}
+
+
+def _canonical_quantity(match):
+    quantity = parse_number(match.group(1))
+    base = to_base(quantity, match.group(2)) if quantity is not None else None
+    if base is None:
+        return match.group(0)
+    return f"{format_number(base[0])}{base[1]}"
+
+
+def normalize_query(question):
+    """
+    Reduce a question to a canonical cache key form:
+    "How much does Milk cost?" and "price of milk" -> "price: milk",
+    "0.5 kg Rice" and "500 grams of rice" -> "500g rice".
+    """
+    text = question.lower().replace("’", "'")
+    text = _QUANTITY_RE.sub(_canonical_quantity, text)
+
+    asks_price = bool(_PRICE_PHRASE_RE.search(text))
+    text = _PRICE_PHRASE_RE.sub(" ", text)
+
+    words = [w for w in re.findall(r"[\w.₹]+", text) if w not in _FILLER_WORDS]
+    words = [w.strip(".") for w in words if w.strip(".")]
+    normalized = " ".join(words)
+    return f"price: {normalized}" if asks_price else normalized
+
+
+def catalog_version(grocery_items):
+    """Hash of the catalog contents; changes whenever any item, price or unit changes."""
+    digest = hashlib.sha256()
+    for item in sorted(grocery_items, key=lambda i: str(i.get("name"))):
+        row = (item.get("name"), str(item.get("price")), item.get("unit"), item.get("category"))
+        digest.update(repr(row).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    """Bounded LRU answer cache keyed by catalog version and normalized question."""
+
+    def __init__(self, max_size=1024, ttl=None, path=None, version=""):
+        self.max_size = max_size
+        self.ttl = ttl or None
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # key -> (answer, created_at)
+        self._lock = threading.Lock()
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(version TEXT, query TEXT, answer TEXT, created_at REAL, PRIMARY KEY (version, query))"
+            )
+            self._db.commit()
+            self._prune_disk()
+
+    def _key(self, question):
+        return normalize_query(question)
+
+    def _expired(self, created_at):
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _prune_disk(self):
+        """Drop on-disk answers computed from other catalog versions or past their TTL."""
+        self._db.execute("DELETE FROM responses WHERE version != ?", (self.version,))
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        self._db.commit()
+
+    def set_version(self, version):
+        """Switch to a new catalog version, discarding every answer from older versions."""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._entries.clear()
+            if self._db is not None:
+                self._prune_disk()
+
+    def get(self, question):
+        """Return the cached answer for a question, or None on a miss."""
+        key = self._key(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT answer, created_at FROM responses WHERE version = ? AND query = ?",
+                    (self.version, key),
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._store(key, entry)
+
+            if entry is not None and self._expired(entry[1]):
+                self.expirations += 1
+                self._entries.pop(key, None)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, question, answer, version=None):
+        """
+        Cache the answer to a question under the current catalog version. Pass the
+        version the answer was computed from so answers that raced a catalog
+        refresh are dropped instead of being cached under the new version.
+        """
+        key = self._key(question)
+        entry = (answer, time.time())
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._store(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (version, query, answer, created_at) VALUES (?, ?, ?, ?)",
+                    (self.version, key, answer, entry[1]),
+                )
+                self._db.commit()
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self.version,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
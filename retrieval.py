@@ -0,0 +1,175 @@
+"""
+Catalog retrieval for the Grocery Price Assistant
+
+Instead of serializing the whole catalog into every prompt, CatalogRetriever
+picks the items relevant to a question (name matches, plus category siblings
+or price-ranked items where the query type needs them) and serializes them
+compactly, so prompt size grows with the query rather than with the catalog.
+
+Catalogs of up to PROMPT_PREFIX_MAX_ITEMS items are instead serialized once
+into prefix_catalog, which every chain puts in its shared leading prompt
+prefix so the model server can reuse the prompt cache across queries.
+"""
+import copy
+import json
+import math
+import re
+from collections import defaultdict
+
+from config import RETRIEVAL_TOP_K, RETRIEVAL_MAX_ITEMS, PROMPT_PREFIX_MAX_ITEMS
+
+# Words that never identify an item or category
+STOPWORDS = {
+    "a", "an", "and", "any", "are", "all", "buy", "calculate", "can", "category", "compare",
+    "cost", "costs", "do", "does", "for", "from", "have", "how", "i", "in", "is", "it", "item",
+    "items", "many", "me", "much", "my", "need", "of", "or", "per", "price", "prices", "show",
+    "the", "to", "want", "what", "which", "with", "you", "your",
+}
+
+# Words asking for the most or least expensive items
+_EXPENSIVE_WORDS = {"expensive", "costliest", "costlier", "priciest", "highest", "most"}
+_CHEAP_WORDS = {"cheap", "cheaper", "cheapest", "lowest", "least", "affordable"}
+
+# Catalog text of the shared prompt prefix when the catalog is too large to include
+LARGE_CATALOG_NOTE = "(Too large to list here; the items relevant to each query are given with the query.)"
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _tokens(text):
+    return [t for t in _WORD_RE.findall(text.lower()) if t not in STOPWORDS and not t.isdigit()]
+
+
+def _token_variants(token):
+    """Singular and plural spellings of a token ("tomatoes" -> "tomato", "apple" -> "apples")."""
+    variants = {token}
+    if token.endswith("es"):
+        variants.add(token[:-2])
+    if token.endswith("s"):
+        variants.add(token[:-1])
+    else:
+        variants.add(token + "s")
+    return variants
+
+
+def compact_item(item):
+    """Prompt representation of an item without the id and currency fields."""
+    return {
+        "name": item["name"],
+        "price": float(item["price"]),
+        "category": item.get("category"),
+        "unit": item.get("unit"),
+    }
+
+
+def compact_items(items):
+    """Serialize items as JSON with no indentation or redundant fields."""
+    return json.dumps([compact_item(item) for item in items], ensure_ascii=False, separators=(",", ":"))
+
+
+class CatalogRetriever:
+    """Inverted index over item names and categories used to build per-question prompt context."""
+
+    def __init__(self, grocery_items, top_k=RETRIEVAL_TOP_K, max_items=RETRIEVAL_MAX_ITEMS,
+                 prefix_max_items=PROMPT_PREFIX_MAX_ITEMS):
+        self.items = list(grocery_items)
+        self.top_k = top_k
+        self.max_items = max_items
+
+        # token -> positions of items whose name contains it
+        self.token_index = defaultdict(set)
+        # category token -> category name, category name -> positions
+        self.category_tokens = {}
+        self.category_index = defaultdict(list)
+
+        for position, item in enumerate(self.items):
+            for token in _tokens(item["name"]):
+                for variant in _token_variants(token):
+                    self.token_index[variant].add(position)
+            category = item.get("category")
+            if category:
+                self.category_index[category].append(position)
+                for token in _tokens(category):
+                    for variant in _token_variants(token):
+                        self.category_tokens[variant] = category
+
+        # Inverse document frequency so rare name words outweigh common ones
+        total = max(len(self.items), 1)
+        self.idf = {token: math.log(1 + total / len(positions)) for token, positions in self.token_index.items()}
+
+        self.catalog_in_prefix = len(self.items) <= prefix_max_items
+        self._index_prices()
+
+    def _index_prices(self):
+        # Positions ordered by price, most expensive first
+        self.by_price = sorted(range(len(self.items)), key=lambda p: float(self.items[p]["price"]), reverse=True)
+        # Serialized once per catalog so every prompt starts with byte-identical text
+        if self.catalog_in_prefix:
+            self.prefix_catalog = f"{compact_items(self.items)}\nAvailable categories: {', '.join(self.categories)}"
+        else:
+            self.prefix_catalog = LARGE_CATALOG_NOTE
+
+    def with_prices(self, grocery_items):
+        """
+        A retriever for the same items (same order, names and categories) with new
+        prices: the token and category indexes are shared, only the price order is redone.
+        """
+        retriever = copy.copy(self)
+        retriever.items = list(grocery_items)
+        retriever._index_prices()
+        return retriever
+
+    @property
+    def categories(self):
+        return sorted(self.category_index)
+
+    def retrieve(self, question, include_siblings=False, include_ranked=False):
+        """
+        Return the catalog items relevant to a question.
+
+        - Items are scored by the IDF-weighted name words they share with the question
+          and the top_k best are kept.
+        - include_siblings adds every item of the categories the question names
+          (or of the matched items' categories).
+        - include_ranked adds the most/least expensive items for superlative questions.
+        """
+        words = _tokens(question)
+        scores = defaultdict(float)
+        mentioned_categories = []
+        for word in words:
+            for variant in _token_variants(word):
+                for position in self.token_index.get(variant, ()):
+                    scores[position] += self.idf[variant]
+            category = next((self.category_tokens[v] for v in _token_variants(word) if v in self.category_tokens), None)
+            if category and category not in mentioned_categories:
+                mentioned_categories.append(category)
+
+        selected = sorted(scores, key=lambda p: (-scores[p], p))[:self.top_k]
+
+        if include_siblings:
+            categories = mentioned_categories or [self.items[p].get("category") for p in selected]
+            for category in categories:
+                selected.extend(self.category_index.get(category, ()))
+
+        if include_ranked:
+            word_set = set(words)
+            if word_set & _EXPENSIVE_WORDS:
+                selected.extend(self.by_price[:self.top_k])
+            if word_set & _CHEAP_WORDS:
+                selected.extend(reversed(self.by_price[-self.top_k:]))
+
+        # Deduplicate while keeping relevance order, then cap the prompt size
+        seen = set()
+        unique = [p for p in selected if not (p in seen or seen.add(p))]
+        return [self.items[p] for p in unique[:self.max_items]]
+
+    def context(self, question, include_siblings=False, include_ranked=False, include_categories=False):
+        """Compact prompt context holding only the items relevant to the question."""
+        if len(self.items) <= self.top_k:
+            items = self.items
+        else:
+            items = self.retrieve(question, include_siblings, include_ranked)
+        context = compact_items(items)
+        if include_categories:
+            context += f"\nAvailable categories: {', '.join(self.categories)}"
+        return context
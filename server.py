@@ -0,0 +1,440 @@
+"""
+Async HTTP service for the Grocery Price Assistant
+
+Exposes get_answer over HTTP so clients do not need to embed the LangChain
+stack. It is built on asyncio streams alone, so it adds no dependency.
+
+    POST /answer          {"question": "...", "timeout": 30}  -> {"answer": "...", "shared": false}
+    POST /answer/stream   same body, answer streamed as chunked text/plain
+    POST /receipt         {"query": "...", "format": "png"}   -> the rendered receipt
+    GET  /health          admission queue state, catalog version and Ollama backends
+    GET  /metrics         Prometheus metrics (telemetry.py)
+
+Backpressure: at most max_inflight requests are answered at once and at most
+max_queue wait for a slot; further requests are shed immediately with 429.
+Every request has a deadline (its "timeout" or SERVER_REQUEST_TIMEOUT) covering
+both queueing and answering; a missed deadline returns 504.
+
+Single-flight: concurrent /answer and /receipt requests for the same question
+(after normalize_query, on the same catalog version) share one computation and
+one admission slot instead of each calling the LLM.
+
+Receipts have the same content as CLI and batch receipts: the locally priced
+shopping list when there is one, otherwise the text answer.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+
+from config import (SERVER_HOST, SERVER_PORT, SERVER_MAX_INFLIGHT, SERVER_MAX_QUEUE, SERVER_REQUEST_TIMEOUT,
+                    PIPELINE_MODE, RECEIPT_RENDERER)
+from response_cache import normalize_query
+from streaming import ThinkStripper
+from telemetry import telemetry
+
+MAX_BODY_BYTES = 64 * 1024
+RECEIPT_CONTENT_TYPES = {"png": "image/png", "pdf": "application/pdf", "txt": "text/plain; charset=utf-8"}
+
+
+class Overloaded(Exception):
+    """The admission queue is full."""
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class AdmissionQueue:
+    """Bounded admission: max_inflight requests run, max_queue wait, the rest are rejected at once."""
+
+    def __init__(self, max_inflight=SERVER_MAX_INFLIGHT, max_queue=SERVER_MAX_QUEUE):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.inflight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_inflight)
+
+    @asynccontextmanager
+    async def slot(self, timeout):
+        """
+        Hold one of the max_inflight slots; raises Overloaded or asyncio.TimeoutError instead of waiting.
+        timeout may be a function returning the seconds left, re-read while queued so the wait can be extended.
+        """
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            if callable(timeout):
+                await self._acquire_until(timeout)
+            else:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        finally:
+            self.waiting -= 1
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._semaphore.release()
+
+    async def _acquire_until(self, remaining):
+        acquire = asyncio.ensure_future(self._semaphore.acquire())
+        try:
+            while not acquire.done():
+                seconds = remaining()
+                if seconds <= 0:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait({acquire}, timeout=seconds)
+        except BaseException:
+            if acquire.done() and not acquire.cancelled():
+                # Acquired just as the wait ended
+                self._semaphore.release()
+            else:
+                acquire.cancel()
+            raise
+
+
+class SingleFlight:
+    """Shares one in-flight computation between concurrent callers with the same key."""
+
+    def __init__(self):
+        self._calls = {}
+        self._deadlines = {}  # key -> deadlines of the callers waiting for it
+        self.shared = 0
+
+    async def do(self, key, factory, deadline):
+        """
+        Await factory(latest_deadline) or the identical call already running; returns
+        (result, shared). deadline is this caller's; latest_deadline() is the latest
+        deadline of the callers still waiting, so a call queued for the first caller
+        keeps its place for later callers that allow more time.
+        """
+        deadlines = self._deadlines.setdefault(key, [])
+        deadlines.append(deadline)
+        try:
+            task = self._calls.get(key)
+            shared = task is not None
+            if shared:
+                self.shared += 1
+            else:
+                task = asyncio.ensure_future(factory(lambda: max(self._deadlines.get(key, ()), default=0)))
+                self._calls[key] = task
+                task.add_done_callback(lambda done: self._forget(key, done))
+            # Shielded so a caller whose deadline passes does not cancel the call for the others
+            return await asyncio.shield(task), shared
+        finally:
+            deadlines.remove(deadline)
+            if not deadlines and self._deadlines.get(key) is deadlines:
+                del self._deadlines[key]
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here so an abandoned failure is not logged as unhandled
+
+
+class _SharedAnswers:
+    """
+    The get_answer methods areceipt_content uses, answered through an AnswerService:
+    admitted, shared with identical in-flight requests and bounded by one deadline.
+    """
+
+    def __init__(self, service, deadline):
+        self.service = service
+        self.deadline = deadline
+
+    async def ashopping_list(self, question):
+        return (await self.service.shopping_list(question, self.deadline))[0]
+
+    async def aget_answer(self, question):
+        return (await self.service.answer(question, self.deadline))[0]
+
+
+class AnswerService:
+    """HTTP front end over a get_answer from create_app."""
+
+    def __init__(self, get_answer, max_inflight=SERVER_MAX_INFLIGHT, max_queue=SERVER_MAX_QUEUE,
+                 request_timeout=SERVER_REQUEST_TIMEOUT, renderer=RECEIPT_RENDERER):
+        self.get_answer = get_answer
+        self.admission = AdmissionQueue(max_inflight, max_queue)
+        self.single_flight = SingleFlight()
+        self.request_timeout = request_timeout
+        self.renderer = renderer
+        self.started = time.time()
+
+    # Answering
+
+    def _deadline(self, payload):
+        timeout = payload.get("timeout", self.request_timeout)
+        try:
+            timeout = float(timeout)
+        except (TypeError, ValueError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "timeout must be a number of seconds")
+        if timeout <= 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "timeout must be positive")
+        return time.monotonic() + timeout
+
+    async def answer(self, question, deadline):
+        """The answer to question, shared with identical in-flight requests; returns (answer, shared)."""
+        return await self._shared("answer", question, deadline, self.get_answer.aget_answer)
+
+    async def shopping_list(self, question, deadline):
+        """
+        The structured ShoppingList for question, or None when it cannot be priced
+        locally, shared like answer; returns (shopping_list, shared).
+        """
+        return await self._shared("shopping_list", question, deadline, self.get_answer.ashopping_list)
+
+    async def _shared(self, kind, question, deadline, call):
+        """await call(question) in an admission slot, once for all identical in-flight requests."""
+        state = self.get_answer.catalog_sync.state
+        key = f"{kind}:{state.version}:{normalize_query(question)}"
+
+        async def compute(latest_deadline):
+            async with self.admission.slot(lambda: latest_deadline() - time.monotonic()):
+                return await call(question)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        # Each caller waits for the shared answer until its own deadline only
+        return await asyncio.wait_for(self.single_flight.do(key, compute, deadline), remaining)
+
+    async def render_receipt(self, query, output_format, deadline):
+        """
+        Render the receipt for query, with the same content as CLI and batch receipts
+        (grocery_receipt.areceipt_content); returns the file contents.
+        """
+        from grocery_receipt import areceipt_content, build_receipt, save_receipt, unique_receipt_name
+
+        markdown_text = build_receipt(await areceipt_content(query, _SharedAnswers(self, deadline)))
+        loop = asyncio.get_running_loop()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            base_path = os.path.join(temp_dir, unique_receipt_name())
+            path = await asyncio.wait_for(
+                loop.run_in_executor(None, save_receipt, markdown_text, base_path, output_format, self.renderer),
+                max(deadline - time.monotonic(), 0.001))
+            if not path:
+                raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, "Receipt rendering failed")
+            with open(path, "rb") as f:
+                return f.read()
+
+    # HTTP handling
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection until it closes."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._send_json(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Body too large"})
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self.dispatch(method, target.split("?", 1)[0], body, writer)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body, writer):
+        start = time.perf_counter()
+        status = HTTPStatus.OK
+        try:
+            if method == "GET" and path == "/health":
+                await self._send_json(writer, status, self.health())
+            elif method == "GET" and path == "/metrics":
+                await self._send(writer, status, telemetry.render_prometheus().encode("utf-8"),
+                                 "text/plain; version=0.0.4")
+            elif method == "POST" and path in ("/answer", "/answer/stream", "/receipt"):
+                payload = self._parse_json(body)
+                if path == "/answer":
+                    await self._answer(payload, writer)
+                elif path == "/answer/stream":
+                    await self._stream(payload, writer)
+                else:
+                    await self._receipt(payload, writer)
+            else:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {method} {path}")
+        except HTTPError as e:
+            status = e.status
+            await self._send_json(writer, status, {"error": e.message})
+        except Overloaded:
+            status = HTTPStatus.TOO_MANY_REQUESTS
+            await self._send_json(writer, status, {"error": "Too many requests queued, retry later"},
+                                  {"Retry-After": "1"})
+        except asyncio.TimeoutError:
+            status = HTTPStatus.GATEWAY_TIMEOUT
+            await self._send_json(writer, status, {"error": "Deadline exceeded"})
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            print(f"Error handling {method} {path}: {str(e)}")
+            status = HTTPStatus.INTERNAL_SERVER_ERROR
+            await self._send_json(writer, status, {"error": str(e)})
+        finally:
+            telemetry.metrics.inc("grocery_http_requests_total", path=path, status=int(status))
+            telemetry.metrics.observe("grocery_http_request_seconds", time.perf_counter() - start, path=path)
+
+    async def _answer(self, payload, writer):
+        question = self._required(payload, "question")
+        answer, shared = await self.answer(question, self._deadline(payload))
+        await self._send_json(writer, HTTPStatus.OK, {"answer": _visible(answer), "shared": shared})
+
+    async def _stream(self, payload, writer):
+        """Stream the visible answer; the deadline is checked between chunks."""
+        question = self._required(payload, "question")
+        deadline = self._deadline(payload)
+        async with self.admission.slot(deadline - time.monotonic()):
+            chunks = self.get_answer.astream(question)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                         b"Transfer-Encoding: chunked\r\n\r\n")
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), deadline - time.monotonic())
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        # Headers are already sent: end the body with a marker instead of a 504
+                        await self._write_chunk(writer, "\n[deadline exceeded]")
+                        break
+                    await self._write_chunk(writer, chunk)
+            finally:
+                await chunks.aclose()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+
+    async def _receipt(self, payload, writer):
+        query = self._required(payload, "query")
+        output_format = payload.get("format", "png")
+        if output_format not in RECEIPT_CONTENT_TYPES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"format must be one of {', '.join(RECEIPT_CONTENT_TYPES)}")
+        if self.renderer == "pandoc" and output_format != "png":
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "The pandoc renderer only produces PNG receipts")
+        data = await self.render_receipt(query, output_format, self._deadline(payload))
+        await self._send(writer, HTTPStatus.OK, data, RECEIPT_CONTENT_TYPES[output_format])
+
+    def health(self):
+        cascade_stats = self.get_answer.cascade_stats
+        return {
+            "status": "ok",
+            "inflight": self.admission.inflight,
+            "queued": self.admission.waiting,
+            "max_inflight": self.admission.max_inflight,
+            "max_queue": self.admission.max_queue,
+            "shared_requests": self.single_flight.shared,
+            "catalog_version": self.get_answer.catalog_sync.state.version,
+            "backends": self.get_answer.ollama_pool.stats(),
+            "cascade": cascade_stats.snapshot() if cascade_stats is not None else None,
+            "uptime_seconds": round(time.time() - self.started, 1),
+        }
+
+    @staticmethod
+    def _parse_json(body):
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+        return payload
+
+    @staticmethod
+    def _required(payload, field):
+        value = payload.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"'{field}' is required")
+        return value
+
+    @staticmethod
+    async def _send(writer, status, data, content_type, headers=None):
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(data)}"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def _send_json(self, writer, status, payload, headers=None):
+        await self._send(writer, status, json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                         "application/json", headers)
+
+    @staticmethod
+    async def _write_chunk(writer, text):
+        if text:
+            data = text.encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            await writer.drain()
+
+
+def _visible(answer):
+    """The answer with <think> reasoning sections removed."""
+    stripper = ThinkStripper()
+    return (stripper.feed(answer) + stripper.flush()).strip()
+
+
+async def serve(get_answer, host=SERVER_HOST, port=SERVER_PORT, **options):
+    """Run the HTTP service until cancelled."""
+    service = AnswerService(get_answer, **options)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Grocery Price Assistant listening on http://{host}:{port} "
+          f"(max {service.admission.max_inflight} in flight, {service.admission.max_queue} queued)")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Grocery Price Assistant over HTTP")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--pipeline", default=PIPELINE_MODE, help="two_stage or single_pass")
+    parser.add_argument("--max-inflight", type=int, default=SERVER_MAX_INFLIGHT, help="Requests answered at once")
+    parser.add_argument("--max-queue", type=int, default=SERVER_MAX_QUEUE, help="Requests waiting before 429s")
+    parser.add_argument("--timeout", type=float, default=SERVER_REQUEST_TIMEOUT, help="Default deadline in seconds")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the response cache (e.g. for load tests)")
+    parser.add_argument("--fake-ollama", action="store_true",
+                        help="Answer with fake_ollama.py's stub model and the sample catalog (no GPU or database)")
+    args = parser.parse_args()
+
+    from main import create_app
+
+    app_options = {}
+    if args.fake_ollama:
+        from db_setup import sample_catalog
+        from fake_ollama import FakeOllamaServer
+        app_options = {"base_url": FakeOllamaServer().start().base_url, "grocery_items": sample_catalog()}
+    get_answer = create_app(pipeline=args.pipeline, use_cache=not args.no_cache, **app_options)
+    try:
+        asyncio.run(serve(get_answer, args.host, args.port, max_inflight=args.max_inflight,
+                          max_queue=args.max_queue, request_timeout=args.timeout))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        get_answer.catalog_sync.stop()
+        get_answer.ollama_pool.stop()
+
+
+if __name__ == "__main__":
+    main()
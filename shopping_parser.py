@@ -0,0 +1,269 @@
+"""
+Deterministic shopping list parser for the Grocery Price Assistant
+
+Pulls quantity/unit/item triples out of queries such as
+"2kg rice and 3 packets of bread", resolves each item against the catalog
+lookup built in create_app, converts units and calculates line amounts and
+the total locally. Fragments that cannot be resolved are reported back so
+only those need to be sent to the LLM.
+"""
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import List, Optional
+
+from config import CURRENCY_SYMBOL
+from units import NUMBER_PATTERN, UNIT_PATTERN, format_number, parse_number, parse_unit, to_base
+
+# Separators between the items of a shopping list
+_SPLIT_RE = re.compile(r",|;|\+|&|\n|\band\b|\bplus\b", re.IGNORECASE)
+
+# A quantity, an optional unit and an optional "of": "2kg", "3 packets of", "half a dozen"
+_QUANTITY_RE = re.compile(
+    rf"(?<![\w.])(?P<qty>{NUMBER_PATTERN}|an?)(?:\s+an?)?\s*(?P<unit>{UNIT_PATTERN})?(?!\w)(?:\s+of\b)?",
+    re.IGNORECASE,
+)
+
+# Queries that mention numbers but are not shopping lists (budgets, comparisons)
+_NOT_A_LIST_RE = re.compile(
+    rf"{re.escape(CURRENCY_SYMBOL)}|\brs\b|\brupees?\b|\bbudget\b|\bhow many\b|\bafford\b"
+    r"|\bcompare\b|\bcheaper\b|\bexpensive\b|\bcostlier\b",
+    re.IGNORECASE,
+)
+
+_WORD_RE = re.compile(r"\w+")
+
+# Longest item name (in words) considered when matching against the catalog
+_MAX_NAME_WORDS = 6
+
+
+@dataclass
+class LineItem:
+    """A single resolved shopping list entry."""
+    name: str
+    quantity: Decimal
+    unit: str
+    unit_price: Decimal
+    catalog_unit: str
+    amount: Decimal
+
+    @property
+    def calculation(self):
+        return (
+            f"{self.name}: {CURRENCY_SYMBOL}{format_number(self.unit_price)} per {self.catalog_unit}"
+            f" × {format_number(self.quantity)} {self.unit} = {CURRENCY_SYMBOL}{format_number(self.amount)}"
+        )
+
+
+@dataclass
+class ParsedShoppingList:
+    """Result of parsing a query: resolved line items and unresolved fragments."""
+    items: List[LineItem] = field(default_factory=list)
+    unresolved: List[str] = field(default_factory=list)
+
+    @property
+    def total(self):
+        return sum((item.amount for item in self.items), Decimal(0))
+
+
+def _normalize(text):
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def _name_variants(name):
+    """Spellings a user might use for a catalog name: "Atta (Wheat Flour)" -> "atta", "wheat flour", ..."""
+    name = name.lower()
+    bases = {name}
+    match = re.match(r"^(.*?)\s*\((.*)\)\s*$", name)
+    if match:
+        bases.update({match.group(1), match.group(2), f"{match.group(1)} {match.group(2)}"})
+
+    variants = set()
+    for base in bases:
+        base = _normalize(base)
+        if not base:
+            continue
+        variants.add(base)
+        # Singular and plural forms ("tomatoes" <-> "tomato", "apple" <-> "apples")
+        if base.endswith("es"):
+            variants.add(base[:-2])
+        if base.endswith("s"):
+            variants.add(base[:-1])
+        else:
+            variants.update({base + "s", base + "es"})
+    return variants
+
+
+def build_name_index(item_lookup):
+    """
+    Build a map from every accepted spelling of an item name to its key in
+    item_lookup. Exact catalog names always take precedence over variants.
+    """
+    name_index = {}
+    for key in item_lookup:
+        for variant in _name_variants(key):
+            name_index.setdefault(variant, key)
+    for key in item_lookup:
+        name_index[_normalize(key)] = key
+    return name_index
+
+
+def _match_item(words, name_index):
+    """Return the item_lookup key for the longest catalog name at the start of words."""
+    for length in range(min(len(words), _MAX_NAME_WORDS), 0, -1):
+        key = name_index.get(" ".join(words[:length]))
+        if key is not None:
+            return key
+    return None
+
+
+def _mentions_item(words, name_index):
+    return any(_match_item(words[start:], name_index) for start in range(len(words)))
+
+
+def find_item_mentions(text, name_index):
+    """Return the item_lookup keys of all catalog items mentioned in text, in order."""
+    words = _normalize(text).split()
+    found = []
+    start = 0
+    while start < len(words):
+        for length in range(min(len(words) - start, _MAX_NAME_WORDS), 0, -1):
+            key = name_index.get(" ".join(words[start:start + length]))
+            if key is not None:
+                if key not in found:
+                    found.append(key)
+                start += length
+                break
+        else:
+            start += 1
+    return found
+
+
+def _resolve(quantity, unit, item):
+    """Price a requested quantity of a catalog item. Returns None if the units are incompatible."""
+    catalog_quantity = parse_unit(item.get("unit"))
+    if catalog_quantity is None:
+        return None
+    catalog_base, catalog_base_unit = catalog_quantity
+
+    if unit:
+        requested = to_base(quantity, unit)
+        if requested is None or requested[1] != catalog_base_unit:
+            return None
+        requested_base = requested[0]
+        unit = unit.lower()
+    elif catalog_base_unit in ("count", "packet"):
+        # "3 bread" or "6 eggs": a bare number counts the item's natural unit
+        requested_base = quantity
+        unit = catalog_base_unit + ("s" if catalog_base_unit == "packet" and quantity != 1 else "")
+    else:
+        # "2 rice" is ambiguous for weighed or measured items
+        return None
+
+    unit_price = Decimal(str(item["price"]))
+    amount = unit_price * requested_base / catalog_base
+    return LineItem(
+        name=item["name"],
+        quantity=quantity,
+        unit=unit,
+        unit_price=unit_price,
+        catalog_unit=item.get("unit") or "",
+        amount=amount.quantize(Decimal("0.01")),
+    )
+
+
+def resolve_item(name, quantity, unit, item_lookup, name_index) -> Optional[LineItem]:
+    """
+    Price an already extracted (name, quantity, unit) triple, e.g. one returned
+    by the LLM. Returns None if the item is unknown or the units are incompatible.
+    """
+    key = name.lower() if name.lower() in item_lookup else _match_item(_normalize(name).split(), name_index)
+    quantity = parse_number(str(quantity))
+    if key is None or quantity is None or quantity <= 0:
+        return None
+    unit = (unit or "").split()
+    return _resolve(quantity, unit[0] if unit else None, item_lookup[key])
+
+
+def _parse_fragment(fragment, item_lookup, name_index):
+    """Return a LineItem, "unresolved" if the fragment needs the LLM, or None if it is filler."""
+    found_quantity = False
+    for match in _QUANTITY_RE.finditer(fragment):
+        qty_text, unit = match.group("qty"), match.group("unit")
+        if qty_text.lower() in ("a", "an"):
+            # "a"/"an" only counts as a quantity in front of a unit ("a dozen")
+            if not unit:
+                continue
+            quantity = Decimal(1)
+        else:
+            quantity = parse_number(qty_text)
+        if quantity is None or quantity <= 0:
+            continue
+        found_quantity = True
+
+        words = _normalize(fragment[match.end():]).split()
+        key = _match_item(words, name_index)
+        if key is None:
+            continue
+        line_item = _resolve(quantity, unit, item_lookup[key])
+        if line_item is not None:
+            return line_item
+
+    if found_quantity or _mentions_item(_normalize(fragment).split(), name_index):
+        return "unresolved"
+    return None
+
+
+def parse_shopping_list(question, item_lookup, name_index=None) -> Optional[ParsedShoppingList]:
+    """
+    Parse a shopping list query without calling the LLM.
+
+    Returns None when the query does not look like a shopping list (budget
+    questions, comparisons). Otherwise returns the resolved line items and the
+    fragments that could not be resolved; an empty items list means nothing
+    could be priced locally.
+    """
+    if _NOT_A_LIST_RE.search(question):
+        return None
+    if name_index is None:
+        name_index = build_name_index(item_lookup)
+
+    parsed = ParsedShoppingList()
+    for fragment in _SPLIT_RE.split(question):
+        fragment = fragment.strip(" .?!:")
+        if not fragment:
+            continue
+        result = _parse_fragment(fragment, item_lookup, name_index)
+        if isinstance(result, LineItem):
+            parsed.items.append(result)
+        elif result == "unresolved":
+            parsed.unresolved.append(fragment)
+    return parsed
+
+
+def _short_unit(catalog_unit):
+    """Unit label for the price column: "1 kg bag" -> "kg bag", "200 gm" stays as is."""
+    return re.sub(r"^1\s+", "", catalog_unit)
+
+
+def format_shopping_list(parsed: ParsedShoppingList) -> str:
+    """Format resolved line items as a markdown table with calculations and total."""
+    lines = [
+        "| Item | Unit Price | Quantity | Amount |",
+        "|------|------------|----------|--------|",
+    ]
+    for item in parsed.items:
+        lines.append(
+            f"| {item.name} | {CURRENCY_SYMBOL}{format_number(item.unit_price)}/{_short_unit(item.catalog_unit)}"
+            f" | {format_number(item.quantity)} {item.unit} | {CURRENCY_SYMBOL}{format_number(item.amount)} |"
+        )
+
+    lines.append("")
+    lines.append("Calculations:")
+    for item in parsed.items:
+        lines.append(f"- {item.calculation}")
+
+    lines.append("")
+    label = "Subtotal" if parsed.unresolved else "Total"
+    lines.append(f"{label}: {CURRENCY_SYMBOL}{format_number(parsed.total)}")
+    return "\n".join(lines)
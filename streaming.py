@@ -0,0 +1,140 @@
+"""
+Streaming helpers for the Grocery Price Assistant
+
+deepseek-r1 emits a long <think>...</think> reasoning section before the real
+answer. ThinkStripper removes those sections incrementally from a stream of
+chunks (a streaming version of grocery_receipt.clean_response), so the answer
+can be shown as soon as its first token arrives. AnswerHold keeps the answer
+of a budgeted chain back until it is known not to have been cut short.
+"""
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _partial_tag_length(text, tag):
+    """Length of the longest suffix of text that is a proper prefix of tag."""
+    for length in range(min(len(text), len(tag) - 1), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class ThinkStripper:
+    """Incrementally remove <think> sections from streamed text."""
+
+    def __init__(self):
+        self.inside_think = False
+        self.started = False  # whether any visible text has been emitted yet
+        self._buffer = ""
+
+    def feed(self, chunk):
+        """Add a chunk of raw model output and return the newly visible text."""
+        self._buffer += chunk
+        visible = []
+        while self._buffer:
+            if self.inside_think:
+                end = self._buffer.find(THINK_CLOSE)
+                if end == -1:
+                    # Discard reasoning but keep a possible partial closing tag
+                    keep = _partial_tag_length(self._buffer, THINK_CLOSE)
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                self._buffer = self._buffer[end + len(THINK_CLOSE):]
+                self.inside_think = False
+            else:
+                start = self._buffer.find(THINK_OPEN)
+                if start == -1:
+                    # Hold back a possible partial opening tag until the next chunk
+                    keep = _partial_tag_length(self._buffer, THINK_OPEN)
+                    visible.append(self._buffer[:len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                visible.append(self._buffer[:start])
+                self._buffer = self._buffer[start + len(THINK_OPEN):]
+                self.inside_think = True
+        return self._emit("".join(visible))
+
+    def flush(self):
+        """Return any held-back text once the stream has ended."""
+        text = "" if self.inside_think else self._buffer
+        self._buffer = ""
+        return self._emit(text)
+
+    def _emit(self, text):
+        # Like clean_response, drop the whitespace left where reasoning was removed
+        if not self.started:
+            text = text.lstrip()
+            if text:
+                self.started = True
+        return text
+
+
+class AnswerHold:
+    """
+    Pass <think> reasoning through as it streams, but hold back the answer after it
+    until the generation has ended: a chain whose answer can still be cut short by
+    its generation budget must not show a truncated answer.
+    """
+
+    def __init__(self):
+        self.state = "start"  # "start", "think" (inside <think>) or "answer"
+        self._buffer = ""
+
+    def feed(self, chunk):
+        """Add a chunk of raw model output and return the reasoning that may be shown now."""
+        self._buffer += chunk
+        if self.state == "start":
+            text = self._buffer.lstrip()
+            if text.startswith(THINK_OPEN):
+                self.state = "think"
+            elif not THINK_OPEN.startswith(text):
+                self.state = "answer"
+        if self.state != "think":
+            return ""
+        end = self._buffer.find(THINK_CLOSE)
+        if end == -1:
+            # Keep a possible partial closing tag with the answer it may precede
+            keep = _partial_tag_length(self._buffer, THINK_CLOSE)
+        else:
+            keep = len(self._buffer) - end - len(THINK_CLOSE)
+            self.state = "answer"
+        shown = self._buffer[:len(self._buffer) - keep]
+        self._buffer = self._buffer[len(self._buffer) - keep:]
+        return shown
+
+    def release(self):
+        """Return the held-back answer once the generation ended within its budget."""
+        text = self._buffer
+        self._buffer = ""
+        return text
+
+
+def strip_think_stream(chunks):
+    """Yield the visible text of an iterable of raw model output chunks."""
+    stripper = ThinkStripper()
+    for chunk in chunks:
+        visible = stripper.feed(chunk)
+        if visible:
+            yield visible
+    tail = stripper.flush()
+    if tail:
+        yield tail
+
+
+async def astrip_think_stream(chunks):
+    """Async variant of strip_think_stream for async iterables of chunks."""
+    stripper = ThinkStripper()
+    async for chunk in chunks:
+        visible = stripper.feed(chunk)
+        if visible:
+            yield visible
+    tail = stripper.flush()
+    if tail:
+        yield tail
+
+
+async def aiter_chunks(chunks):
+    """Turn an ordinary iterable of chunks into an async iterable."""
+    for chunk in chunks:
+        yield chunk
@@ -0,0 +1,311 @@
+"""
+Tracing and metrics for the Grocery Price Assistant
+
+span(name, **attributes) times a pipeline stage (catalog load, classification,
+each chain call, fallback, receipt rendering). Spans opened inside another span
+become its children and the outermost one is a trace. Every span feeds the
+grocery_stage_seconds histogram. Only a TRACE_SAMPLE_RATE fraction of traces
+keep their span records and are written as JSON lines to TRACE_LOG_PATH, so
+unsampled queries pay for two clock reads and a histogram update.
+
+record_llm_reply() takes the token counts and load/prefill/decode durations
+Ollama returns with every reply, records them as metrics and attaches them to
+the span of the chain that made the call. LangChain calls reach it through
+chains.llm_metrics, so this module does not import LangChain.
+
+Metrics are exposed in the Prometheus text format: render_prometheus() for
+callers, a file rewritten at most every METRICS_FILE_INTERVAL seconds
+(METRICS_PATH) and an HTTP /metrics endpoint (METRICS_PORT).
+"""
+import atexit
+import contextvars
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import TRACE_SAMPLE_RATE, TRACE_LOG_PATH, METRICS_PATH, METRICS_PORT, METRICS_FILE_INTERVAL, SERVER_HOST
+
+# Histogram buckets in seconds, from sub-millisecond local work to minutes of reasoning
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+METRIC_HELP = {
+    "grocery_stage_seconds": ("histogram", "Time spent in each pipeline stage"),
+    "grocery_stage_errors_total": ("counter", "Pipeline stages that raised an exception"),
+    "grocery_llm_requests_total": ("counter", "LLM calls answered by Ollama"),
+    "grocery_llm_prompt_tokens_total": ("counter", "Prompt tokens evaluated by Ollama"),
+    "grocery_llm_completion_tokens_total": ("counter", "Tokens generated by Ollama, by model and chain"),
+    "grocery_llm_reasoning_tokens_total": ("counter", "Generated tokens inside <think> sections (estimated)"),
+    "grocery_llm_load_seconds": ("histogram", "Model load time reported by Ollama"),
+    "grocery_llm_prefill_seconds": ("histogram", "Prompt evaluation (prefill) time reported by Ollama"),
+    "grocery_llm_decode_seconds": ("histogram", "Generation (decode) time reported by Ollama"),
+    "grocery_http_requests_total": ("counter", "HTTP requests served, by path and status"),
+    "grocery_http_request_seconds": ("histogram", "HTTP request duration, by path"),
+    "grocery_backend_requests_total": ("counter", "Calls sent to each Ollama backend, by status"),
+    "grocery_backend_seconds": ("histogram", "Successful call duration on each Ollama backend"),
+    "grocery_cascade_answers_total": ("counter", "Cascaded chain calls, by chain and the tier that answered"),
+    "grocery_budget_overruns_total": ("counter", "Chain outputs replaced by a local answer after exceeding their budget"),
+}
+
+_THINK_RE = re.compile(r"<think>.*?(?:</think>|$)", re.DOTALL)
+_span_ids = itertools.count(1)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Metrics:
+    """Thread-safe counters and histograms keyed by metric name and label values."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per-bucket counts, then sum and count
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        """Counters and histogram sums/counts as a JSON-friendly dict."""
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = [{"name": name, "labels": dict(labels), "sum": h[-2], "count": h[-1]}
+                          for (name, labels), h in sorted(self._histograms.items())]
+        return {"counters": counters, "histograms": histograms}
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(h)) for key, h in self._histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram[-2]}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+class Span:
+    """One timed stage; attributes set on unsampled spans are discarded with them."""
+
+    __slots__ = ("name", "trace", "span_id", "parent_id", "start", "attributes")
+
+    def __init__(self, name, trace, parent_id, attributes):
+        self.name = name
+        self.trace = trace
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class _Trace:
+    __slots__ = ("trace_id", "sampled", "records")
+
+    def __init__(self, sampled):
+        self.trace_id = f"{random.getrandbits(64):016x}"
+        self.sampled = sampled
+        self.records = []
+
+
+class Telemetry:
+    """Span tracer plus the metrics registry it feeds, with JSON log and Prometheus exports."""
+
+    def __init__(self, sample_rate=TRACE_SAMPLE_RATE, log_path=TRACE_LOG_PATH, metrics_path=METRICS_PATH,
+                 metrics_file_interval=METRICS_FILE_INTERVAL):
+        self.metrics = Metrics()
+        self.sample_rate = sample_rate
+        self.log_path = log_path
+        self.metrics_path = metrics_path
+        self.metrics_file_interval = metrics_file_interval
+        self._last_metrics_write = 0.0
+        self._log_lock = threading.Lock()
+        self._server = None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time a stage; nested spans become children of the enclosing one."""
+        parent = _current_span.get()
+        trace = parent.trace if parent is not None else _Trace(random.random() < self.sample_rate)
+        current = Span(name, trace, parent.span_id if parent is not None else None, attributes)
+        token = _current_span.set(current)
+        start = time.perf_counter()
+        try:
+            yield current
+        except Exception as e:
+            current.attributes["error"] = f"{type(e).__name__}: {e}"
+            self.metrics.inc("grocery_stage_errors_total", stage=name)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # A streaming generator resumed in another context: restore the parent directly
+                _current_span.set(parent)
+            self.metrics.observe("grocery_stage_seconds", duration, stage=name)
+            if trace.sampled:
+                trace.records.append({
+                    "ts": datetime.fromtimestamp(current.start).isoformat(timespec="milliseconds"),
+                    "trace_id": trace.trace_id,
+                    "span_id": current.span_id,
+                    "parent_id": current.parent_id,
+                    "name": name,
+                    "duration_ms": round(duration * 1000, 3),
+                    **current.attributes,
+                })
+            if parent is None:
+                self._finish_trace(trace)
+
+    def current_span(self):
+        return _current_span.get()
+
+    def _finish_trace(self, trace):
+        if trace.sampled and self.log_path:
+            lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in trace.records)
+            with self._log_lock:
+                if self.log_path == "-":
+                    sys.stdout.write(lines)
+                else:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(lines)
+        if self.metrics_path and time.monotonic() - self._last_metrics_write >= self.metrics_file_interval:
+            self.write_metrics()
+
+    def write_metrics(self, path=None):
+        """Atomically rewrite the Prometheus text file (e.g. for node_exporter's textfile collector)."""
+        path = path or self.metrics_path
+        if not path:
+            return
+        self._last_metrics_write = time.monotonic()
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.metrics.render_prometheus())
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not write metrics to {path}: {str(e)}")
+
+    def render_prometheus(self):
+        return self.metrics.render_prometheus()
+
+    def record_llm_reply(self, info, text):
+        """Record the token counts and durations in one Ollama reply (info) whose text is text."""
+        metrics = self.metrics
+        model = info.get("model", "unknown")
+        prompt_tokens = info.get("prompt_eval_count") or 0
+        completion_tokens = info.get("eval_count") or 0
+        # Ollama does not count reasoning tokens separately; split by the share of <think> text
+        reasoning_chars = sum(len(match) for match in _THINK_RE.findall(text))
+        reasoning_tokens = round(completion_tokens * reasoning_chars / len(text)) if text else 0
+
+        current = self.current_span()
+        # The chain span the call belongs to, so token use can be compared per query type
+        chain = current.name if current is not None and current.name.startswith("chain.") else "other"
+        metrics.inc("grocery_llm_requests_total", model=model)
+        metrics.inc("grocery_llm_prompt_tokens_total", prompt_tokens, model=model)
+        metrics.inc("grocery_llm_completion_tokens_total", completion_tokens, model=model, chain=chain)
+        metrics.inc("grocery_llm_reasoning_tokens_total", reasoning_tokens, model=model, chain=chain)
+        seconds = {}
+        for key, name in (("load_duration", "load"), ("prompt_eval_duration", "prefill"),
+                          ("eval_duration", "decode")):
+            if info.get(key) is not None:
+                seconds[name] = info[key] / 1e9
+                metrics.observe(f"grocery_llm_{name}_seconds", seconds[name], model=model)
+
+        if current is not None:
+            current.set(model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                        reasoning_tokens=reasoning_tokens,
+                        **{f"{name}_ms": round(value * 1000, 3) for name, value in seconds.items()})
+
+    def start_metrics_server(self, port=METRICS_PORT, host=SERVER_HOST):
+        """Serve /metrics (Prometheus text) and /metrics.json from a background thread; idempotent."""
+        if self._server is not None or not port:
+            return self._server
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body, content_type = json.dumps(telemetry.metrics.snapshot()), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, content_type = telemetry.render_prometheus(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            print(f"Could not start the metrics endpoint on port {port}: {str(e)}")
+            return None
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+        return self._server
+
+
+# Process-wide instance used by the app, db loading and receipt rendering
+telemetry = Telemetry()
+span = telemetry.span
+atexit.register(telemetry.write_metrics)
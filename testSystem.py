@@ -1,57 +1,96 @@
+import re
 import sys
+import time
+import argparse
 import datetime
 from main import create_app
+from config import PIPELINE_MODE
 
-def run_tests():
+# Test prompts with their query type and what a correct answer must contain:
+# ₹ amounts and numbers are matched numerically, anything else as a case-insensitive
+# substring; an empty list means the prompt is open-ended and not checked
+TEST_CASES = [
+    # Basic price queries
+    ("What is the price of milk?", "price", ["₹65"]),  # ₹65 per liter
+    ("How much do tomatoes cost?", "price", ["₹40"]),  # ₹40 per kg
+    
+    # Simple quantity calculations
+    ("Calculate price for 2 liters of milk", "shopping_list", ["₹130"]),
+    ("I want to buy 500g rice", "shopping_list", ["₹37.5"]),  # half of ₹75
+    
+    # Multiple items
+    ("Calculate 2kg rice and 3 packets of bread", "shopping_list", ["₹270"]),  # ₹150 + ₹120
+    ("Price for 300g paneer, 400g curd, and 50g green chillies", "shopping_list", ["₹163.5"]),  # ₹120 + ₹36 + ₹7.5
+    
+    # Unit conversions
+    ("I want to buy 500ml cooking oil and 3.5L milk", "shopping_list", ["₹317.5"]),  # ₹90 + ₹227.5
+    ("Price for 0.25kg sugar and 1.5 liter cooking oil", "shopping_list", ["₹281.25"]),  # ₹11.25 + ₹270
+    
+    # Comparisons
+    ("Which is more expensive per kg, apples or tomatoes?", "comparison", ["Apples", "₹180"]),  # vs ₹40
+    ("Compare the prices of rice and atta per kg", "comparison", ["Rice", "₹75"]),  # vs ₹60
+    
+    # Budget calculations
+    ("If I have ₹500, how many kg of potatoes can I buy?", "budget", ["16.67"]),  # ₹500/₹30
+    ("With ₹300, how many packets of bread and liters of milk can I buy?", "budget", []),  # open-ended
+    
+    # Mixed formulations
+    ("Price for 100g paneer and 200g green chillies", "shopping_list", ["₹70"]),  # ₹40 + ₹30
+    ("I need 250 grams of sugar and three dozen bananas", "shopping_list", ["₹191.25"]),  # ₹11.25 + ₹180
+    
+    # Edge cases
+    ("What items can I buy in the dairy category?", "category", ["Milk", "Eggs", "Paneer", "Curd"]),
+    ("What's the most expensive item in your inventory?", "superlative", ["Chicken Breast", "₹320"]),
+]
+
+TEST_PROMPTS = [prompt for prompt, _, _ in TEST_CASES]
+EXPECTED = {prompt: expected for prompt, _, expected in TEST_CASES}
+
+_RUPEE_AMOUNT_RE = re.compile(r"₹\s*(\d[\d,]*(?:\.\d+)?)")
+_NUMBER_RE = re.compile(r"(?<![\w.])(\d[\d,]*(?:\.\d+)?)")
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+def check_answer(answer, expected):
+    """
+    Return the expected values missing from an answer (an empty list means it passed).
+    Reasoning sections are ignored; amounts match within 0.01 whatever their formatting.
+    """
+    visible = _THINK_RE.sub("", answer)
+    rupees = [float(value.replace(",", "")) for value in _RUPEE_AMOUNT_RE.findall(visible)]
+    numbers = [float(value.replace(",", "")) for value in _NUMBER_RE.findall(visible)]
+    missing = []
+    for value in expected:
+        amount = value.lstrip("₹")
+        if re.fullmatch(r"\d+(?:\.\d+)?", amount):
+            candidates = rupees if value.startswith("₹") else numbers
+            found = any(abs(candidate - float(amount)) <= 0.01 for candidate in candidates)
+        else:
+            found = value.lower() in visible.lower()
+        if not found:
+            missing.append(value)
+    return missing
+
+def run_tests(pipeline=PIPELINE_MODE, concurrency=None):
     """
     Run multiple test queries through the grocery price assistant
     and save results to a file for analysis.
+    
+    Pass a different pipeline ("two_stage" or "single_pass") to A/B the
+    latency and accuracy of the answering pipelines. With concurrency set,
+    the prompts are also answered as one concurrent batch and the wall-clock
+    speedup over the sequential run is reported.
     """
-    # Initialize the application
+    # Initialize the application (without the response cache, so every run hits the model)
     print("Initializing the Grocery Price Assistant for testing...")
-    get_answer = create_app()
-    
-    # Define test prompts with expected answers
-    test_prompts = [
-        # Basic price queries
-        "What is the price of milk?",  # Expected: ₹65 per liter
-        "How much do tomatoes cost?",  # Expected: ₹40 per kg
-        
-        # Simple quantity calculations
-        "Calculate price for 2 liters of milk",  # Expected: ₹130
-        "I want to buy 500g rice",  # Expected: ₹37.5 (half of ₹75)
-        
-        # Multiple items
-        "Calculate 2kg rice and 3 packets of bread",  # Expected: ₹150 (rice) + ₹120 (bread) = ₹270
-        "Price for 300g paneer, 400g curd, and 50g green chillies",  # Expected: ₹120 + ₹36 + ₹7.5 = ₹163.5
-        
-        # Unit conversions
-        "I want to buy 500ml cooking oil and 3.5L milk",  # Expected: ₹90 + ₹227.5 = ₹317.5
-        "Price for 0.25kg sugar and 1.5 liter cooking oil",  # Expected: ₹11.25 + ₹270 = ₹281.25
-        
-        # Comparisons
-        "Which is more expensive per kg, apples or tomatoes?",  # Expected: Apples (₹180 vs ₹40)
-        "Compare the prices of rice and atta per kg",  # Expected: Rice is more expensive (₹75 vs ₹60)
-        
-        # Budget calculations
-        "If I have ₹500, how many kg of potatoes can I buy?",  # Expected: 16.67 kg (₹500/₹30)
-        "With ₹300, how many packets of bread and liters of milk can I buy?",  # This is open-ended
-        
-        # Mixed formulations
-        "Price for 100g paneer and 200g green chillies",  # Expected: ₹40 + ₹30 = ₹70
-        "I need 250 grams of sugar and three dozen bananas",  # Expected: ₹11.25 + ₹180 = ₹191.25
-        
-        # Edge cases
-        "What items can I buy in the dairy category?",  # Should list dairy items
-        "What's the most expensive item in your inventory?",  # Should identify Chicken Breast at ₹320/kg
-    ]
+    get_answer = create_app(pipeline=pipeline, use_cache=False)
     
     # Run tests and collect results
     results = []
     
-    print(f"Running {len(test_prompts)} test queries...")
-    for i, prompt in enumerate(test_prompts, 1):
-        print(f"Testing prompt {i}/{len(test_prompts)}: {prompt}")
+    print(f"Running {len(TEST_PROMPTS)} test queries...")
+    for i, prompt in enumerate(TEST_PROMPTS, 1):
+        print(f"Testing prompt {i}/{len(TEST_PROMPTS)}: {prompt}")
+        start = time.perf_counter()
         try:
             # Get response from the application
             response = get_answer(prompt)
@@ -60,36 +99,142 @@ def run_tests():
             results.append({
                 "prompt": prompt,
                 "response": response,
-                "status": "Success"
+                "status": "Success",
+                "missing": check_answer(response, EXPECTED[prompt]),
+                "seconds": time.perf_counter() - start
             })
         except Exception as e:
             # Log any errors
             results.append({
                 "prompt": prompt,
                 "response": f"ERROR: {str(e)}",
-                "status": "Error"
+                "status": "Error",
+                "missing": EXPECTED[prompt],
+                "seconds": time.perf_counter() - start
             })
             print(f"Error processing prompt: {str(e)}")
+    sequential_seconds = sum(r['seconds'] for r in results)
+    
+    concurrent_seconds = None
+    if concurrency:
+        print(f"Running {len(TEST_PROMPTS)} test queries concurrently (max {concurrency} at a time)...")
+        start = time.perf_counter()
+        answers = get_answer.get_answers(TEST_PROMPTS, max_concurrency=concurrency)
+        concurrent_seconds = time.perf_counter() - start
+        failed = sum(1 for answer in answers if isinstance(answer, Exception))
+        print(f"Sequential: {sequential_seconds:.2f}s, concurrent: {concurrent_seconds:.2f}s "
+              f"({sequential_seconds / concurrent_seconds:.2f}x speedup, {failed} errors)")
     
     # Save results to file
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"grocery_test_results_{timestamp}.txt"
+    filename = f"grocery_test_results_{pipeline}_{timestamp}.txt"
     
     with open(filename, "w") as f:
         f.write(f"Grocery Price Assistant Test Results\n")
         f.write(f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Total prompts tested: {len(test_prompts)}\n")
+        f.write(f"Pipeline: {pipeline}\n")
+        f.write(f"Total prompts tested: {len(TEST_PROMPTS)}\n")
         f.write(f"Success: {sum(1 for r in results if r['status'] == 'Success')}\n")
-        f.write(f"Errors: {sum(1 for r in results if r['status'] == 'Error')}\n\n")
+        f.write(f"Errors: {sum(1 for r in results if r['status'] == 'Error')}\n")
+        f.write(f"Expected answers found: {sum(1 for r in results if not r['missing'])}/{len(results)}\n")
+        f.write(f"Total time: {sequential_seconds:.2f}s (mean {sequential_seconds / len(results):.2f}s per prompt)\n")
+        if concurrent_seconds is not None:
+            f.write(f"Concurrent time (max {concurrency} at a time): {concurrent_seconds:.2f}s "
+                    f"({sequential_seconds / concurrent_seconds:.2f}x speedup)\n")
+        f.write("\n")
         
         for i, result in enumerate(results, 1):
-            f.write(f"Test #{i} - {result['status']}\n")
+            f.write(f"Test #{i} - {result['status']} ({result['seconds']:.2f}s)\n")
             f.write(f"Prompt: {result['prompt']}\n")
+            if result['missing']:
+                f.write(f"Check: FAIL (missing {', '.join(result['missing'])})\n")
+            else:
+                f.write("Check: PASS\n")
             f.write(f"Response:\n{result['response']}\n")
             f.write("-" * 80 + "\n\n")
     
     print(f"Test results saved to {filename}")
     return results
 
+def run_refresh_test():
+    """
+    Check live catalog refresh against the local database: change the price of
+    milk, sync incrementally and verify the next answer (and the response cache)
+    reflects the new price without restarting the app. The price is restored
+    afterwards. Requires db_setup.py to have been run.
+    """
+    from db import connection
+    
+    question = "Calculate price for 2 liters of milk"
+    get_answer = create_app(refresh_mode="poll")
+    
+    def set_milk_price(price):
+        with connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("UPDATE grocery_items SET price = %s WHERE name = 'Milk';", (price,))
+    
+    checks = []
+    try:
+        checks.append(("initial answer uses ₹65/liter", "₹130" in get_answer(question)))
+        set_milk_price(70)
+        checks.append(("incremental sync picks up the change", get_answer.refresh_catalog()))
+        checks.append(("answer after sync uses ₹70/liter", "₹140" in get_answer(question)))
+    finally:
+        set_milk_price(65)
+        get_answer.refresh_catalog()
+    checks.append(("answer after restoring uses ₹65/liter", "₹130" in get_answer(question)))
+    get_answer.catalog_sync.stop()
+    
+    for name, passed in checks:
+        print(f"{'PASS' if passed else 'FAIL'}: {name}")
+    return all(passed for _, passed in checks)
+
+# Small-model answers the cascade must accept (no problems) or escalate, with the question they answer
+CASCADE_CASES = [
+    ("If I have ₹500, how many kg of potatoes can I buy?",
+     "Potatoes cost ₹30 per kg, so with ₹500 you can buy 16.67 kg.", True),
+    ("If I have ₹500, how many kg of potatoes can I buy?",
+     "Potatoes cost ₹30 per kg. With ₹500 you can buy 16 kg for ₹480 and have ₹20 left.", True),
+    ("If I have ₹500, how many kg of potatoes can I buy?",
+     "Potatoes cost ₹35 per kg, so with ₹500 you can buy 14.29 kg.", False),  # wrong price
+    ("If I have ₹500, how many kg of potatoes can I buy?",
+     "Potatoes cost ₹30 per kg. With ₹500 you can buy 16 kg for ₹490.", False),  # wrong arithmetic
+    ("What is the price of milk?", "Milk costs ₹65 per 1 liter.", True),
+    ("What is the price of milk?", "Milk costs ₹70 per 1 liter.", False),
+]
+
+def run_cascade_test():
+    """
+    Check the model cascade's validation of small-model answers on the sample
+    catalog: correct answers, including budget calculations quoting the amount
+    the question gives, are accepted and wrong ones escalated. Needs no database
+    or model.
+    """
+    from catalog_sync import CatalogState
+    from db_setup import sample_catalog
+    from model_cascade import validate_text
+    
+    state = CatalogState(sample_catalog())
+    results = []
+    for question, answer, accepted in CASCADE_CASES:
+        problems = validate_text(answer, "unknown", question, state)
+        passed = not problems if accepted else bool(problems)
+        results.append(passed)
+        print(f"{'PASS' if passed else 'FAIL'}: {answer} ({'; '.join(problems) or 'accepted'})")
+    return all(results)
+
 if __name__ == "__main__":
-    run_tests()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the Grocery Price Assistant test prompts")
+    parser.add_argument("pipeline", nargs="?", default=PIPELINE_MODE, help="two_stage or single_pass")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Also run the prompts as a concurrent batch and report the speedup")
+    parser.add_argument("--refresh-test", action="store_true",
+                        help="Only check live catalog refresh against the local database")
+    parser.add_argument("--cascade-test", action="store_true",
+                        help="Only check the model cascade's answer validation on the sample catalog")
+    args = parser.parse_args()
+    if args.refresh_test:
+        sys.exit(0 if run_refresh_test() else 1)
+    if args.cascade_test:
+        sys.exit(0 if run_cascade_test() else 1)
+    run_tests(args.pipeline, args.concurrency)
\ No newline at end of file
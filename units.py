@@ -0,0 +1,149 @@
+"""
+Unit parsing and conversion helpers for the Grocery Price Assistant
+
+Catalog units ("1 kg bag", "200 gm", "12 count") and quantities mentioned in
+user queries ("500g", "3.5L", "three dozen") are both reduced to an amount of
+one of the base units below, so prices can be calculated locally instead of
+asking the LLM to do the arithmetic:
+
+- g:      weight (g, kg)
+- ml:     volume (ml, liter)
+- count:  loose items (count, pieces, dozen)
+- packet: packaged items (packet, pack)
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+# Every accepted unit spelling mapped to (base unit, multiplier)
+UNIT_ALIASES = {
+    # Weight
+    "g": ("g", Decimal(1)),
+    "gm": ("g", Decimal(1)),
+    "gms": ("g", Decimal(1)),
+    "gram": ("g", Decimal(1)),
+    "grams": ("g", Decimal(1)),
+    "gramme": ("g", Decimal(1)),
+    "grammes": ("g", Decimal(1)),
+    "kg": ("g", Decimal(1000)),
+    "kgs": ("g", Decimal(1000)),
+    "kilo": ("g", Decimal(1000)),
+    "kilos": ("g", Decimal(1000)),
+    "kilogram": ("g", Decimal(1000)),
+    "kilograms": ("g", Decimal(1000)),
+    "kilogramme": ("g", Decimal(1000)),
+    "kilogrammes": ("g", Decimal(1000)),
+    # Volume
+    "ml": ("ml", Decimal(1)),
+    "milliliter": ("ml", Decimal(1)),
+    "milliliters": ("ml", Decimal(1)),
+    "millilitre": ("ml", Decimal(1)),
+    "millilitres": ("ml", Decimal(1)),
+    "l": ("ml", Decimal(1000)),
+    "ltr": ("ml", Decimal(1000)),
+    "ltrs": ("ml", Decimal(1000)),
+    "liter": ("ml", Decimal(1000)),
+    "liters": ("ml", Decimal(1000)),
+    "litre": ("ml", Decimal(1000)),
+    "litres": ("ml", Decimal(1000)),
+    # Loose items
+    "count": ("count", Decimal(1)),
+    "piece": ("count", Decimal(1)),
+    "pieces": ("count", Decimal(1)),
+    "pc": ("count", Decimal(1)),
+    "pcs": ("count", Decimal(1)),
+    "nos": ("count", Decimal(1)),
+    "dozen": ("count", Decimal(12)),
+    "dozens": ("count", Decimal(12)),
+    # Packaged items
+    "packet": ("packet", Decimal(1)),
+    "packets": ("packet", Decimal(1)),
+    "pack": ("packet", Decimal(1)),
+    "packs": ("packet", Decimal(1)),
+    "pkt": ("packet", Decimal(1)),
+    "pkts": ("packet", Decimal(1)),
+}
+
+# Singular display name for each base unit
+BASE_UNIT_NAMES = {
+    "g": "g",
+    "ml": "ml",
+    "count": "count",
+    "packet": "packet",
+}
+
+NUMBER_WORDS = {
+    "half": Decimal("0.5"),
+    "one": Decimal(1),
+    "two": Decimal(2),
+    "three": Decimal(3),
+    "four": Decimal(4),
+    "five": Decimal(5),
+    "six": Decimal(6),
+    "seven": Decimal(7),
+    "eight": Decimal(8),
+    "nine": Decimal(9),
+    "ten": Decimal(10),
+    "eleven": Decimal(11),
+    "twelve": Decimal(12),
+    "fifteen": Decimal(15),
+    "twenty": Decimal(20),
+}
+
+# Longest spellings first so "kg" wins over "g" and "liters" over "l"
+UNIT_PATTERN = "|".join(sorted((re.escape(u) for u in UNIT_ALIASES), key=len, reverse=True))
+NUMBER_PATTERN = r"\d+(?:\.\d+)?|\d+/\d+|\.\d+|" + "|".join(NUMBER_WORDS)
+
+_CATALOG_UNIT_RE = re.compile(
+    rf"^\s*(?P<qty>{NUMBER_PATTERN})?\s*(?P<unit>{UNIT_PATTERN})\b", re.IGNORECASE
+)
+
+
+def parse_number(text):
+    """Parse a digit, fraction or number-word quantity. Returns None if invalid."""
+    text = text.strip().lower()
+    if text in NUMBER_WORDS:
+        return NUMBER_WORDS[text]
+    try:
+        if "/" in text:
+            numerator, denominator = text.split("/", 1)
+            return Decimal(numerator) / Decimal(denominator)
+        return Decimal(text)
+    except (InvalidOperation, ZeroDivisionError):
+        return None
+
+
+def to_base(quantity, unit):
+    """
+    Convert a quantity in the given unit to its base unit.
+    Returns a (base_quantity, base_unit) tuple, or None if the unit is unknown.
+    """
+    alias = UNIT_ALIASES.get(unit.strip().lower())
+    if alias is None:
+        return None
+    base_unit, multiplier = alias
+    return Decimal(quantity) * multiplier, base_unit
+
+
+def parse_unit(unit_text):
+    """
+    Parse a catalog unit string such as "1 kg bag", "200 gm" or "12 count".
+    Returns a (base_quantity, base_unit) tuple, or None if it cannot be parsed.
+    """
+    if not unit_text:
+        return None
+    match = _CATALOG_UNIT_RE.match(unit_text)
+    if not match:
+        return None
+    quantity = parse_number(match.group("qty")) if match.group("qty") else Decimal(1)
+    if quantity is None or quantity <= 0:
+        return None
+    return to_base(quantity, match.group("unit"))
+
+
+def format_number(value):
+    """Format a Decimal without trailing zeros: 270.00 -> "270", 163.50 -> "163.5"."""
+    value = Decimal(value).quantize(Decimal("0.01"))
+    text = format(value, "f")
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return text